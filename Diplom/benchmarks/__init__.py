@@ -0,0 +1,53 @@
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(settings_module='myproject.settings'):
+    """Настройка Django для запуска бенчмарка как скрипта (python -m benchmarks.<name>)."""
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+
+    import django
+    django.setup()
+
+
+def create_test_database():
+    """Отдельная тестовая БД, чтобы бенчмарк не трогал db.sqlite3."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    return lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def shared_cache():
+    """
+    Кэш Django, общий для процессов. Если в CACHES уже настроен такой
+    (Redis), используется он, иначе - файловый кэш во временном каталоге
+    вместо LocMemCache: с ним механизмы, рассчитанные на общий кэш, отключены.
+    """
+    from django.test.utils import override_settings
+    from core.checks import cache_is_shared
+
+    if cache_is_shared():
+        yield
+        return
+    location = tempfile.mkdtemp()
+    try:
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}):
+            yield
+    finally:
+        shutil.rmtree(location)
@@ -0,0 +1,214 @@
+"""
+Нагрузочный бенчмарк: синхронные view под WSGI против async view под ASGI.
+
+Запросы подаются прямо в обработчики Django в одном процессе, без сети:
+- wsgi       - WSGIHandler в пуле из --threads потоков (как потоковый воркер gunicorn);
+- asgi_sync  - ASGIHandler с синхронными DRF view (поток на запрос);
+- asgi_async - ASGIHandler с view из core.async_views.
+Одновременно работает --concurrency клиентов, каждый шлет запросы подряд.
+Для каждого endpoint выводятся пропускная способность и задержки p50/p99.
+
+Ограничения частоты запросов на время замера отключены. Цифры
+относительные: async ORM Django по-прежнему выполняет запросы к БД в
+пуле потоков, выигрыш async view - в том, что ожидание не занимает поток.
+
+Запуск (из каталога Diplom):
+    python -m benchmarks.bench_asgi --requests 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from . import setup_django, create_test_database
+
+ENDPOINTS = {
+    'products': 'products/',
+    'basket': 'basket/',
+    'orders': 'orders/',
+}
+
+
+def build_urlpatterns():
+    from django.urls import path
+
+    from core import async_views
+    from core.views import BasketView, OrderListView, ProductListView
+
+    return [
+        path('sync/products/', ProductListView.as_view()),
+        path('sync/basket/', BasketView.as_view()),
+        path('sync/orders/', OrderListView.as_view()),
+        path('async/products/', async_views.product_list),
+        path('async/basket/', async_views.basket),
+        path('async/orders/', async_views.order_list),
+    ]
+
+
+def seed(products):
+    from rest_framework.authtoken.models import Token
+
+    from core.import_service import CatalogImportService
+    from core.models import Order, OrderItem, ProductInfo, User
+
+    shop_user = User.objects.create_user(email='bench-shop@example.com', password='BenchPass123', type='shop')
+    CatalogImportService.import_shop_data(shop_user, {
+        'shop': 'Бенчмарк',
+        'categories': [{'id': 1, 'name': 'Смартфоны'}],
+        'goods': [
+            {'id': i, 'category': 1, 'name': f'Товар {i}', 'model': f'model-{i}',
+             'price': 100 + i, 'price_rrc': 120 + i, 'quantity': 10, 'parameters': {'Цвет': 'черный'}}
+            for i in range(1, products + 1)
+        ],
+    })
+
+    buyer = User.objects.create_user(email='bench@example.com', password='BenchPass123', is_active=True)
+    infos = list(ProductInfo.objects.all()[:5])
+    for status in ('basket', 'new', 'confirmed', 'delivered'):
+        order = Order.objects.create(user=buyer, status=status)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_id=info.product_id, shop_id=info.shop_id, quantity=2) for info in infos
+        )
+    return Token.objects.create(user=buyer).key
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def drive(call, requests, concurrency):
+    """concurrency клиентов делят между собой requests запросов."""
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            status = await call()
+            latencies.append(time.perf_counter() - start)
+            assert status == 200, status
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start), latencies
+
+
+def wsgi_caller(path, token, pool):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+
+    def request():
+        environ = {'PATH_INFO': path, 'HTTP_AUTHORIZATION': f'Token {token}', 'wsgi.input': BytesIO()}
+        setup_testing_defaults(environ)
+        environ['SERVER_NAME'] = environ['HTTP_HOST'] = 'testserver'
+        statuses = []
+        body = handler(environ, lambda status, headers: statuses.append(status))
+        b''.join(body)
+        body.close()
+        return int(statuses[0].split()[0])
+
+    async def call():
+        return await asyncio.get_running_loop().run_in_executor(pool, request)
+
+    return call
+
+
+def asgi_caller(path, token):
+    from django.core.handlers.asgi import ASGIHandler
+
+    handler = ASGIHandler()
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', b'testserver'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+
+    async def call():
+        messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Клиент не отключается: ждем, пока обработчик не отменит ожидание
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        await handler(dict(scope), receive, send)
+        return statuses[0]
+
+    return call
+
+
+async def run_async(requests, concurrency, threads, token):
+    results = {}
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for name, endpoint in ENDPOINTS.items():
+            callers = {
+                'wsgi': wsgi_caller(f'/sync/{endpoint}', token, pool),
+                'asgi_sync': asgi_caller(f'/sync/{endpoint}', token),
+                'asgi_async': asgi_caller(f'/async/{endpoint}', token),
+            }
+            for mode, call in callers.items():
+                # Прогрев: кэш каталога, кэш токенов, соединения с БД
+                await drive(call, concurrency, concurrency)
+                results[name, mode] = await drive(call, requests, concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=16, help='Потоков WSGI-воркера')
+    parser.add_argument('--products', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from rest_framework.settings import api_settings
+
+    # Маршруты бенчмарка - в этом модуле
+    global urlpatterns
+    urlpatterns = build_urlpatterns()
+    settings.ROOT_URLCONF = __name__
+    # Общий словарь ставок всех ограничителей DRF; None - без ограничения
+    api_settings.DEFAULT_THROTTLE_RATES.update(anon=None, user=None, basket=None)
+
+    destroy_test_db = create_test_database()
+    try:
+        token = seed(args.products)
+        results = asyncio.run(run_async(args.requests, args.concurrency, args.threads, token))
+    finally:
+        destroy_test_db()
+
+    print(f"Запросов: {args.requests}, клиентов: {args.concurrency}, потоков WSGI: {args.threads}")
+    for (name, mode), (throughput, latencies) in results.items():
+        print(
+            f"  {name:9} {mode:11} {throughput:8.0f} запр/с"
+            f"  p50 {statistics.median(latencies) * 1000:7.1f} мс"
+            f"  p99 {percentile(latencies, 0.99) * 1000:7.1f} мс"
+        )
+
+
+urlpatterns = []
+
+if __name__ == '__main__':
+    main()
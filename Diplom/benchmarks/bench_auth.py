@@ -0,0 +1,99 @@
+"""
+Бенчмарк аутентификации: стоимость проверки учетных данных на один запрос.
+
+Сравнивает стандартные TokenAuthentication/BasicAuthentication DRF с
+кэширующими классами из core.authentication. Кэш учетных данных работает
+только с общим для процессов кэшем Django, поэтому кэширующие сценарии
+выполняются с ним (Redis из CACHES или временный файловый кэш). Если кэш
+все же не сработал, бенчмарк завершается ошибкой, а не печатает цифры.
+
+Запуск (из каталога Diplom):
+    python -m benchmarks.bench_auth --requests 2000
+"""
+import argparse
+import base64
+import time
+
+from . import setup_django, create_test_database, shared_cache
+
+
+def measure(authentication, request_factory, requests, warm=False):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    if warm:
+        # Первая проверка заполняет кэш; меряем установившийся режим
+        authentication.authenticate(request_factory())
+        with CaptureQueriesContext(connection) as queries:
+            authentication.authenticate(request_factory())
+        if queries:
+            raise SystemExit(
+                f'{type(authentication).__name__}: кэш учетных данных не сработал '
+                f'({len(queries)} запросов к БД после прогрева)'
+            )
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        for _ in range(requests):
+            user, _ = authentication.authenticate(request_factory())
+        elapsed = time.perf_counter() - start
+    assert user is not None
+    return elapsed / requests, len(queries) / requests
+
+
+def run(requests, basic_requests, basic_cached_requests):
+    from django.test import RequestFactory
+    from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+    from rest_framework.authtoken.models import Token
+
+    from core.authentication import CachedBasicAuthentication, CachedTokenAuthentication, credential_cache
+    from core.models import User
+
+    user = User.objects.create_user(email='bench@example.com', password='BenchPass123', is_active=True)
+    token = Token.objects.create(user=user)
+    factory = RequestFactory()
+    basic = base64.b64encode(b'bench@example.com:BenchPass123').decode()
+
+    def token_request():
+        return factory.get('/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def basic_request():
+        return factory.get('/', HTTP_AUTHORIZATION=f'Basic {basic}')
+
+    results = {
+        'token': measure(TokenAuthentication(), token_request, requests),
+        # PBKDF2 медленный, поэтому запросов меньше
+        'basic': measure(BasicAuthentication(), basic_request, basic_requests),
+    }
+    with shared_cache():
+        if not credential_cache.enabled():
+            raise SystemExit('Кэш учетных данных отключен (AUTH_CACHE_TTL = 0) - сравнивать нечего')
+        credential_cache.clear()
+        results['token_cached'] = measure(CachedTokenAuthentication(), token_request, requests, warm=True)
+        results['basic_cached'] = measure(
+            CachedBasicAuthentication(), basic_request, basic_cached_requests, warm=True
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--basic-requests', type=int, default=20,
+                        help='Запросов для некэшированной Basic-аутентификации')
+    parser.add_argument('--basic-cached-requests', type=int, default=500,
+                        help='Запросов для кэшированной Basic-аутентификации')
+    args = parser.parse_args()
+
+    setup_django()
+    destroy_test_db = create_test_database()
+    try:
+        results = run(args.requests, args.basic_requests, args.basic_cached_requests)
+    finally:
+        destroy_test_db()
+
+    for name, (per_request, queries) in results.items():
+        print(f"  {name:14} {per_request * 1e6:10.1f} мкс/запрос  запросов к БД: {queries:.2f}")
+
+
+if __name__ == '__main__':
+    main()
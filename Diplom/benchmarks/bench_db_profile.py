@@ -0,0 +1,148 @@
+"""
+Бенчмарк профиля БД: конкурентные чтение и запись в файловой SQLite.
+
+Сравнивает настройки Django по умолчанию (журнал отката, новое
+соединение на каждый запрос) с профилем из settings.py (synchronous=NORMAL,
+mmap, cache_size, busy_timeout, BEGIN IMMEDIATE), режимом WAL
+(DJANGO_SQLITE_WAL) и постоянными соединениями WSGI-развертывания.
+Бенчмарк работает со своей временной БД, поэтому WAL включается всегда. Читатели выбирают страницу каталога, писатели
+короткими транзакциями меняют остатки. Каждая итерация обрамлена
+сигналами начала/конца запроса, как в WSGI-обработчике.
+
+Запуск (из каталога Diplom):
+    python -m benchmarks.bench_db_profile --seconds 5 --readers 8 --writers 2
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from . import setup_django, create_test_database
+
+DEFAULT_PROFILE = {
+    'CONN_MAX_AGE': 0,
+    'CONN_HEALTH_CHECKS': False,
+    'OPTIONS': {},
+}
+
+
+def tuned_profile():
+    from django.conf import settings
+
+    database = settings.DATABASES['default']
+    return {key: database[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS')}
+
+
+def seed(products):
+    from core.import_service import CatalogImportService
+    from core.models import ProductInfo, User
+
+    shop_user = User.objects.create_user(email='bench-shop@example.com', password='BenchPass123', type='shop')
+    CatalogImportService.import_shop_data(shop_user, {
+        'shop': 'Бенчмарк',
+        'categories': [{'id': 1, 'name': 'Смартфоны'}],
+        'goods': [
+            {'id': i, 'category': 1, 'name': f'Товар {i}', 'price': 100 + i, 'price_rrc': 120 + i, 'quantity': 10}
+            for i in range(1, products + 1)
+        ],
+    })
+    return list(ProductInfo.objects.values_list('id', flat=True))
+
+
+def run_profile(profile, journal_mode, seconds, readers, writers, product_ids):
+    from django.core.signals import request_finished, request_started
+    from django.db import OperationalError, connection, connections, transaction
+    from django.db.models import F
+
+    from core.models import ProductInfo
+
+    connections.close_all()
+    connections.settings['default'].update(profile)
+    connection.settings_dict.update(profile)
+    # Режим журнала хранится в файле БД, переключать его можно только без
+    # других соединений - поэтому до запуска потоков
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+    connection.close()
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def read():
+        list(ProductInfo.objects.select_related('product', 'shop').filter(quantity__gt=0)[:50])
+
+    def write():
+        with transaction.atomic():
+            ProductInfo.objects.filter(pk=random.choice(product_ids)).update(quantity=F('quantity') + 1)
+
+    def worker(operation, counter):
+        done = errors = 0
+        while time.perf_counter() < deadline:
+            request_started.send(sender=None)
+            try:
+                operation()
+                done += 1
+            except OperationalError:
+                # database is locked
+                errors += 1
+            finally:
+                request_finished.send(sender=None)
+        connections.close_all()
+        with lock:
+            counts[counter] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=(read, 'reads')) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=(write, 'writes')) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {key: value / seconds if key != 'errors' else value for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--products', type=int, default=500)
+    args = parser.parse_args()
+
+    # Итерации бенчмарка обрамлены сигналами запроса, как в WSGI - и
+    # постоянные соединения те же, что задает myproject/wsgi.py
+    os.environ.setdefault('DJANGO_DB_CONN_MAX_AGE', '60')
+    setup_django()
+    from django.conf import settings
+    from django.db import connections
+
+    if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+        parser.error('Бенчмарк рассчитан на профиль SQLite')
+
+    # WAL не работает для БД в памяти - тестовая БД во временном файле
+    workdir = tempfile.mkdtemp()
+    connections.settings['default']['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    destroy_test_db = create_test_database()
+    try:
+        product_ids = seed(args.products)
+        tuned = tuned_profile()
+        results = {
+            'default': run_profile(DEFAULT_PROFILE, 'DELETE', args.seconds, args.readers, args.writers, product_ids),
+            'tuned': run_profile(tuned, 'WAL', args.seconds, args.readers, args.writers, product_ids),
+        }
+    finally:
+        destroy_test_db()
+
+    print(f"Читателей: {args.readers}, писателей: {args.writers}, {args.seconds:.0f} с на профиль")
+    for name, result in results.items():
+        print(
+            f"  {name:8} чтений {result['reads']:8.0f}/с  записей {result['writes']:7.0f}/с"
+            f"  ошибок блокировки: {result['errors']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Бенчмарк доставки email: соединение на каждое письмо против пакетной доставки.
+
+Запуск (из каталога Diplom):
+    python -m benchmarks.bench_email_delivery --emails 500 --connect-delay 0.02
+"""
+import argparse
+import time
+
+from . import setup_django, create_test_database
+from .smtp_stub import SMTPStubServer
+
+
+def run(emails, batch_size, connect_delay):
+    from django.core.mail import EmailMessage, get_connection
+    from django.test import override_settings
+
+    from core.email_delivery import EmailDeliveryService
+    from core.models import QueuedEmail
+
+    server = SMTPStubServer(connect_delay=connect_delay).start()
+    smtp_settings = override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+        EMAIL_HOST='127.0.0.1',
+        EMAIL_PORT=server.port,
+        EMAIL_USE_TLS=False,
+        EMAIL_DOMAIN_RATE_LIMITS={},
+    )
+    recipients = [f'user{i}@example{i % 10}.com' for i in range(emails)]
+    results = {}
+
+    with smtp_settings:
+        # 1. Как отправляет одиночная задача: новое соединение на каждое письмо
+        start = time.perf_counter()
+        for to in recipients:
+            connection = get_connection()
+            EmailMessage('Тест', 'Текст письма', 'noreply@phonestore.local', [to],
+                         connection=connection).send()
+        results['per_message'] = (time.perf_counter() - start, server.connections)
+
+        # 2. Пакетная доставка из очереди
+        for to in recipients:
+            EmailDeliveryService.enqueue(to, 'Тест', 'Текст письма')
+        connections_before = server.connections
+        start = time.perf_counter()
+        while EmailDeliveryService.deliver_batch(batch_size)['sent']:
+            pass
+        results['batched'] = (time.perf_counter() - start, server.connections - connections_before)
+        assert QueuedEmail.objects.filter(status='sent').count() == emails
+
+    server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--connect-delay', type=float, default=0.02,
+                        help='Имитация стоимости установки SMTP-соединения, сек')
+    args = parser.parse_args()
+
+    setup_django()
+    destroy_test_db = create_test_database()
+    try:
+        results = run(args.emails, args.batch_size, args.connect_delay)
+    finally:
+        destroy_test_db()
+
+    print(f"Писем: {args.emails}, задержка соединения: {args.connect_delay * 1000:.0f} мс")
+    for name, (elapsed, connections) in results.items():
+        print(f"  {name:12} {elapsed:8.2f} с  {args.emails / elapsed:8.1f} писем/с  соединений: {connections}")
+
+
+if __name__ == '__main__':
+    main()
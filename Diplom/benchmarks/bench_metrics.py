@@ -0,0 +1,85 @@
+"""
+Бенчмарк накладных расходов метрик (core.metrics).
+
+- middleware: MetricsMiddleware вокруг пустого view против пустого view;
+- SQL: простой запрос с учетом в статистике запроса против запроса вне запроса.
+
+Запуск (из каталога Diplom):
+    python -m benchmarks.bench_metrics --requests 100000 --queries 20000
+"""
+import argparse
+import time
+
+from . import setup_django, create_test_database
+
+
+def per_call(function, calls, repeat=3):
+    """Лучшее из repeat прогонов, первый прогон - прогрев."""
+    timings = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        timings.append((time.perf_counter() - start) / calls)
+    return min(timings[1:])
+
+
+def measure_middleware(requests):
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.urls import resolve
+
+    from core.metrics import MetricsMiddleware
+
+    request = RequestFactory().get('/api/v1/products/')
+    request.resolver_match = resolve('/api/v1/products/')
+    response = HttpResponse(b'{}')
+
+    def view(request):
+        return response
+
+    middleware = MetricsMiddleware(view)
+    bare = per_call(lambda: view(request), requests)
+    measured = per_call(lambda: middleware(request), requests)
+    return measured - bare
+
+
+def measure_queries(queries):
+    from django.db import connection
+
+    from core.metrics import RequestStats, _request_stats
+
+    def query():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    idle = per_call(query, queries)
+    token = _request_stats.set(RequestStats())
+    try:
+        recorded = per_call(query, queries)
+    finally:
+        _request_stats.reset(token)
+    return idle, recorded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    destroy_test_db = create_test_database()
+    try:
+        middleware = measure_middleware(args.requests)
+        idle, recorded = measure_queries(args.queries)
+    finally:
+        destroy_test_db()
+
+    print(f"  middleware на запрос:      {middleware * 1e6:6.2f} мкс")
+    print(f"  SQL-запрос вне запроса:    {idle * 1e6:6.2f} мкс")
+    print(f"  SQL-запрос с учетом:       {recorded * 1e6:6.2f} мкс (+{(recorded - idle) * 1e6:.2f})")
+
+
+if __name__ == '__main__':
+    main()
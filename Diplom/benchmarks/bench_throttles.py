@@ -0,0 +1,80 @@
+"""
+Микробенчмарк троттлинга: SimpleRateThrottle (список отметок времени)
+против скользящего окна на счетчиках и token bucket.
+
+Ключ доводится почти до лимита, после чего измеряется стоимость одной
+проверки и размер состояния ключа в кэше.
+
+Запуск (из каталога Diplom):
+    python -m benchmarks.bench_throttles --rate 60/min --checks 20000
+"""
+import argparse
+import pickle
+import time
+
+from . import setup_django
+
+
+def run(rate, checks):
+    from django.core.cache import cache
+    from django.test import RequestFactory
+    from rest_framework.throttling import SimpleRateThrottle
+
+    from core.throttles import SlidingWindowCounterThrottle, TokenBucketThrottle
+
+    class KeyedThrottle:
+        def get_cache_key(self, request, view):
+            return f'bench_{type(self).__name__}'
+
+    variants = {
+        'simple': type('Simple', (KeyedThrottle, SimpleRateThrottle), {'rate': rate}),
+        'sliding_window': type('SlidingWindow', (KeyedThrottle, SlidingWindowCounterThrottle), {'rate': rate}),
+        'token_bucket': type('TokenBucket', (KeyedThrottle, TokenBucketThrottle), {'rate': rate}),
+    }
+    request = RequestFactory().get('/')
+    results = {}
+
+    for name, throttle_class in variants.items():
+        cache.clear()
+        now = [1_000_000.0]
+        throttle = throttle_class()
+        throttle.timer = lambda: now[0]
+        # Ключ почти у лимита: у SimpleRateThrottle в истории num_requests - 1 отметок
+        step = throttle.duration / throttle.num_requests
+        for _ in range(throttle.num_requests - 1):
+            throttle.allow_request(request, None)
+            now[0] += step / 1000
+
+        # Время идет со скоростью лимита, поэтому почти все проверки проходят
+        start = time.perf_counter()
+        allowed = 0
+        for _ in range(checks):
+            now[0] += step
+            allowed += throttle.allow_request(request, None)
+        elapsed = time.perf_counter() - start
+
+        state_size = sum(len(pickle.dumps(value)) for value in cache.get_many(
+            [key for key in (throttle.key, f'{throttle.key}:{int(now[0] // throttle.duration)}',
+                             f'{throttle.key}:{int(now[0] // throttle.duration) - 1}')]
+        ).values())
+        results[name] = (elapsed / checks, state_size, allowed)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rate', default='60/min')
+    parser.add_argument('--checks', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args.rate, args.checks)
+
+    print(f"Лимит: {args.rate}, проверок: {args.checks} (кэш: локальная память)")
+    for name, (per_check, state_size, allowed) in results.items():
+        print(f"  {name:15} {per_check * 1e6:8.1f} мкс/проверка  состояние: {state_size:5} байт  пропущено: {allowed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""
+Нагрузочный тест API на заполненной базе.
+
+Приложение целиком (маршруты, middleware, аутентификация по токену)
+работает в этом процессе под WSGIHandler; --concurrency клиентов в
+отдельных потоках выполняют сценарии, выбранные случайно по весам:
+- browse   - страница каталога по категории/магазину и история цен товара;
+- search   - поиск по названию с диапазоном цен;
+- basket   - добавление товара в корзину и просмотр корзины;
+- checkout - товар в корзину, подтверждение заказа, список заказов;
+- partner_import - загрузка прайс-листа магазина (YAML) и обновление остатков.
+База - временная файловая SQLite с профилем из settings.py; данные
+создаются перед замером, db.sqlite3 не затрагивается. Ограничения
+частоты запросов на время замера отключены.
+
+По каждому endpoint считаются пропускная способность, задержки
+p50/p95/p99 и ошибки; отчет пишется в JSON (--output). С --baseline
+отчет сравнивается с сохраненным ранее (по умолчанию - с
+benchmarks/load_test_baseline.json из репозитория): рост общего p50 или
+падение общей пропускной способности больше --tolerance процентов, а
+также новые ошибки - код возврата 1. Сравнивать можно только прогоны с теми же
+параметрами (--scenarios, --concurrency, --products, --mix, --seed).
+
+Запуск (из каталога Diplom):
+    python -m benchmarks.load_test --scenarios 200 --baseline
+    python -m benchmarks.load_test --scenarios 200 --save-baseline   # обновить базовый отчет
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from . import BASE_DIR, setup_django, create_test_database
+
+API = '/api/v1/'
+DEFAULT_MIX = 'browse=50,search=25,basket=15,checkout=7,partner_import=3'
+DEFAULT_BASELINE = BASE_DIR / 'benchmarks' / 'load_test_baseline.json'
+SEARCH_TERMS = ('Смартфон', 'Ноутбук', 'Планшет', 'model-1', 'model-2')
+CATEGORIES = {1: 'Смартфоны', 2: 'Ноутбуки', 3: 'Планшеты'}
+PASSWORD = 'LoadPass123'
+
+
+def price_list(shop_index, products, price_shift=0):
+    return {
+        'shop': f'Нагрузка {shop_index}',
+        'categories': [{'id': category_id, 'name': name} for category_id, name in CATEGORIES.items()],
+        'goods': [
+            {
+                'id': i,
+                'category': i % len(CATEGORIES) + 1,
+                'name': f'{CATEGORIES[i % len(CATEGORIES) + 1][:-1]} {i}',
+                'model': f'model-{i}',
+                'price': 1000 + (i * 37 + shop_index * 11) % 5000 + price_shift,
+                'price_rrc': 7000 + price_shift,
+                'quantity': 10 ** 6,
+                'parameters': {'Цвет': ('черный', 'белый')[i % 2], 'Память': 64 * (1 + i % 4)},
+            }
+            for i in range(1, products + 1)
+        ],
+    }
+
+
+def seed(clients, products):
+    """Магазин, покупатель и контакт на каждого клиента. Возвращает данные для сценариев."""
+    from rest_framework.authtoken.models import Token
+
+    from core.import_service import CatalogImportService
+    from core.models import Contact, ProductInfo, User
+
+    users = []
+    for index in range(clients):
+        seller = User.objects.create_user(
+            email=f'load-shop{index}@example.com', password=PASSWORD, type='shop', username=f'load-shop{index}'
+        )
+        shop, _ = CatalogImportService.import_shop_data(seller, price_list(index, products))
+        buyer = User.objects.create_user(
+            email=f'load-buyer{index}@example.com', password=PASSWORD, username=f'load-buyer{index}'
+        )
+        contact = Contact.objects.create(
+            user=buyer, type='address', value='Доставка', city='Москва', street='Тверская', house=str(index + 1)
+        )
+        users.append({
+            'shop_index': index,
+            'shop_id': shop.id,
+            'seller_token': Token.objects.create(user=seller).key,
+            'buyer_token': Token.objects.create(user=buyer).key,
+            'contact_id': contact.id,
+        })
+
+    catalog = list(ProductInfo.objects.values_list('product_id', 'shop_id'))
+    return users, catalog
+
+
+class Client:
+    """Один виртуальный пользователь: запросы прямо в WSGIHandler, замер каждого запроса."""
+
+    def __init__(self, handler, user, catalog, rng, products, stats):
+        self.handler = handler
+        self.user = user
+        self.catalog = catalog
+        self.rng = rng
+        self.products = products
+        self.stats = stats
+        self.imports = 0
+
+    def request(self, label, method, path, token=None, query=None, json_body=None, files=None):
+        from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+        body, content_type = b'', ''
+        if json_body is not None:
+            body, content_type = json.dumps(json_body).encode(), 'application/json'
+        elif files is not None:
+            body, content_type = encode_multipart(BOUNDARY, files), MULTIPART_CONTENT
+
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': API + path,
+            'QUERY_STRING': urlencode(query or {}),
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        }
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f'Token {token}'
+        setup_testing_defaults(environ)
+        environ['SERVER_NAME'] = environ['HTTP_HOST'] = 'testserver'
+
+        statuses = []
+        start = time.perf_counter()
+        response = self.handler(environ, lambda status, headers: statuses.append(status))
+        content = b''.join(response)
+        response.close()
+        self.stats[label].append((time.perf_counter() - start, int(statuses[0].split()[0])))
+        return json.loads(content) if content else None
+
+    def product(self):
+        return self.rng.choice(self.catalog)
+
+    def browse(self):
+        product_id, shop_id = self.product()
+        filters = self.rng.choice([{'category_id': self.rng.choice(list(CATEGORIES))}, {'shop_id': shop_id}, {}])
+        self.request('GET products', 'GET', 'products/', query=filters)
+        self.request('GET price-history', 'GET', f'products/{product_id}/price-history/', query={'shop_id': shop_id})
+
+    def search(self):
+        low = self.rng.randrange(1000, 4000, 500)
+        self.request('GET products?search', 'GET', 'products/', query={
+            'search': self.rng.choice(SEARCH_TERMS), 'min_price': low, 'max_price': low + 2000
+        })
+
+    def add_to_basket(self):
+        product_id, shop_id = self.product()
+        self.request('POST basket', 'POST', 'basket/', self.user['buyer_token'], json_body={
+            'product_id': product_id, 'shop_id': shop_id, 'quantity': 1
+        })
+
+    def basket(self):
+        self.add_to_basket()
+        self.request('GET basket', 'GET', 'basket/', self.user['buyer_token'])
+
+    def checkout(self):
+        self.add_to_basket()
+        basket = self.request('GET basket', 'GET', 'basket/', self.user['buyer_token'])
+        self.request('POST order/confirm', 'POST', 'order/confirm/', self.user['buyer_token'], json_body={
+            'order_id': basket['OrderID'], 'contact_id': self.user['contact_id']
+        })
+        self.request('GET orders', 'GET', 'orders/', self.user['buyer_token'])
+
+    def partner_import(self):
+        import yaml
+
+        # Каждый клиент загружает прайс-лист своего магазина: параллельные
+        # импорты одного магазина по правилам сервиса отклоняются
+        self.imports += 1
+        document = yaml.dump(
+            price_list(self.user['shop_index'], self.products, price_shift=self.imports), allow_unicode=True
+        )
+        price_file = BytesIO(document.encode())
+        price_file.name = 'price.yaml'
+        self.request('POST partner/update', 'POST', 'partner/update/', self.user['seller_token'],
+                     files={'file': price_file})
+        self.request('POST partner/stock', 'POST', 'partner/stock/', self.user['seller_token'], json_body={
+            'items': [
+                {'external_id': self.rng.randint(1, self.products), 'quantity': 10 ** 6}
+                for _ in range(20)
+            ]
+        })
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if not hasattr(Client, name.strip()):
+            raise argparse.ArgumentTypeError(f'Неизвестный сценарий: {name}')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def run(users, catalog, args):
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connections
+
+    handler = WSGIHandler()
+    scenarios, weights = zip(*args.mix.items())
+    stats = defaultdict(list)
+    stats_lock = threading.Lock()
+    # Общий счетчик сценариев: клиенты разбирают их, пока не кончатся
+    remaining = iter(range(args.scenarios))
+    remaining_lock = threading.Lock()
+    errors = []
+
+    def worker(index):
+        local_stats = defaultdict(list)
+        rng = random.Random(args.seed * 1000 + index)
+        client = Client(handler, users[index], catalog, rng, args.products, local_stats)
+        try:
+            while True:
+                with remaining_lock:
+                    if next(remaining, None) is None:
+                        break
+                getattr(client, rng.choices(scenarios, weights)[0])()
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            connections.close_all()
+            with stats_lock:
+                for label, samples in local_stats.items():
+                    stats[label].extend(samples)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.perf_counter() - start, errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status in samples if status >= 400),
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def build_report(stats, elapsed, args):
+    import django
+    from django.conf import settings
+
+    all_samples = [sample for samples in stats.values() for sample in samples]
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+        },
+        'parameters': {
+            'scenarios': args.scenarios,
+            'concurrency': args.concurrency,
+            'products': args.products,
+            'mix': args.mix,
+            'seed': args.seed,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'total': summarize(all_samples, elapsed),
+        'endpoints': {label: summarize(samples, elapsed) for label, samples in sorted(stats.items())},
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Строки сравнения с базовым отчетом и список регрессий.
+
+    Ухудшение - новые ошибки любого endpoint'а или рост общего (total)
+    p50 либо падение общей пропускной способности больше tolerance
+    процентов. Показатели отдельных endpoint'ов и p95 выводятся для
+    поиска причины: на сотнях запросов они меняются от прогона к
+    прогону сильнее допуска.
+    """
+    lines, regressions = [], []
+    rows = [('total', report['total'], baseline['total'])]
+    rows += [(label, current, baseline['endpoints'].get(label)) for label, current in report['endpoints'].items()]
+    for label, current, previous in rows:
+        if previous is None:
+            lines.append(f"  {label:22} нет в базовом отчете")
+            continue
+        p50_change = (current['p50_ms'] / previous['p50_ms'] - 1) * 100 if previous['p50_ms'] else 0
+        rps_change = (current['throughput_rps'] / previous['throughput_rps'] - 1) * 100 \
+            if previous['throughput_rps'] else 0
+        lines.append(
+            f"  {label:22} p50 {previous['p50_ms']:7.1f} -> {current['p50_ms']:7.1f} мс ({p50_change:+6.1f}%)"
+            f"  p95 {previous['p95_ms']:7.1f} -> {current['p95_ms']:7.1f} мс"
+            f"  {previous['throughput_rps']:6.1f} -> {current['throughput_rps']:6.1f} запр/с ({rps_change:+6.1f}%)"
+        )
+        if current['errors'] > previous['errors']:
+            lines.append(f"  {label:22} ошибок {previous['errors']} -> {current['errors']}")
+        slower = label == 'total' and (p50_change > tolerance or -rps_change > tolerance)
+        if slower or current['errors'] > previous['errors']:
+            regressions.append(label)
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', type=int, default=2000, help='Сколько сценариев выполнить всего')
+    parser.add_argument('--concurrency', type=int, default=8, help='Одновременных клиентов (потоков)')
+    parser.add_argument('--products', type=int, default=200, help='Товаров в прайс-листе каждого магазина')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f'Веса сценариев, {DEFAULT_MIX}')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно случайных чисел сценариев')
+    parser.add_argument('--output', type=Path, default=Path('load_test_report.json'))
+    parser.add_argument('--baseline', nargs='?', type=Path, const=DEFAULT_BASELINE, default=None,
+                        help=f'Сравнить с этим отчетом (по умолчанию {DEFAULT_BASELINE.relative_to(BASE_DIR)})')
+    parser.add_argument('--save-baseline', nargs='?', type=Path, const=DEFAULT_BASELINE, default=None,
+                        help=f'Сохранить отчет как базовый (по умолчанию {DEFAULT_BASELINE.relative_to(BASE_DIR)})')
+    # Прогоны по 200 сценариев на одной машине расходятся до ~25% - порог выше шума
+    parser.add_argument('--tolerance', type=float, default=30, help='Допустимое ухудшение, проценты')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        parameters = {
+            'scenarios': args.scenarios, 'concurrency': args.concurrency, 'products': args.products,
+            'mix': args.mix, 'seed': args.seed,
+        }
+        if baseline['parameters'] != parameters:
+            # Задержки и пропускная способность зависят от объема и состава нагрузки
+            parser.error(f"Параметры прогона отличаются от базового отчета {args.baseline}: {baseline['parameters']}")
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connections
+    from rest_framework.settings import api_settings
+
+    workdir = tempfile.mkdtemp()
+    if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        # Потоки работают с одной БД - временный файл вместо БД в памяти
+        connections.settings['default']['TEST']['NAME'] = os.path.join(workdir, 'load.sqlite3')
+    # Письма о заказах - не в sent_emails проекта
+    settings.DEMO_EMAIL_SPOOL_DIR = Path(workdir) / 'sent_emails'
+    # Общий словарь ставок всех ограничителей DRF; None - без ограничения
+    api_settings.DEFAULT_THROTTLE_RATES.update(dict.fromkeys(api_settings.DEFAULT_THROTTLE_RATES))
+
+    destroy_test_db = create_test_database()
+    try:
+        users, catalog = seed(args.concurrency, args.products)
+        connections.close_all()
+        stats, elapsed, errors = run(users, catalog, args)
+    finally:
+        destroy_test_db()
+
+    report = build_report(stats, elapsed, args)
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+    total = report['total']
+    print(f"Сценариев: {args.scenarios}, клиентов: {args.concurrency}, {elapsed:.1f} с, "
+          f"{total['throughput_rps']:.0f} запр/с, ошибок: {total['errors']}")
+    for label, result in report['endpoints'].items():
+        print(
+            f"  {label:22} {result['requests']:6} запр. {result['throughput_rps']:8.1f} запр/с"
+            f"  p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f}  p99 {result['p99_ms']:7.1f} мс"
+            f"  ошибок {result['errors']}"
+        )
+    print(f"Отчет: {args.output}")
+    for error in errors:
+        print(f"Клиент остановлен с ошибкой: {error}", file=sys.stderr)
+
+    exit_code = 1 if errors else 0
+    if baseline:
+        lines, regressions = compare(report, baseline, args.tolerance)
+        print(f"Сравнение с {args.baseline} (допуск {args.tolerance:.0f}%):")
+        print('\n'.join(lines))
+        if regressions:
+            print(f"Ухудшение: {', '.join(regressions)}", file=sys.stderr)
+            exit_code = 1
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        print(f"Базовый отчет сохранен: {args.save_baseline}")
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from .models import (
     User, Shop, Category, Product, ProductInfo, 
     Parameter, ProductParameter, Contact, Order, 
-    OrderItem, ConfirmEmailToken
+    OrderItem, ConfirmEmailToken, PriceHistory, QueuedEmail, OutboxMessage,
+    CatalogQueryStat, ShopDailySales, ProductDailySales, ArchivedOrder, ArchivedOrderItem
 )
+from .import_service import CatalogImportService, CatalogImportError
 
 
 @admin.register(User)
@@ -30,9 +32,20 @@ class UserAdmin(BaseUserAdmin):
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
-    list_display = ('name', 'url', 'user', 'state')
+    list_display = ('name', 'url', 'user', 'state', 'catalog_version')
     list_filter = ('state',)
     search_fields = ('name', 'url')
+    readonly_fields = ('catalog_version', 'previous_catalog_version')
+    actions = ['rollback_catalog']
+
+    @admin.action(description='Откатить прайс-лист к предыдущей версии')
+    def rollback_catalog(self, request, queryset):
+        for shop in queryset:
+            try:
+                version = CatalogImportService.rollback(shop)
+                self.message_user(request, f'{shop.name}: опубликована версия {version}')
+            except CatalogImportError as e:
+                self.message_user(request, str(e), level=messages.WARNING)
 
 
 @admin.register(Category)
@@ -51,11 +64,19 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(ProductInfo)
 class ProductInfoAdmin(admin.ModelAdmin):
-    list_display = ('product', 'shop', 'price', 'quantity', 'external_id')
+    list_display = ('product', 'shop', 'price', 'quantity', 'external_id', 'version')
     list_filter = ('shop',)
     search_fields = ('product__name', 'model')
 
 
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ('product', 'shop', 'price', 'price_rrc', 'month', 'ts')
+    list_filter = ('shop', 'month')
+    search_fields = ('product__name',)
+    list_select_related = ('product', 'shop')
+
+
 @admin.register(Parameter)
 class ParameterAdmin(admin.ModelAdmin):
     list_display = ('name',)
@@ -125,4 +146,58 @@ class OrderItemAdmin(admin.ModelAdmin):
 @admin.register(ConfirmEmailToken)
 class ConfirmEmailTokenAdmin(admin.ModelAdmin):
     list_display = ('user', 'key', 'created_at')
-    search_fields = ('user__email', 'key')
\ No newline at end of file
+    search_fields = ('user__email', 'key')
+
+
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'domain')
+    search_fields = ('to', 'subject')
+    readonly_fields = ('created_at', 'sent_at', 'last_error', 'claim')
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'attempts', 'created_at', 'processed_at')
+    list_filter = ('status', 'task')
+    readonly_fields = ('created_at', 'processed_at', 'last_error', 'claim')
+
+
+@admin.register(CatalogQueryStat)
+class CatalogQueryStatAdmin(admin.ModelAdmin):
+    list_display = ('signature', 'hits', 'last_seen')
+    search_fields = ('signature',)
+    ordering = ('-hits',)
+
+
+@admin.register(ShopDailySales)
+class ShopDailySalesAdmin(admin.ModelAdmin):
+    list_display = ('shop', 'date', 'orders', 'units', 'revenue')
+    list_filter = ('shop',)
+    date_hierarchy = 'date'
+
+
+@admin.register(ProductDailySales)
+class ProductDailySalesAdmin(admin.ModelAdmin):
+    list_display = ('product', 'shop', 'date', 'units', 'revenue')
+    list_filter = ('shop',)
+    list_select_related = ('product', 'shop')
+    date_hierarchy = 'date'
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    readonly_fields = ('product', 'shop', 'product_name', 'shop_name', 'quantity', 'price_per_unit')
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'dt', 'status', 'total_price', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('id', 'user__email')
+    list_select_related = ('user',)
+    readonly_fields = ('id', 'user', 'dt', 'status', 'contact', 'total_price', 'archived_at')
+    inlines = [ArchivedOrderItemInline]
@@ -0,0 +1,180 @@
+"""
+Асинхронные версии самых нагруженных read-only endpoints.
+
+Под ASGI (uvicorn) синхронный DRF-view занимает поток на все время
+запроса. Здесь запрос обрабатывается в event loop, а в пул потоков
+уходят только обращения к БД через async ORM API Django.
+Ответы совпадают с синхронными ProductListView, BasketView.get и
+OrderListView; какие маршруты обслуживаются этими view, задает
+настройка ASYNC_VIEW_ROUTES (core/urls.py).
+
+Рендеринг - только JSON, без согласования формата и Browsable API.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import aprefetch_related_objects
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .authentication import aauthenticate
+from .catalog_cache import catalog_query_signature, product_list_cache_key, query_recorder
+from .db_router import replica_reads
+from .metrics import record_cache_lookup
+from .models import Order, OrderItem
+from .serializers import BasketItemSerializer, OrderSerializer, ProductInfoDetailSerializer
+from .throttles import BasketThrottle
+from .views import (
+    BasketView, item_prices_queryset, orders_with_items, product_list_queryset, products_missing_parameters
+)
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data), status=status, content_type='application/json', headers=headers
+    )
+
+
+def check_throttles(request, user, throttle_classes):
+    """
+    Те же ограничения, что у синхронного view. Возвращает ответ 429 или None.
+
+    Состояние ограничений хранится в кэше, обращение к нему (LocMem/Redis)
+    короткое и делается прямо в event loop.
+    """
+    drf_request = Request(request)
+    drf_request.user = user or AnonymousUser()
+
+    waits = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(drf_request, None):
+            waits.append(throttle.wait())
+    if not waits:
+        return None
+
+    waits = [wait for wait in waits if wait is not None]
+    wait = max(waits, default=None)
+    error = exceptions.Throttled(wait)
+    headers = {'Retry-After': str(math.ceil(wait))} if wait is not None else None
+    return json_response({'detail': error.detail}, status=error.status_code, headers=headers)
+
+
+def not_authenticated():
+    # Первый класс в DEFAULT_AUTHENTICATION_CLASSES - SessionAuthentication,
+    # поэтому DRF в этом случае отвечает 403, а не 401
+    return json_response({'detail': exceptions.NotAuthenticated.default_detail}, status=403)
+
+
+def method_not_allowed(request):
+    error = exceptions.MethodNotAllowed(request.method)
+    return json_response({'detail': error.detail}, status=error.status_code, headers={'Allow': 'GET'})
+
+
+async def item_prices(items):
+    """Async-версия views.item_prices."""
+    rows = item_prices_queryset(items)
+    if rows is None:
+        return {}
+    return {(product_id, shop_id): price async for product_id, shop_id, price in rows}
+
+
+async def product_list(request):
+    """Async-версия ProductListView."""
+    if request.method != 'GET':
+        return method_not_allowed(request)
+
+    user = await aauthenticate(request)
+    throttled = check_throttles(request, user, api_settings.DEFAULT_THROTTLE_CLASSES)
+    if throttled:
+        return throttled
+
+    await query_recorder.arecord(catalog_query_signature(request.GET))
+
+    cache_key = product_list_cache_key(request.GET)
+    cached_data = await cache.aget(cache_key)
+    record_cache_lookup('catalog', bool(cached_data))
+    if cached_data:
+        return json_response(cached_data)
+
+    with replica_reads(user):
+        products = [product_info async for product_info in product_list_queryset(request.GET)]
+        # Сериализатор читает параметры из таблиц, если нет JSON-копии, -
+        # загружаем их заранее, синхронный запрос в event loop недопустим
+        await aprefetch_related_objects(
+            products_missing_parameters(products), 'product_parameters__parameter'
+        )
+    data = ProductInfoDetailSerializer(
+        products, many=True, context={'request': request, 'image_variant': 'list'}
+    ).data
+    await cache.aset(cache_key, data, 300)
+    return json_response(data)
+
+
+_sync_basket_view = sync_to_async(BasketView.as_view())
+
+
+async def basket(request):
+    """
+    Async-версия BasketView.get.
+
+    Изменение корзины (POST/PUT/DELETE) выполняет синхронный BasketView
+    в пуле потоков: там транзакции и блокировки строк.
+    """
+    if request.method != 'GET':
+        return await _sync_basket_view(request)
+
+    user = await aauthenticate(request)
+    if user is None:
+        return not_authenticated()
+    throttled = check_throttles(request, user, [BasketThrottle])
+    if throttled:
+        return throttled
+
+    basket_order = await Order.objects.filter(user=user, status='basket').afirst()
+    if not basket_order:
+        return json_response({
+            'Status': True,
+            'Message': 'Корзина пуста',
+            'Items': [],
+            'Total': 0
+        })
+
+    items = [
+        item async for item in OrderItem.objects.filter(order=basket_order).select_related('product', 'shop')
+    ]
+    prices = await item_prices(items)
+    return json_response({
+        'Status': True,
+        'OrderID': basket_order.id,
+        'Items': BasketItemSerializer(items, many=True, context={'prices': prices}).data,
+        'Total': sum(prices.get((item.product_id, item.shop_id), 0) * item.quantity for item in items)
+    })
+
+
+async def order_list(request):
+    """Async-версия OrderListView."""
+    if request.method != 'GET':
+        return method_not_allowed(request)
+
+    user = await aauthenticate(request)
+    if user is None:
+        return not_authenticated()
+    throttled = check_throttles(request, user, api_settings.DEFAULT_THROTTLE_CLASSES)
+    if throttled:
+        return throttled
+
+    queryset = orders_with_items(Order.objects.filter(user=user).exclude(status='basket').order_by('-dt'))
+    with replica_reads(user):
+        orders = [order async for order in queryset]
+        prices = await item_prices([item for order in orders for item in order.items.all()])
+    return json_response({
+        'Status': True,
+        'Count': len(orders),
+        'Orders': OrderSerializer(orders, many=True, context={'request': request, 'prices': prices}).data
+    })
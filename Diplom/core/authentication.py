@@ -0,0 +1,239 @@
+"""
+Аутентификация с кэшем проверенных учетных данных.
+
+Стандартные TokenAuthentication и BasicAuthentication на каждый запрос
+читают токен и пользователя из БД, а Basic - еще и считают PBKDF2-хэш
+пароля. Здесь результат успешной проверки запоминается в ограниченном
+LRU-кэше процесса на AUTH_CACHE_TTL секунд.
+
+Кэш сбрасывается при выходе, смене пароля, изменении пользователя и
+удалении/пересоздании токена (сигналы в core/signals.py). Чтобы сброс
+был виден всем процессам, у пользователя есть "эпоха" в общем кэше
+Django: запись, сохраненная при другой эпохе, считается устаревшей.
+Поэтому кэш работает только с кэшем Django, общим для процессов (Redis);
+с LocMemCache он отключен - другой воркер не узнал бы о выходе.
+
+Общая эпоха (AUTH_GLOBAL_EPOCH_KEY) читается до запроса в БД:
+если за время проверки кто-то сбросил учетные данные, результат не
+кэшируется - иначе выход посреди проверки сохранился бы под новой эпохой.
+"""
+import base64
+import binascii
+import copy
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import exceptions
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+
+from .checks import cache_is_shared
+from .metrics import record_cache_lookup
+
+AUTH_EPOCH_KEY = 'auth_epoch_{}'
+AUTH_GLOBAL_EPOCH_KEY = 'auth_epoch'
+
+
+class VerifiedCredentialCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей."""
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.lock = threading.Lock()
+
+    def _limits(self):
+        return (
+            self.max_size or settings.AUTH_CACHE_MAX_SIZE,
+            self.ttl if self.ttl is not None else settings.AUTH_CACHE_TTL,
+        )
+
+    def enabled(self):
+        return bool(self._limits()[1]) and cache_is_shared()
+
+    @staticmethod
+    def user_epoch(user_id):
+        return cache.get(AUTH_EPOCH_KEY.format(user_id), 0)
+
+    def snapshot(self):
+        """Общая эпоха до проверки учетных данных в БД - передается в set()."""
+        if not self.enabled():
+            return None
+        return cache.get(AUTH_GLOBAL_EPOCH_KEY, 0)
+
+    def get(self, key):
+        if not self.enabled():
+            return None
+        result = self._lookup(key)
+        record_cache_lookup('credentials', result is not None)
+        return result
+
+    def _lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user, auth, expires, epoch = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+
+        if epoch != self.user_epoch(user.pk):
+            self.discard(key)
+            return None
+        # Копия: view не должны менять общий для запросов объект
+        return copy.copy(user), auth
+
+    def set(self, key, user, auth, since):
+        """Запомнить результат проверки; since - snapshot(), прочитанный до запроса в БД."""
+        if since is None or not self.enabled():
+            return
+        max_size, ttl = self._limits()
+        epoch_key = AUTH_EPOCH_KEY.format(user.pk)
+        epochs = cache.get_many([AUTH_GLOBAL_EPOCH_KEY, epoch_key])
+        if epochs.get(AUTH_GLOBAL_EPOCH_KEY, 0) != since:
+            # Во время проверки учетные данные сбрасывались - результат мог устареть
+            return
+        epoch = epochs.get(epoch_key, 0)
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (user, auth, time.monotonic() + ttl, epoch)
+            self.user_keys.setdefault(user.pk, set()).add(key)
+            while len(self.entries) > max_size:
+                self._remove(next(iter(self.entries)))
+
+    def discard(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        """Сбросить все записи пользователя во всех процессах."""
+        self._invalidate(user_id)
+        # Повтор после коммита: до него другие процессы читают из БД старые
+        # данные и могли сохранить их под уже увеличенной эпохой
+        transaction.on_commit(lambda: self._invalidate(user_id))
+
+    def _invalidate(self, user_id):
+        with self.lock:
+            for key in list(self.user_keys.get(user_id, ())):
+                self._remove(key)
+        if not self.enabled():
+            return
+        # Сначала общая эпоха: set(), увидевший новую эпоху пользователя,
+        # увидит и новую общую и не сохранит запись
+        for epoch_key in (AUTH_GLOBAL_EPOCH_KEY, AUTH_EPOCH_KEY.format(user_id)):
+            try:
+                cache.incr(epoch_key)
+            except ValueError:
+                cache.add(epoch_key, 1, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[0].pk
+        keys = self.user_keys.get(user_id)
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[user_id]
+
+
+credential_cache = VerifiedCredentialCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запросов к БД для уже проверенных токенов."""
+
+    def authenticate_credentials(self, key):
+        cache_key = ('token', key)
+        cached = credential_cache.get(cache_key)
+        if cached:
+            return cached
+
+        since = credential_cache.snapshot()
+        user, token = super().authenticate_credentials(key)
+        credential_cache.set(cache_key, user, token, since)
+        return user, token
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    BasicAuthentication, проверяющая пароль один раз за время жизни записи.
+
+    В кэше хранится не пароль, а HMAC от логина и пароля.
+    """
+
+    @staticmethod
+    def credentials_key(userid, password):
+        digest = hmac.new(
+            settings.SECRET_KEY.encode(),
+            f'{userid}\0{password}'.encode(),
+            hashlib.sha256
+        ).hexdigest()
+        return ('basic', digest)
+
+    def authenticate_credentials(self, userid, password, request=None):
+        cache_key = self.credentials_key(userid, password)
+        cached = credential_cache.get(cache_key)
+        if cached:
+            return cached
+
+        since = credential_cache.snapshot()
+        user, auth = super().authenticate_credentials(userid, password, request)
+        credential_cache.set(cache_key, user, auth, since)
+        return user, auth
+
+
+async def aauthenticate(request, token=None):
+    """
+    Пользователь запроса для async view (DRF APIView не асинхронны).
+
+    Порядок тот же, что в REST_FRAMEWORK: Token/Basic из заголовка
+    Authorization, иначе сессия. Проверенные учетные данные берутся из
+    кэша без обращения к БД, в поток уходит только промах кэша.
+    token - ключ из параметра запроса (EventSource не передает заголовки).
+    Возвращает пользователя или None.
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) == 2 and auth[0] == 'Token':
+        token = auth[1]
+
+    try:
+        if token:
+            cached = credential_cache.get(('token', token))
+            if cached is None:
+                cached = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(token)
+            return cached[0]
+
+        if len(auth) == 2 and auth[0] == 'Basic':
+            try:
+                userid, password = base64.b64decode(auth[1]).decode().split(':', 1)
+            except (ValueError, UnicodeDecodeError, binascii.Error):
+                return None
+            cached = credential_cache.get(CachedBasicAuthentication.credentials_key(userid, password))
+            if cached is None:
+                cached = await sync_to_async(CachedBasicAuthentication().authenticate_credentials)(userid, password)
+            return cached[0]
+    except exceptions.AuthenticationFailed:
+        return None
+
+    user = await request.auser()
+    return user if user.is_authenticated else None
@@ -0,0 +1,105 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+
+from .catalog_cache import product_list_cache_key
+from .checks import cache_is_shared
+from .models import CatalogQueryStat, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+WARMUP_LOCK_KEY = 'catalog_warmup_lock'
+
+
+class CatalogCacheWarmer:
+    """
+    Прогрев кэша каталога после импорта прайс-листа и деплоя.
+
+    Повторяет самые частые за последние дни запросы ProductListView
+    (по статистике CatalogQueryStat) через сам view, поэтому в кэш попадает
+    ровно то, что получил бы покупатель. Запросы идут по одному с
+    ограничением частоты, одновременно работает только один прогрев.
+    """
+
+    @staticmethod
+    def top_signatures(limit, window_days):
+        since = timezone.now() - timedelta(days=window_days)
+        return list(
+            CatalogQueryStat.objects.filter(last_seen__gte=since)
+            .order_by('-hits', 'signature')
+            .values_list('signature', flat=True)[:limit]
+        )
+
+    @staticmethod
+    def schedule():
+        """Поставить прогрев в outbox, если он еще не ожидает выполнения."""
+        from . import outbox
+        from .tasks import warm_catalog_cache_task
+
+        if not cache_is_shared():
+            # Прогрев выполняется в процессе диспетчера outbox - кэш в памяти
+            # заполнил бы только его, а не веб-процессы
+            return None
+        if OutboxMessage.objects.filter(task=warm_catalog_cache_task.name, status='pending').exists():
+            return None
+        return outbox.enqueue(warm_catalog_cache_task)
+
+    @staticmethod
+    def warm(limit=None, rate=None, window_days=None, sleep=time.sleep):
+        """
+        Заполняет кэш для top-N запросов.
+
+        rate - не больше стольких запросов в секунду, чтобы прогрев не
+        отнимал ресурсы у живого трафика. Возвращает статистику или None,
+        если прогрев уже выполняется.
+        """
+        from .views import ProductListView
+
+        limit = limit or settings.CATALOG_WARMUP_TOP_N
+        rate = rate or settings.CATALOG_WARMUP_RATE
+        window_days = window_days or settings.CATALOG_WARMUP_WINDOW_DAYS
+
+        if not cache.add(WARMUP_LOCK_KEY, 1, settings.CATALOG_WARMUP_LOCK_TIMEOUT):
+            logger.info("Прогрев кэша каталога уже выполняется")
+            return None
+
+        stats = {'queries': 0, 'warmed': 0, 'cached': 0, 'errors': 0}
+        try:
+            view = ProductListView.as_view()
+            factory = RequestFactory()
+            path = reverse('core:product-list')
+
+            for signature in CatalogCacheWarmer.top_signatures(limit, window_days):
+                started = time.monotonic()
+                stats['queries'] += 1
+
+                if cache.get(product_list_cache_key(QueryDict(signature))) is not None:
+                    stats['cached'] += 1
+                    continue
+
+                request = factory.get(f'{path}?{signature}')
+                # Запросы прогрева не попадают в статистику трафика
+                request.catalog_warmup = True
+                try:
+                    response = view(request)
+                except Exception as e:
+                    logger.error(f"Прогрев кэша каталога, запрос '{signature}': {e}")
+                    stats['errors'] += 1
+                else:
+                    stats['warmed' if response.status_code == 200 else 'errors'] += 1
+
+                pause = 1 / rate - (time.monotonic() - started)
+                if pause > 0:
+                    sleep(pause)
+        finally:
+            cache.delete(WARMUP_LOCK_KEY)
+
+        logger.info(f"Прогрев кэша каталога: {stats}")
+        return stats
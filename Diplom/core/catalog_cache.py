@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogQueryStat
+
+# Параметры, влияющие на выдачу ProductListView
+CATALOG_QUERY_PARAMS = ('category_id', 'shop_id', 'search', 'min_price', 'max_price')
+
+# Версии кэша каталога: общая (для выдачи по всем магазинам) и по магазинам.
+# Ключи страниц каталога содержат версию, поэтому инвалидация - это
+# увеличение счетчика, а не поиск и удаление ключей.
+CATALOG_VERSION_KEY = 'catalog_version'
+SHOP_CATALOG_VERSION_KEY = 'catalog_version_shop_{}'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 2, None)
+
+
+def bump_catalog_versions(shop_ids):
+    """Инвалидирует кэш каталога изменившихся магазинов и общую выдачу."""
+    for shop_id in set(shop_ids):
+        _bump_version(SHOP_CATALOG_VERSION_KEY.format(shop_id))
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def catalog_query_signature(query_params):
+    """
+    Нормализованные параметры выдачи каталога: только фильтры, влияющие
+    на результат, в постоянном порядке. Одинаковые по смыслу запросы
+    получают один ключ кэша и одну строку статистики.
+    """
+    return urlencode([
+        (name, query_params.get(name))
+        for name in CATALOG_QUERY_PARAMS
+        if query_params.get(name)
+    ])
+
+
+def product_list_cache_key(query_params):
+    signature = catalog_query_signature(query_params)
+
+    # Выдача, отфильтрованная по магазину, зависит только от его версии
+    shop_id = query_params.get('shop_id')
+    if shop_id:
+        version = _get_version(SHOP_CATALOG_VERSION_KEY.format(shop_id))
+        return f"products_s{shop_id}v{version}_{signature}"
+
+    version = _get_version(CATALOG_VERSION_KEY)
+    return f"products_v{version}_{signature}"
+
+
+class CatalogQueryRecorder:
+    """
+    Счетчик запросов каталога с буферизацией в памяти процесса.
+
+    Запрос только увеличивает счетчик в словаре; в БД (CatalogQueryStat)
+    накопленные значения сбрасываются раз в flush_interval секунд
+    несколькими UPDATE, а не по записи на каждый запрос.
+    """
+
+    def __init__(self, flush_interval=None, max_pending=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = Counter()
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def _add(self, signature):
+        """Увеличить счетчик; возвращает True, если пора сбросить их в БД."""
+        if len(signature) > CatalogQueryStat._meta.get_field('signature').max_length:
+            return False
+
+        interval = self.flush_interval
+        if interval is None:
+            interval = settings.CATALOG_QUERY_STATS_FLUSH_INTERVAL
+        with self.lock:
+            self.pending[signature] += 1
+            return (
+                len(self.pending) >= self.max_pending
+                or time.monotonic() - self.last_flush >= interval
+            )
+
+    def record(self, signature):
+        if self._add(signature):
+            self.flush()
+
+    async def arecord(self, signature):
+        """Версия record() для async-view: запись в БД уходит в пул потоков."""
+        if self._add(signature):
+            await sync_to_async(self.flush)()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.last_flush = time.monotonic()
+        if not pending:
+            return
+
+        now = timezone.now()
+        CatalogQueryStat.objects.bulk_create(
+            [CatalogQueryStat(signature=signature, last_seen=now) for signature in pending],
+            ignore_conflicts=True
+        )
+        # Одно обновление на каждое различное значение прироста
+        by_count = defaultdict(list)
+        for signature, count in pending.items():
+            by_count[count].append(signature)
+        for count, signatures in by_count.items():
+            CatalogQueryStat.objects.filter(signature__in=signatures).update(
+                hits=F('hits') + count,
+                last_seen=now
+            )
+
+
+query_recorder = CatalogQueryRecorder()
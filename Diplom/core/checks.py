@@ -0,0 +1,51 @@
+"""
+Проверки конфигурации (manage.py check --deploy).
+
+Часть механизмов рассчитана на кэш Django, общий для всех процессов
+(Redis, Memcached, БД): сброс версий кэша каталога воркером Celery,
+прогрев кэша после импорта, сброс кэша учетных данных при выходе.
+С кэшем в памяти процесса (LocMemCache) воркер меняет только свою копию,
+и остальные процессы этого не видят.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Бэкенды, данные которых не видны другим процессам
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_shared(alias='default'):
+    """Кэш alias общий для всех процессов (веб-воркеров и воркеров Celery)."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [
+        Warning(
+            'Кэш по умолчанию хранится в памяти процесса.',
+            hint='Сброс кэша каталога из воркеров Celery (синхронизация прайс-листов) не виден '
+                 'веб-процессам до истечения записей, прогрев кэша после импорта отключен. '
+                 'Настройте общий кэш (Redis) в CACHES.',
+            id='core.W001',
+        )
+    ]
+
+
+@register(Tags.caches, deploy=True)
+def check_credential_cache(app_configs, **kwargs):
+    if not settings.AUTH_CACHE_TTL or cache_is_shared():
+        return []
+    return [
+        Warning(
+            'Кэш проверенных учетных данных отключен: кэш по умолчанию хранится в памяти процесса.',
+            hint='Выход и смена пароля в одном процессе не сбросили бы кэш в остальных. '
+                 'Настройте общий кэш (Redis) в CACHES или задайте AUTH_CACHE_TTL = 0.',
+            id='core.W002',
+        )
+    ]
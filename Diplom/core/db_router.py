@@ -0,0 +1,88 @@
+"""
+Маршрутизация чтений на реплики БД.
+
+Реплики (DATABASE_REPLICAS) отстают от основной БД, поэтому на них идут
+только чтения, явно помеченные как допускающие отставание: GET-запросы
+view с ReplicaReadMixin и блоки replica_reads(). Все остальное, включая
+запись и select_for_update, выполняется на основной БД. Внутри
+replica_reads() не стоит читать данные для последующей записи.
+
+Чтобы пользователь видел свои изменения, после успешного изменяющего
+запроса он закрепляется за основной БД на REPLICA_PIN_SECONDS
+(core.middleware.ReplicaPinMiddleware). Метка хранится в общем кэше и
+видна всем процессам.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_PIN_KEY = 'db_primary_pin_{}'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def pin_to_primary(user_id):
+    cache.set(PRIMARY_PIN_KEY.format(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return bool(user and user.is_authenticated and cache.get(PRIMARY_PIN_KEY.format(user.pk)))
+
+
+@contextmanager
+def replica_reads(user=None):
+    """Чтения внутри блока идут на реплики, если пользователь не закреплен за основной БД."""
+    if not settings.DATABASE_REPLICAS or is_pinned(user):
+        yield False
+        return
+    token = _replica_reads.set(True)
+    try:
+        yield True
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        # Явно: иначе связанные объекты читались бы из БД, откуда загружен экземпляр
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с основной БД при репликации
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadMixin:
+    """Для APIView: чтения GET-запросов допускают отставание и идут на реплики."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # После аутентификации: токен только что выданного входа может еще
+        # не дойти до реплики
+        if request.method in SAFE_METHODS:
+            self._replica_reads = replica_reads(request.user)
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        replica_context = self.__dict__.pop('_replica_reads', None)
+        if replica_context is not None:
+            replica_context.__exit__(None, None, None)
+        return response
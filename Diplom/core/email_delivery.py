@@ -0,0 +1,185 @@
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+
+class DomainRateLimiter:
+    """
+    Ограничение скорости отправки по доменам получателей (token bucket).
+
+    Состояние хранится в памяти процесса-воркера: лимиты из
+    EMAIL_DOMAIN_RATE_LIMITS задаются на один воркер доставки.
+    """
+
+    def __init__(self, rates):
+        self.rates = rates
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def rate_for(self, domain):
+        return self.rates.get(domain, self.rates.get('default'))
+
+    def acquire(self, domain):
+        """Возвращает 0, если письмо можно отправить сейчас, иначе - сколько секунд ждать."""
+        rate = self.rate_for(domain)
+        if not rate:
+            return 0
+
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(domain, (rate, now))
+            tokens = min(rate, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self.buckets[domain] = (tokens - 1, now)
+                return 0
+            self.buckets[domain] = (tokens, now)
+            return (1 - tokens) / rate
+
+
+class EmailDeliveryService:
+    """
+    Пакетная доставка писем из очереди QueuedEmail.
+
+    Воркер забирает пачку готовых к отправке писем, открывает одно
+    SMTP-соединение на всю пачку и отправляет письма по одному, чтобы
+    ошибка одного письма приводила к повторной попытке только для него.
+    """
+
+    _rate_limiter = None
+
+    @staticmethod
+    def enqueue(to, subject, body):
+        return QueuedEmail.objects.create(
+            to=to,
+            domain=to.rsplit('@', 1)[-1].lower(),
+            subject=subject,
+            body=body
+        )
+
+    @staticmethod
+    def rate_limiter():
+        if EmailDeliveryService._rate_limiter is None:
+            EmailDeliveryService._rate_limiter = DomainRateLimiter(settings.EMAIL_DOMAIN_RATE_LIMITS)
+        return EmailDeliveryService._rate_limiter
+
+    @staticmethod
+    def claim_batch(batch_size):
+        # Захват пачки: условный UPDATE с уникальной меткой работает
+        # одинаково на SQLite и PostgreSQL и не требует блокировок строк
+        now = timezone.now()
+        due = QueuedEmail.objects.filter(
+            Q(status='pending') | Q(status='sending'),
+            next_attempt_at__lte=now
+        ).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size]
+
+        claim = uuid.uuid4().hex
+        QueuedEmail.objects.filter(
+            Q(status='pending') | Q(status='sending'),
+            id__in=list(due),
+            next_attempt_at__lte=now
+        ).update(
+            status='sending',
+            claim=claim,
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_DELIVERY_LEASE)
+        )
+        return list(QueuedEmail.objects.filter(claim=claim, status='sending').order_by('id'))
+
+    @staticmethod
+    def deliver_batch(batch_size=None):
+        batch = EmailDeliveryService.claim_batch(batch_size or settings.EMAIL_DELIVERY_BATCH_SIZE)
+        stats = {'sent': 0, 'retry': 0, 'failed': 0, 'deferred': 0}
+        if not batch:
+            return stats
+
+        rate_limiter = EmailDeliveryService.rate_limiter()
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.warning(f"SMTP-сервер недоступен: {e}")
+            stats['deferred'] = EmailDeliveryService._release(batch, timezone.now())
+            QueuedEmail.objects.bulk_update(batch, ['status', 'next_attempt_at'])
+            return stats
+
+        try:
+            for position, queued in enumerate(batch):
+                now = timezone.now()
+                wait = rate_limiter.acquire(queued.domain)
+                if wait:
+                    # Превышен лимит домена - откладываем без учета попытки
+                    queued.status = 'pending'
+                    queued.next_attempt_at = now + timedelta(seconds=wait)
+                    stats['deferred'] += 1
+                    continue
+
+                message = EmailMessage(
+                    subject=queued.subject,
+                    body=queued.body,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[queued.to],
+                    connection=connection
+                )
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    EmailDeliveryService._schedule_retry(queued, e, now)
+                    stats['failed' if queued.status == 'failed' else 'retry'] += 1
+                    if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)):
+                        # Соединение потеряно - открываем новое для остальных писем
+                        connection.close()
+                        try:
+                            connection.open()
+                        except Exception as reconnect_error:
+                            # Остаток пачки возвращается в очередь, не дожидаясь истечения аренды
+                            logger.warning(f"SMTP-сервер недоступен: {reconnect_error}")
+                            stats['deferred'] += EmailDeliveryService._release(batch[position + 1:], now)
+                            break
+                    continue
+
+                queued.status = 'sent'
+                queued.sent_at = now
+                queued.attempts += 1
+                queued.last_error = ''
+                stats['sent'] += 1
+        finally:
+            connection.close()
+            QueuedEmail.objects.bulk_update(
+                batch,
+                ['status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error']
+            )
+
+        logger.info(f"Доставка email: {stats}")
+        return stats
+
+    @staticmethod
+    def _release(emails, now):
+        """Вернуть захваченные письма в очередь без учета попытки (сервер недоступен)."""
+        for queued in emails:
+            queued.status = 'pending'
+            queued.next_attempt_at = now + timedelta(seconds=settings.EMAIL_DELIVERY_RETRY_DELAY)
+        return len(emails)
+
+    @staticmethod
+    def _schedule_retry(queued, error, now):
+        queued.attempts += 1
+        queued.last_error = str(error)
+        if queued.attempts >= settings.EMAIL_DELIVERY_MAX_ATTEMPTS:
+            queued.status = 'failed'
+            logger.error(f"Письмо {queued.id} на {queued.to} не доставлено: {error}")
+            return
+        queued.status = 'pending'
+        queued.next_attempt_at = now + timedelta(
+            seconds=settings.EMAIL_DELIVERY_RETRY_DELAY * 2 ** (queued.attempts - 1)
+        )
@@ -1,8 +1,21 @@
+import hashlib
 import logging
+import os
+import shutil
+import struct
+import threading
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 from pathlib import Path
 import json
 
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 class DemoEmailService:
@@ -47,44 +60,82 @@ class DemoEmailService:
         }
         
         DemoEmailService._save_to_file(email_data)
+        DemoEmailService._enqueue_delivery(user_email, subject, message)
         
         return True
     
     @staticmethod
-    def send_order_confirmation(user_email, order):
-        # Отправка email с подтверждением заказа
-        subject = f"Подтверждение заказа №{order.id}"
-        
-        order_items = []
+    def order_snapshot(order):
+        """
+        Снимок заказа для письма: позиции, цены, итог и контакт.
+
+        OrderConfirmView передает такой снимок в задачу сразу, этот метод -
+        запасной путь для задач, поставленных без снимка.
+        """
+        items = []
         total = 0
-        for item in order.items.all():
-            try:
-                product_info = item.product.product_infos.get(shop=item.shop)
-                item_price = product_info.price * item.quantity
-                total += item_price
-                order_items.append({
-                    'product': item.product.name,
-                    'quantity': item.quantity,
-                    'price': item_price
-                })
-            except:
-                pass
+        for item in order.items.select_related('product', 'shop').prefetch_related('product__product_infos'):
+            product_info = next(
+                (info for info in item.product.product_infos.all() if info.shop_id == item.shop_id),
+                None
+            )
+            if product_info is None:
+                continue
+            item_total = product_info.price * item.quantity
+            total += item_total
+            items.append({
+                'product_id': item.product.id,
+                'product_name': item.product.name,
+                'shop_id': item.shop.id,
+                'shop_name': item.shop.name,
+                'quantity': item.quantity,
+                'price_per_unit': product_info.price,
+                'item_total': item_total
+            })
+
+        contact = order.contact
+        return {
+            'id': order.id,
+            'status': order.status,
+            'status_display': order.get_status_display(),
+            'date': order.dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_price': total,
+            'contact': {
+                'id': contact.id,
+                'type': contact.type,
+                'value': contact.value,
+                'full_address': f"{contact.city}, {contact.street}, д. {contact.house}"
+                                if contact.type == 'address' else contact.value
+            } if contact else None,
+            'items': items,
+            'items_count': len(items)
+        }
+
+    @staticmethod
+    def send_order_confirmation(user_email, snapshot):
+        # Отправка email с подтверждением заказа. Письмо собирается
+        # только из снимка заказа, без обращений к БД
+        subject = f"Подтверждение заказа №{snapshot['id']}"
+        order_date = datetime.strptime(snapshot['date'], '%Y-%m-%d %H:%M:%S')
+        total = snapshot['total_price']
+        contact = snapshot.get('contact') or {}
         
         message = f"""
         Здравствуйте!
         
-        Ваш заказ №{order.id} успешно оформлен.
+        Ваш заказ №{snapshot['id']} успешно оформлен.
         
         Детали заказа:
-        Дата: {order.dt.strftime('%d.%m.%Y %H:%M')}
-        Статус: {order.get_status_display()}
+        Дата: {order_date.strftime('%d.%m.%Y %H:%M')}
+        Статус: {snapshot['status_display']}
         Общая сумма: {total} руб.
         
         Состав заказа:
-        {chr(10).join([f"- {item['product']} x{item['quantity']}: {item['price']} руб." for item in order_items])}
+        {chr(10).join([f"- {item['product_name']} x{item['quantity']}: {item['item_total']} руб." for item in snapshot['items']])}
         
         Контактная информация:
         Email: {user_email}
+        Доставка: {contact.get('full_address', '-')}
         
         ---
         Это демо-версия. В реальном проекте здесь были бы детали доставки и контакты.
@@ -96,7 +147,7 @@ class DemoEmailService:
         print("="*60)
         print(f"Кому: {user_email}")
         print(f"Тема: {subject}")
-        print(f"Заказ №: {order.id}")
+        print(f"Заказ №: {snapshot['id']}")
         print(f"Сумма: {total} руб.")
         print("="*60 + "\n")
         
@@ -105,39 +156,295 @@ class DemoEmailService:
             'type': 'order_confirmation',
             'to': user_email,
             'subject': subject,
-            'order_id': order.id,
+            'order_id': snapshot['id'],
             'order_total': total,
             'timestamp': datetime.now().isoformat(),
             'message': message
         }
         
         DemoEmailService._save_to_file(email_data)
+        DemoEmailService._enqueue_delivery(user_email, subject, message)
         
         return True
     
+    @staticmethod
+    def _enqueue_delivery(user_email, subject, message):
+        # Реальная отправка - через очередь пакетной доставки
+        if settings.EMAIL_DELIVERY_QUEUE:
+            from .email_delivery import EmailDeliveryService
+            EmailDeliveryService.enqueue(user_email, subject, message)
+
     @staticmethod
     def _save_to_file(email_data):
-        #  Сохраняем email данные в JSON файл
-        emails_dir = Path('sent_emails')
-        emails_dir.mkdir(exist_ok=True)
-        
-        filename = emails_dir / f"email_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(email_data, f, ensure_ascii=False, indent=2)
-        
-        print(f"Email данные сохранены в: {filename}")
-    
+        # Дописываем email в журнал (JSON Lines) и запись в индекс
+        line = (json.dumps(email_data, ensure_ascii=False) + '\n').encode('utf-8')
+
+        with EmailSpool.lock():
+            EmailSpool.ensure()
+            with open(EmailSpool.spool_path(), 'ab') as spool:
+                offset = spool.seek(0, os.SEEK_END)
+                spool.write(line)
+            with open(EmailSpool.index_path(), 'ab') as index:
+                index.write(EmailSpool.index_record(offset, len(line), email_data))
+
+        print(f"Email данные сохранены в: {EmailSpool.spool_path()} (смещение {offset})")
+
     @staticmethod
-    def list_sent_emails():
-        # Показывает список отправленных email
-        emails_dir = Path('sent_emails')
-        if not emails_dir.exists():
-            return []
-        
+    def list_sent_emails(limit=20, before=None, to=None, email_type=None):
+        """
+        Страница отправленных email, начиная с самых новых.
+
+        before - курсор (номер записи индекса), возвращенный предыдущей страницей.
+        Возвращает (emails, next_cursor).
+        """
+        return EmailSpool.read_page(limit, before, to, email_type)
+
+
+class EmailSpool:
+    """
+    Журнал отправленных email: JSON Lines + индекс фиксированного размера.
+
+    Каждая запись индекса хранит смещение и длину строки в журнале, код типа
+    письма и хэш получателя, поэтому страница последних писем (в том числе
+    с фильтром по получателю и типу) читается с конца индекса без разбора
+    всего журнала.
+    """
+
+    SPOOL_FILE = 'spool.jsonl'
+    INDEX_FILE = 'spool.idx'
+    # смещение, длина, код типа, хэш получателя
+    INDEX_RECORD = struct.Struct('<QIB8s')
+    EMAIL_TYPES = {'confirm_email': 1, 'order_confirmation': 2}
+    READ_CHUNK = 512
+
+    _thread_lock = threading.Lock()
+
+    @staticmethod
+    def spool_dir():
+        return Path(settings.DEMO_EMAIL_SPOOL_DIR)
+
+    @staticmethod
+    def spool_path():
+        return EmailSpool.spool_dir() / EmailSpool.SPOOL_FILE
+
+    @staticmethod
+    def index_path():
+        return EmailSpool.spool_dir() / EmailSpool.INDEX_FILE
+
+    @staticmethod
+    def recipient_hash(email):
+        return hashlib.blake2b((email or '').strip().lower().encode('utf-8'), digest_size=8).digest()
+
+    @staticmethod
+    def index_record(offset, length, email_data):
+        return EmailSpool.INDEX_RECORD.pack(
+            offset,
+            length,
+            EmailSpool.EMAIL_TYPES.get(email_data.get('type'), 0),
+            EmailSpool.recipient_hash(email_data.get('to'))
+        )
+
+    @staticmethod
+    @contextmanager
+    def lock(shared=False):
+        """
+        Блокировка журнала: эксклюзивная для записи, shared=True - для чтения.
+
+        Между процессами (воркеры Celery) - flock там, где он есть. flock
+        действует на открытый файл, поэтому и потоки одного процесса с
+        отдельными дескрипторами исключают друг друга; писатели
+        дополнительно проходят через threading.Lock (без fcntl это
+        единственная блокировка, и читатели тоже берут ее).
+        """
+        EmailSpool.spool_dir().mkdir(parents=True, exist_ok=True)
+        thread_lock = EmailSpool._thread_lock if not shared or not fcntl else nullcontext()
+        with thread_lock, open(EmailSpool.spool_dir() / '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def is_consistent():
+        """Индекс из целых записей и заканчивается там же, где журнал."""
+        record_size = EmailSpool.INDEX_RECORD.size
+        try:
+            index_size = EmailSpool.index_path().stat().st_size
+            spool_size = EmailSpool.spool_path().stat().st_size
+        except FileNotFoundError:
+            return False
+        if index_size % record_size:
+            return False
+        if not index_size:
+            return spool_size == 0
+        with open(EmailSpool.index_path(), 'rb') as index:
+            index.seek(-record_size, os.SEEK_END)
+            offset, length, _, _ = EmailSpool.INDEX_RECORD.unpack(index.read(record_size))
+        return offset + length == spool_size
+
+    @staticmethod
+    def ensure():
+        """
+        Приводит журнал и индекс в согласованное состояние (под эксклюзивной блокировкой).
+
+        Нет журнала - создается, в него переносятся письма старого формата
+        (email_*.json). Журнал есть, а индекс потерян или не совпадает с ним
+        (оборванная запись, сбой между записью в журнал и в индекс) - индекс
+        достраивается чтением журнала; письма журнала не удаляются.
+        """
+        if EmailSpool.is_consistent():
+            return
+
+        if not EmailSpool.spool_path().exists():
+            with open(EmailSpool.spool_path(), 'xb') as spool, open(EmailSpool.index_path(), 'wb') as index:
+                for legacy_file in sorted(EmailSpool.spool_dir().glob('email_*.json')):
+                    with open(legacy_file, 'r', encoding='utf-8') as f:
+                        email_data = json.load(f)
+                    line = (json.dumps(email_data, ensure_ascii=False) + '\n').encode('utf-8')
+                    offset = spool.tell()
+                    spool.write(line)
+                    index.write(EmailSpool.index_record(offset, len(line), email_data))
+            return
+
+        EmailSpool._reindex()
+
+    @staticmethod
+    def _reindex():
+        record_size = EmailSpool.INDEX_RECORD.size
+        spool_size = EmailSpool.spool_path().stat().st_size
+
+        # Целые записи индекса, указывающие внутрь журнала
+        records = b''
+        if EmailSpool.index_path().exists():
+            with open(EmailSpool.index_path(), 'rb') as index:
+                data = index.read()
+            records = data[:len(data) - len(data) % record_size]
+        end = 0
+        if records:
+            offset, length, _, _ = EmailSpool.INDEX_RECORD.unpack(records[-record_size:])
+            end = offset + length
+        if end > spool_size:
+            # Журнал короче индекса - индекс строится с начала
+            records, end = b'', 0
+
+        restored = 0
+        with open(EmailSpool.spool_path(), 'r+b') as spool, open(EmailSpool.index_path(), 'wb') as index:
+            index.write(records)
+            spool.seek(end)
+            for line in spool:
+                if not line.endswith(b'\n'):
+                    # Оборванная последняя строка - отрезается, чтобы следующее письмо начиналось с новой строки
+                    spool.truncate(end)
+                    break
+                try:
+                    email_data = json.loads(line)
+                except ValueError:
+                    email_data = {}
+                index.write(EmailSpool.index_record(end, len(line), email_data))
+                end += len(line)
+                restored += 1
+
+        logger.warning(f"Индекс журнала email восстановлен: добавлено записей {restored}")
+
+    @staticmethod
+    def read_page(limit=20, before=None, to=None, email_type=None):
+        wanted_type = EmailSpool.EMAIL_TYPES.get(email_type, 0) if email_type else None
+        wanted_hash = EmailSpool.recipient_hash(to) if to else None
+
+        # Читатели не мешают друг другу; сжатие журнала заменяет оба файла
+        # под эксклюзивной блокировкой и ждет их
+        with EmailSpool.lock(shared=True):
+            ready = EmailSpool.is_consistent()
+            if ready:
+                matches, emails = EmailSpool._read_matches(limit, before, to, wanted_type, wanted_hash)
+        if not ready:
+            with EmailSpool.lock():
+                EmailSpool.ensure()
+                matches, emails = EmailSpool._read_matches(limit, before, to, wanted_type, wanted_hash)
+
+        next_cursor = matches[-1][0] if len(matches) == limit and matches[-1][0] > 0 else None
+        return emails, next_cursor
+
+    @staticmethod
+    def _read_matches(limit, before, to, wanted_type, wanted_hash):
+        record_size = EmailSpool.INDEX_RECORD.size
+        matches = []
+        with open(EmailSpool.index_path(), 'rb') as index:
+            total = index.seek(0, os.SEEK_END) // record_size
+            position = total if before is None else max(0, min(int(before), total))
+
+            # Индекс читается с конца блоками фиксированного размера
+            while position > 0 and len(matches) < limit:
+                chunk_start = max(0, position - EmailSpool.READ_CHUNK)
+                index.seek(chunk_start * record_size)
+                chunk = index.read((position - chunk_start) * record_size)
+                records = list(EmailSpool.INDEX_RECORD.iter_unpack(chunk))
+
+                for number in range(len(records) - 1, -1, -1):
+                    offset, length, type_code, rcpt_hash = records[number]
+                    if wanted_type is not None and type_code != wanted_type:
+                        continue
+                    if wanted_hash is not None and rcpt_hash != wanted_hash:
+                        continue
+                    matches.append((chunk_start + number, offset, length))
+                    if len(matches) == limit:
+                        break
+
+                position = chunk_start
+
         emails = []
-        for file in emails_dir.glob('email_*.json'):
-            with open(file, 'r', encoding='utf-8') as f:
-                emails.append(json.load(f))
-        
-        return emails
\ No newline at end of file
+        with open(EmailSpool.spool_path(), 'rb') as spool:
+            for number, offset, length in matches:
+                spool.seek(offset)
+                email_data = json.loads(spool.read(length))
+                # Хэш получателя мог совпасть случайно
+                if to and (email_data.get('to') or '').strip().lower() != to.strip().lower():
+                    continue
+                email_data['id'] = number
+                emails.append(email_data)
+
+        return matches, emails
+
+    @staticmethod
+    def compact(before):
+        """
+        Удаляет из журнала письма старше before (datetime).
+
+        Письма дописываются в хронологическом порядке, поэтому удаляется
+        префикс журнала: остаток копируется в новые файлы, которые атомарно
+        заменяют старые. Номера записей (курсоры страниц) при этом сдвигаются.
+        Возвращает количество удаленных писем.
+        """
+        with EmailSpool.lock():
+            EmailSpool.ensure()
+            with open(EmailSpool.index_path(), 'rb') as index, open(EmailSpool.spool_path(), 'rb') as spool:
+                records = list(EmailSpool.INDEX_RECORD.iter_unpack(index.read()))
+
+                expired = 0
+                for offset, length, _, _ in records:
+                    spool.seek(offset)
+                    timestamp = json.loads(spool.read(length)).get('timestamp')
+                    if not timestamp or datetime.fromisoformat(timestamp) >= before:
+                        break
+                    expired += 1
+                if not expired:
+                    return 0
+
+                cut = records[expired][0] if expired < len(records) else spool.seek(0, os.SEEK_END)
+                spool_tmp = EmailSpool.spool_path().with_suffix('.jsonl.tmp')
+                index_tmp = EmailSpool.index_path().with_suffix('.idx.tmp')
+                with open(spool_tmp, 'wb') as new_spool:
+                    spool.seek(cut)
+                    shutil.copyfileobj(spool, new_spool)
+                with open(index_tmp, 'wb') as new_index:
+                    for offset, length, type_code, rcpt_hash in records[expired:]:
+                        new_index.write(EmailSpool.INDEX_RECORD.pack(offset - cut, length, type_code, rcpt_hash))
+
+            os.replace(spool_tmp, EmailSpool.spool_path())
+            os.replace(index_tmp, EmailSpool.index_path())
+
+        logger.info(f"Журнал email: удалено {expired} писем старше {before}")
+        return expired
@@ -0,0 +1,93 @@
+"""
+Внутрипроцессная шина событий о заказах для магазинов.
+
+Заменитель pub/sub брокера (например, Redis): подписчики - открытые
+SSE-соединения магазинов в этом процессе. Публикация безопасна из любого
+потока (синхронные view и сигналы работают в пуле потоков ASGI),
+события доставляются в event loop подписчика.
+
+При нескольких процессах каждый процесс видит только свои события,
+поэтому для такого развертывания шину нужно заменить внешним брокером
+с тем же интерфейсом publish/subscribe.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Подписка одного соединения на события магазина."""
+
+    def __init__(self, broker, shop_id, max_pending):
+        self.broker = broker
+        self.shop_id = shop_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def deliver(self, event):
+        # Вызывается в event loop подписчика; медленный клиент теряет
+        # самые новые события, но не блокирует публикацию
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(f"Очередь событий магазина {self.shop_id} переполнена, событие пропущено")
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class OrderEventBroker:
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def subscribe(self, shop_id, max_pending=100):
+        """Подписаться на события магазина. Вызывается из event loop."""
+        subscription = Subscription(self, shop_id, max_pending)
+        with self.lock:
+            self.subscriptions.setdefault(shop_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            shop_subscriptions = self.subscriptions.get(subscription.shop_id)
+            if shop_subscriptions:
+                shop_subscriptions.discard(subscription)
+                if not shop_subscriptions:
+                    del self.subscriptions[subscription.shop_id]
+
+    def subscriber_count(self, shop_id=None):
+        with self.lock:
+            if shop_id is not None:
+                return len(self.subscriptions.get(shop_id, ()))
+            return sum(len(subscriptions) for subscriptions in self.subscriptions.values())
+
+    def publish(self, shop_ids, event):
+        """Отправить событие всем подписчикам магазинов. Возвращает число получателей."""
+        event = {'id': next(self.ids), **event}
+        with self.lock:
+            targets = [
+                subscription
+                for shop_id in set(shop_ids)
+                for subscription in self.subscriptions.get(shop_id, ())
+            ]
+
+        delivered = 0
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+                delivered += 1
+            except RuntimeError:
+                # Event loop соединения уже закрыт
+                self.unsubscribe(subscription)
+        return delivered
+
+
+broker = OrderEventBroker()
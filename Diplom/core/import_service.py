@@ -0,0 +1,267 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache_warmup import CatalogCacheWarmer
+from .catalog_cache import bump_catalog_versions
+from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, PriceHistory
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogImportError(Exception):
+    pass
+
+
+class CatalogImportService:
+    """
+    Импорт прайс-листа магазина с двойной буферизацией.
+
+    Новые товары пишутся в отдельную (staging) версию прайс-листа короткими
+    транзакциями, пока покупатели продолжают читать опубликованную версию.
+    Когда импорт завершен, указатель Shop.catalog_version атомарно
+    переключается на новую версию. Предыдущая версия хранится до следующего
+    импорта, чтобы можно было откатиться.
+    """
+
+    BATCH_SIZE = 500
+    DELTA_FIELDS = ('quantity', 'price', 'price_rrc')
+
+    @staticmethod
+    def import_shop_data(user, data):
+        # 1. Магазин и категории - короткая транзакция
+        with transaction.atomic():
+            shop, created = Shop.objects.get_or_create(
+                name=data['shop'],
+                user=user
+            )
+
+            if created:
+                shop.url = data.get('url', '')
+                shop.save()
+
+            for category_data in data.get('categories', []):
+                category, _ = Category.objects.get_or_create(
+                    id=category_data.get('id'),
+                    defaults={'name': category_data['name']}
+                )
+
+                if category.name != category_data['name']:
+                    category.name = category_data['name']
+                    category.save()
+
+                category.shops.add(shop)
+
+            published_version, staging_version = CatalogImportService._next_version(shop)
+        old_prices = CatalogImportService._current_prices(
+            ProductInfo.objects.filter(shop=shop).only('product_id', 'external_id', 'price', 'price_rrc')
+        )
+
+        # 2. Товары - в staging-версию пачками
+        goods = data.get('goods', [])
+        new_prices = {}
+        try:
+            for start in range(0, len(goods), CatalogImportService.BATCH_SIZE):
+                batch = goods[start:start + CatalogImportService.BATCH_SIZE]
+                with transaction.atomic():
+                    product_infos = CatalogImportService._write_batch(shop, staging_version, batch)
+                new_prices.update(CatalogImportService._current_prices(product_infos))
+
+            # 3. Публикация новой версии
+            CatalogImportService._publish(shop, published_version, staging_version)
+        except Exception:
+            ProductInfo.all_versions.filter(shop=shop, version=staging_version).delete()
+            raise
+
+        # 4. История цен - только реально изменившиеся позиции
+        PriceHistory.objects.bulk_create(
+            PriceHistory.entries_for_changes(shop.id, old_prices, new_prices, timezone.now()),
+            batch_size=CatalogImportService.BATCH_SIZE
+        )
+
+        # 5. Версии старше предыдущей больше не нужны; более новые - это
+        # staging параллельного импорта, их не трогаем
+        ProductInfo.all_versions.filter(shop=shop, version__lt=published_version).delete()
+
+        return shop, len(goods)
+
+    @staticmethod
+    def apply_deltas(shop, deltas):
+        """
+        Точечное обновление остатков и цен опубликованной версии прайс-листа.
+
+        Изменения применяются пакетными UPDATE по (shop, external_id),
+        инвалидируется только кэш этого магазина.
+        """
+        deltas = {delta['external_id']: delta for delta in deltas}
+        product_infos = ProductInfo.objects.filter(
+            shop=shop,
+            external_id__in=deltas.keys()
+        ).only('id', 'external_id', 'product_id', *CatalogImportService.DELTA_FIELDS)
+
+        found = set()
+        changed = []
+        changed_fields = set()
+        old_prices = {}
+        for product_info in product_infos:
+            found.add(product_info.external_id)
+            old_prices[(product_info.product_id, product_info.external_id)] = (
+                product_info.price, product_info.price_rrc
+            )
+            delta = deltas[product_info.external_id]
+            fields = [
+                field for field in CatalogImportService.DELTA_FIELDS
+                if field in delta and getattr(product_info, field) != delta[field]
+            ]
+            if fields:
+                for field in fields:
+                    setattr(product_info, field, delta[field])
+                changed.append(product_info)
+                changed_fields.update(fields)
+
+        if changed:
+            with transaction.atomic():
+                ProductInfo.all_versions.bulk_update(
+                    changed,
+                    sorted(changed_fields),
+                    batch_size=CatalogImportService.BATCH_SIZE
+                )
+                PriceHistory.objects.bulk_create(PriceHistory.entries_for_changes(
+                    shop.id,
+                    old_prices,
+                    CatalogImportService._current_prices(changed),
+                    timezone.now()
+                ))
+            bump_catalog_versions([shop.id])
+
+        return len(changed), sorted(deltas.keys() - found)
+
+    @staticmethod
+    def rollback(shop):
+        """Вернуть магазину предыдущую версию прайс-листа."""
+        previous = shop.previous_catalog_version
+        if previous is None or not ProductInfo.all_versions.filter(shop=shop, version=previous).exists():
+            raise CatalogImportError(f'Для магазина {shop.name} нет предыдущей версии прайс-листа')
+
+        old_prices = CatalogImportService._current_prices(
+            ProductInfo.objects.filter(shop=shop).only('product_id', 'external_id', 'price', 'price_rrc')
+        )
+        CatalogImportService._publish(shop, shop.catalog_version, previous)
+        PriceHistory.objects.bulk_create(PriceHistory.entries_for_changes(
+            shop.id,
+            old_prices,
+            CatalogImportService._current_prices(
+                ProductInfo.objects.filter(shop=shop).only('product_id', 'external_id', 'price', 'price_rrc')
+            ),
+            timezone.now()
+        ))
+        return previous
+
+    @staticmethod
+    def _next_version(shop):
+        """
+        Выделить новую staging-версию: (опубликованная версия, новая версия).
+
+        Счетчик увеличивается одним UPDATE, строка магазина заблокирована до
+        конца транзакции - параллельный импорт получит следующий номер и не
+        запишет товары в чужую версию.
+        """
+        Shop.objects.filter(pk=shop.pk).update(last_catalog_version=F('last_catalog_version') + 1)
+        shop.refresh_from_db(fields=['catalog_version', 'previous_catalog_version', 'last_catalog_version'])
+        return shop.catalog_version, shop.last_catalog_version
+
+    @staticmethod
+    def _current_prices(product_infos):
+        return {(pi.product_id, pi.external_id): (pi.price, pi.price_rrc) for pi in product_infos}
+
+    @staticmethod
+    def _product_key(product_data):
+        # Как значения из БД: в YAML название или категория могут быть числом или строкой
+        return str(product_data['name']), int(product_data['category'])
+
+    @staticmethod
+    def _write_batch(shop, version, goods):
+        # Товары пачки: существующие одним запросом, новые - одним bulk_create
+        keys = {CatalogImportService._product_key(product_data) for product_data in goods}
+        products = {}
+        for product in Product.objects.filter(
+            name__in={name for name, _ in keys},
+            category_id__in={category_id for _, category_id in keys}
+        ).order_by('id'):
+            products.setdefault((product.name, product.category_id), product)
+        new_products = [
+            Product(name=name, category_id=category_id)
+            for name, category_id in keys - products.keys()
+        ]
+        for product in Product.objects.bulk_create(new_products):
+            products[(product.name, product.category_id)] = product
+
+        product_infos = ProductInfo.all_versions.bulk_create([
+            ProductInfo(
+                product=products[CatalogImportService._product_key(product_data)],
+                shop=shop,
+                external_id=product_data['id'],
+                model=product_data.get('model', ''),
+                quantity=product_data['quantity'],
+                price=product_data['price'],
+                price_rrc=product_data['price_rrc'],
+                version=version,
+                parameters_json={
+                    str(param_name): str(param_value)
+                    for param_name, param_value in product_data.get('parameters', {}).items()
+                }
+            )
+            for product_data in goods
+        ])
+
+        # Имена параметров из YAML бывают числами, а в БД - строки
+        param_names = {
+            str(name)
+            for product_data in goods
+            for name in product_data.get('parameters', {})
+        }
+        parameters = {p.name: p for p in Parameter.objects.filter(name__in=param_names)}
+        parameters.update(
+            (parameter.name, parameter)
+            for parameter in Parameter.objects.bulk_create(
+                Parameter(name=name) for name in param_names - parameters.keys()
+            )
+        )
+
+        ProductParameter.objects.bulk_create([
+            ProductParameter(
+                product_info=product_info,
+                parameter=parameters[str(param_name)],
+                value=str(param_value)
+            )
+            for product_info, product_data in zip(product_infos, goods)
+            for param_name, param_value in product_data.get('parameters', {}).items()
+        ])
+
+        return product_infos
+
+    @staticmethod
+    def _publish(shop, expected_version, new_version):
+        # Атомарное переключение указателя: если за время импорта другой
+        # импорт уже опубликовал свою версию, не затираем его
+        with transaction.atomic():
+            updated = Shop.objects.filter(
+                pk=shop.pk,
+                catalog_version=expected_version
+            ).update(
+                catalog_version=new_version,
+                previous_catalog_version=expected_version
+            )
+        if not updated:
+            raise CatalogImportError(
+                f'Прайс-лист магазина {shop.name} был изменен параллельным импортом'
+            )
+
+        shop.previous_catalog_version = expected_version
+        shop.catalog_version = new_version
+        bump_catalog_versions([shop.id])
+        # Кэш новой версии заполняется до прихода покупателей
+        CatalogCacheWarmer.schedule()
+        logger.info(f"Магазин {shop.name}: опубликована версия прайс-листа {new_version}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.retention import RetentionService
+
+
+class Command(BaseCommand):
+    help = 'Перенос закрытых заказов в архив, очистка корзин, токенов, очередей и журнала писем'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--pause', type=float, default=None, help='Пауза (сек) между пачками')
+
+    def handle(self, *args, **options):
+        stats = RetentionService.run(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f"В архив: {stats['archived_orders']}, корзин: {stats['baskets']}, "
+            f"токенов: {stats['confirm_tokens']}, записей очередей: {stats['queued_emails']}, "
+            f"писем журнала: {stats['spool_emails']}"
+        ))
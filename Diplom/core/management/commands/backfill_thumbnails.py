@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from core.thumbnails import ThumbnailPipeline
+
+
+class Command(BaseCommand):
+    help = 'Параллельная генерация миниатюр для всего каталога'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов (по умолчанию - по числу ядер)')
+        parser.add_argument('--chunk-size', type=int, default=16)
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Только товары без сохраненного хэша изображения')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['missing_only']:
+            products = products.filter(image_hash='')
+
+        started = time.perf_counter()
+
+        def progress(done, total, path, error):
+            if error:
+                self.stderr.write(f'{path}: {error}')
+            if done % 1000 == 0 or done == total:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{done}/{total} ({done / elapsed:.0f} изобр./с)')
+
+        stats = ThumbnailPipeline.backfill(
+            products,
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            progress=progress
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Исходников: {stats['sources']}, уникальных: {stats['unique']}, "
+            f"создано миниатюр: {stats['created']}, ошибок: {stats['errors']} "
+            f"за {time.perf_counter() - started:.1f} с"
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.email_delivery import EmailDeliveryService
+
+
+class Command(BaseCommand):
+    help = 'Доставка писем из очереди пачками (одно SMTP-соединение на пачку)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Пауза (сек) в режиме --loop, когда отправлять нечего '
+                                 '(очередь пуста или письма только отложены)')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = EmailDeliveryService.deliver_batch(options['batch_size'])
+            if any(stats.values()):
+                self.stdout.write(f"Отправлено: {stats['sent']}, повтор: {stats['retry']}, "
+                                  f"ошибок: {stats['failed']}, отложено: {stats['deferred']}")
+            # Если письма только откладывались (лимит домена, сервер недоступен),
+            # следующая пачка сразу не нужна - пауза, как при пустой очереди
+            if stats['sent'] or stats['retry'] or stats['failed']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Очередь писем обработана'))
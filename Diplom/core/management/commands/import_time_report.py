@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в отдельном процессе: холодный старт, ничего не импортировано заранее.
+# __import__, а не importlib.import_module: -X importtime не отмечает импорт
+# через importlib (так же Django загружает приложения - их модули видны
+# в отчете только по вложенным импортам)
+STARTUP_SCRIPT = """
+import sys
+import django
+django.setup()
+from django.conf import settings
+for module in sys.argv[1:] or [settings.ROOT_URLCONF]:
+    __import__(module)
+"""
+
+
+def parse_importtime(output):
+    """Строки -X importtime -> [(модуль, собственное время, суммарное время)] в микросекундах."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue  # заголовок
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Время импорта модулей при холодном старте процесса (python -X importtime): '
+        'самые дорогие модули и пакеты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settings-module', default=None,
+            help='Настройки запускаемого процесса (по умолчанию текущие), '
+                 'например myproject.settings_worker'
+        )
+        parser.add_argument(
+            '--module', action='append', default=[],
+            help='Что импортировать после django.setup() (можно несколько раз); '
+                 'по умолчанию ROOT_URLCONF, как первый запрос веб-воркера'
+        )
+        parser.add_argument('--top', type=int, default=20, help='Сколько модулей и пакетов показать')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        if options['settings_module']:
+            env['DJANGO_SETTINGS_MODULE'] = options['settings_module']
+
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT, *options['module']],
+            env=env, capture_output=True, text=True
+        )
+        wall_time = time.perf_counter() - start
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        modules = parse_importtime(result.stderr)
+        packages = defaultdict(int)
+        for name, self_us, _ in modules:
+            packages[name.split('.')[0]] += self_us
+        top = options['top']
+
+        self.stdout.write(
+            f"Настройки: {env.get('DJANGO_SETTINGS_MODULE')}, модулей: {len(modules)}, "
+            f"импорт: {sum(packages.values()) / 1000:.0f} мс, процесс целиком: {wall_time * 1000:.0f} мс"
+        )
+        self.stdout.write('\nПакеты (собственное время модулей), мс:')
+        for package, total_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f'  {total_us / 1000:8.1f}  {package}')
+        self.stdout.write('\nМодули (с вложенными импортами), мс:')
+        for name, _, cumulative_us in sorted(modules, key=lambda module: -module[2])[:top]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f}  {name}')
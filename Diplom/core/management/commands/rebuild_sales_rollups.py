@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.sales_rollup import SalesRollupService
+
+
+class Command(BaseCommand):
+    help = 'Пересчет дневных агрегатов продаж по магазинам и товарам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help='Начало периода, ГГГГ-ММ-ДД (по умолчанию - вся история)')
+        parser.add_argument('--date-to', help='Конец периода, ГГГГ-ММ-ДД')
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('date_from', 'date_to'):
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if dates[name] is None:
+                    raise CommandError(f'Неверная дата: {options[name]}')
+
+        rows = SalesRollupService.rebuild(**dates)
+        self.stdout.write(self.style.SUCCESS(f'Агрегаты продаж пересчитаны, строк по товарам: {rows}'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Диспетчер outbox: передача задач в Celery или их локальное выполнение без брокера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=OutboxDispatcher.MODES, default=None,
+                            help='celery - публиковать в брокер, local - выполнять в этом процессе')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help='Работать постоянно')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Пауза (сек) при пустом outbox в режиме --loop')
+
+    def handle(self, *args, **options):
+        dispatcher = OutboxDispatcher(mode=options['mode'], batch_size=options['batch_size'])
+
+        while True:
+            stats = dispatcher.dispatch_batch()
+            if any(stats.values()):
+                self.stdout.write(f"Выполнено: {stats['done']}, повтор: {stats['retry']}, ошибок: {stats['failed']}")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Outbox обработан'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.cache_warmup import CatalogCacheWarmer
+from core.catalog_cache import query_recorder
+from core.checks import cache_is_shared
+
+
+class Command(BaseCommand):
+    help = 'Прогрев кэша каталога самыми частыми запросами (после деплоя или импорта)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None, help='Сколько самых частых запросов повторить')
+        parser.add_argument('--rate', type=float, default=None, help='Не больше N запросов в секунду')
+        parser.add_argument('--days', type=int, default=None, help='Учитывать запросы за последние N дней')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # Кэш в памяти процесса пропадет вместе с командой
+            raise CommandError(
+                'Кэш по умолчанию хранится в памяти процесса - прогрев не дойдет до веб-процессов. '
+                'Настройте общий кэш (Redis) в CACHES'
+            )
+        query_recorder.flush()
+        stats = CatalogCacheWarmer.warm(limit=options['top'], rate=options['rate'], window_days=options['days'])
+        if stats is None:
+            self.stdout.write(self.style.WARNING('Прогрев уже выполняется другим процессом'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Запросов: {stats['queries']}, прогрето: {stats['warmed']}, "
+            f"уже в кэше: {stats['cached']}, ошибок: {stats['errors']}"
+        ))
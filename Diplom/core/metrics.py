@@ -0,0 +1,216 @@
+"""
+Метрики запросов в текстовом формате Prometheus.
+
+MetricsMiddleware замеряет для каждого маршрута время ответа, число и
+время SQL-запросов и размер ответа; попадания в кэши отмечаются через
+record_cache_lookup(). Значения копятся в памяти процесса (у каждого
+воркера свои) и отдаются view metrics в формате text/plain 0.0.4.
+
+SQL-запросы считает execute wrapper, который ставится на каждое новое
+соединение (сигнал connection_created). Статистика текущего запроса
+лежит в contextvar, поэтому учитываются и запросы async view, идущие
+через пул потоков. Вне запроса wrapper только читает contextvar.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Границы корзин гистограмм (le)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+QUERY_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Счетчики одного запроса; trace - список для записи SQL (профилировщик)."""
+    __slots__ = ('queries', 'query_time', 'trace')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.trace = None
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Последняя ячейка - значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    HISTOGRAMS = {
+        'http_request_duration_seconds': ('Время обработки запроса', LATENCY_BUCKETS),
+        'http_request_db_queries': ('SQL-запросов на запрос', QUERY_COUNT_BUCKETS),
+        'http_request_db_duration_seconds': ('Время SQL-запросов на запрос', QUERY_TIME_BUCKETS),
+        'http_response_size_bytes': ('Размер тела ответа', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.histograms = {name: {} for name in self.HISTOGRAMS}
+            self.cache_lookups = {}
+
+    def observe_request(self, route, method, status, duration, stats, size=None):
+        labels = (('route', route), ('method', method))
+        values = {
+            'http_request_duration_seconds': duration,
+            'http_request_db_queries': stats.queries,
+            'http_request_db_duration_seconds': stats.query_time,
+            'http_response_size_bytes': size,
+        }
+        with self.lock:
+            key = labels + (('status', str(status)),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in values.items():
+                if value is None:
+                    continue
+                histogram = self.histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self.histograms[name][labels] = Histogram(self.HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def record_cache_lookup(self, cache_name, hit):
+        key = (('cache', cache_name), ('result', 'hit' if hit else 'miss'))
+        with self.lock:
+            self.cache_lookups[key] = self.cache_lookups.get(key, 0) + 1
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        with self.lock:
+            self._render_counter(lines, 'http_requests_total', 'Обработано запросов', self.requests)
+            for name, (description, _) in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels + (('le', str(bound)),))
+                        lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+            self._render_counter(lines, 'cache_lookups_total', 'Обращения к кэшам', self.cache_lookups)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_counter(lines, name, description, values):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(values.items()):
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+
+
+def _format_labels(labels):
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+registry = MetricsRegistry()
+
+
+def record_cache_lookup(cache_name, hit):
+    registry.record_cache_lookup(cache_name, hit)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper: время SQL-запросов текущего запроса."""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats.queries += 1
+        stats.query_time += duration
+        if stats.trace is not None:
+            stats.trace.append((context['connection'].alias, sql, params, many, duration))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Обработчик connection_created."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def current_request_stats():
+    """Счетчики текущего запроса или None вне MetricsMiddleware."""
+    return _request_stats.get()
+
+
+def start_request_stats():
+    """Новые счетчики для текущего контекста. Возвращает (stats, token для reset_request_stats)."""
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def reset_request_stats(token):
+    _request_stats.reset(token)
+
+
+class MetricsMiddleware:
+    """Замер времени, SQL-запросов и размера ответа по маршрутам."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = start_request_stats()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_stats(token)
+        self.observe(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = start_request_stats()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_request_stats(token)
+        self.observe(request, response, time.perf_counter() - start, stats)
+        return response
+
+    @staticmethod
+    def observe(request, response, duration, stats):
+        match = request.resolver_match
+        # Шаблон маршрута, а не путь: число рядов метрик не растет с числом ID
+        route = '/' + match.route if match is not None else 'unmatched'
+        # Длина потокового ответа заранее не известна
+        size = None if response.streaming else len(response.content)
+        registry.observe_request(route, request.method, response.status_code, duration, stats, size)
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.11 on 2026-10-19 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_product_image'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='productinfo',
+            name='unique_product_info',
+        ),
+        migrations.AddField(
+            model_name='productinfo',
+            name='version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия прайс-листа'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия прайс-листа'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='previous_catalog_version',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Предыдущая версия прайс-листа'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'version'], name='product_info_shop_version'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinfo',
+            constraint=models.UniqueConstraint(fields=('product', 'shop', 'external_id', 'version'), name='unique_product_info'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-19 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_catalog_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='price_list_etag',
+            field=models.CharField(blank=True, max_length=255, verbose_name='ETag прайс-листа'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='price_list_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш прайс-листа'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='price_list_last_modified',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Last-Modified прайс-листа'),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='price_list_synced_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последняя синхронизация'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.11 on 2026-10-19 07:16
+
+from django.db import migrations, models
+
+
+def fill_parameters_json(apps, schema_editor):
+    ProductInfo = apps.get_model('core', 'ProductInfo')
+    ProductParameter = apps.get_model('core', 'ProductParameter')
+
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.values_list(
+            'product_info_id', 'parameter__name', 'value').iterator():
+        parameters.setdefault(product_info_id, {})[name] = value
+
+    product_infos = list(ProductInfo.objects.only('id'))
+    for product_info in product_infos:
+        product_info.parameters_json = parameters.get(product_info.id, {})
+    ProductInfo.objects.bulk_update(product_infos, ['parameters_json'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_price_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='parameters_json',
+            field=models.JSONField(blank=True, null=True, verbose_name='Параметры'),
+        ),
+        migrations.RunPython(fill_parameters_json, migrations.RunPython.noop),
+    ]
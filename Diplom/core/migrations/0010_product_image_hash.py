@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-19 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш изображения'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.11 on 2026-10-19 07:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_product_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogQueryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=500, unique=True, verbose_name='Параметры запроса')),
+                ('hits', models.PositiveBigIntegerField(default=0, verbose_name='Запросов')),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний запрос')),
+            ],
+            options={
+                'verbose_name': 'Статистика запросов каталога',
+                'verbose_name_plural': 'Статистика запросов каталога',
+                'indexes': [models.Index(fields=['last_seen', 'hits'], name='catalog_query_recent')],
+            },
+        ),
+    ]
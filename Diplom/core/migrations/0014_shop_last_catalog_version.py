@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def init_last_catalog_version(apps, schema_editor):
+    # Счетчик начинается с наибольшей из уже записанных версий
+    Shop = apps.get_model('core', 'Shop')
+    ProductInfo = apps.get_model('core', 'ProductInfo')
+    max_versions = dict(
+        ProductInfo.objects.values('shop_id').annotate(max_version=Max('version')).values_list('shop_id', 'max_version')
+    )
+    for shop in Shop.objects.all():
+        shop.last_catalog_version = max(max_versions.get(shop.id) or 0, shop.catalog_version)
+        shop.save(update_fields=['last_catalog_version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='last_catalog_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Последняя выданная версия прайс-листа'),
+        ),
+        migrations.RunPython(init_last_catalog_version, migrations.RunPython.noop),
+    ]
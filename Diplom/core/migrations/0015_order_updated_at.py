@@ -0,0 +1,30 @@
+# Generated by Django 5.2.11 on 2026-10-19 08:46
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def init_updated_at(apps, schema_editor):
+    # Истории изменений нет - берется время создания заказа
+    Order = apps.get_model('core', 'Order')
+    Order.objects.update(updated_at=F('dt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_shop_last_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменен'),
+        ),
+        migrations.RunPython(init_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'updated_at'], name='order_status_updated'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-19 09:22
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def init_confirmed_at(apps, schema_editor):
+    # Время подтверждения не сохранялось - как и агрегаты до сих пор,
+    # датируем подтвержденные заказы временем создания
+    for model_name in ('Order', 'ArchivedOrder'):
+        model = apps.get_model('core', model_name)
+        model.objects.exclude(status='basket').update(confirmed_at=F('dt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='confirmed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Подтвержден'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='confirmed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Подтвержден'),
+        ),
+        migrations.RunPython(init_confirmed_at, migrations.RunPython.noop),
+    ]
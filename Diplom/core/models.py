@@ -2,6 +2,7 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
 
@@ -17,6 +18,20 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+EMAIL_STATUS_CHOICES = (
+    ('pending', 'В очереди'),
+    ('sending', 'Отправляется'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),
+)
+
+OUTBOX_STATUS_CHOICES = (
+    ('pending', 'Ожидает'),
+    ('processing', 'Обрабатывается'),
+    ('done', 'Выполнено'),
+    ('failed', 'Ошибка'),
+)
+
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -88,6 +103,18 @@ class Shop(models.Model):
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
     state = models.BooleanField(verbose_name='статус получения заказов', default=True)
+    # Указатель на опубликованную версию прайс-листа (см. ProductInfo.version)
+    catalog_version = models.PositiveIntegerField(verbose_name='Версия прайс-листа', default=0)
+    previous_catalog_version = models.PositiveIntegerField(verbose_name='Предыдущая версия прайс-листа',
+                                                           null=True, blank=True)
+    # Счетчик выданных импорту версий: каждая staging-версия уникальна даже при параллельных импортах
+    last_catalog_version = models.PositiveIntegerField(verbose_name='Последняя выданная версия прайс-листа',
+                                                       default=0)
+    # Валидаторы последней загруженной версии файла по Shop.url (для условного GET)
+    price_list_etag = models.CharField(verbose_name='ETag прайс-листа', max_length=255, blank=True)
+    price_list_last_modified = models.CharField(verbose_name='Last-Modified прайс-листа', max_length=64, blank=True)
+    price_list_hash = models.CharField(verbose_name='Хэш прайс-листа', max_length=64, blank=True)
+    price_list_synced_at = models.DateTimeField(verbose_name='Последняя синхронизация', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -124,6 +151,10 @@ class Product(models.Model):
         resize_source=dict(size=(800, 800), sharpen=True)
     )
 
+    # SHA-256 содержимого изображения: по нему строятся имена миниатюр
+    # (см. core/thumbnails.py), одинаковые картинки обрабатываются один раз
+    image_hash = models.CharField(verbose_name='Хэш изображения', max_length=64, blank=True)
+
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = "Список продуктов"
@@ -131,14 +162,32 @@ class Product(models.Model):
 
     def __str__(self):
         return self.name
-    
-    image = ThumbnailerImageField(
-        verbose_name='Изображение',
-        upload_to='products/',
-        blank=True,
-        null=True,
-        resize_source=dict(size=(800, 800), sharpen=True)
-    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Файл изображения на момент загрузки - по нему сигналы определяют замену картинки
+        instance._loaded_image = dict(zip(field_names, values)).get('image', models.DEFERRED)
+        return instance
+
+
+class ProductInfoQuerySet(models.QuerySet):
+    def current(self):
+        # Только строки опубликованной версии прайс-листа магазина
+        return self.filter(version=models.F('shop__catalog_version'))
+
+
+class CurrentProductInfoManager(models.Manager):
+    """
+    Менеджер по умолчанию для ProductInfo.
+
+    Импорт пишет новую версию прайс-листа рядом с опубликованной, поэтому
+    все чтения (в том числе через related-менеджеры и prefetch_related)
+    должны видеть только версию, на которую указывает Shop.catalog_version.
+    """
+
+    def get_queryset(self):
+        return ProductInfoQuerySet(self.model, using=self._db).current()
 
 
 class ProductInfo(models.Model):
@@ -151,17 +200,84 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    version = models.PositiveIntegerField(verbose_name='Версия прайс-листа', default=0)
+    # Денормализованная копия ProductParameter: {название параметра: значение}
+    parameters_json = models.JSONField(verbose_name='Параметры', null=True, blank=True)
+
+    objects = CurrentProductInfoManager()
+    all_versions = ProductInfoQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = "Информационный список о продуктах"
         constraints = [
-            models.UniqueConstraint(fields=['product', 'shop', 'external_id'], name='unique_product_info'),
+            models.UniqueConstraint(fields=['product', 'shop', 'external_id', 'version'],
+                                    name='unique_product_info'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'version'], name='product_info_shop_version'),
         ]
 
     def __str__(self):
         return f'{self.product.name} - {self.shop.name}'
 
+    def refresh_parameters_json(self):
+        # Пересобирает JSON-копию параметров из таблиц ProductParameter/Parameter
+        self.parameters_json = {
+            product_parameter.parameter.name: product_parameter.value
+            for product_parameter in self.product_parameters.select_related('parameter')
+        }
+        ProductInfo.all_versions.filter(pk=self.pk).update(parameters_json=self.parameters_json)
+
+
+class PriceHistory(models.Model):
+    """
+    Журнал изменений цен (только добавление).
+
+    Запись создается только при реальном изменении цены. Время хранится
+    целым числом (unix time), а поле month (ГГГГММ) служит ключом
+    секционирования: запросы за период отсекают лишние месяцы по индексу.
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='price_history',
+                             on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='price_history',
+                                on_delete=models.CASCADE)
+    month = models.PositiveIntegerField(verbose_name='Месяц (ГГГГММ)')
+    ts = models.PositiveIntegerField(verbose_name='Время изменения (unix)')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+
+    class Meta:
+        verbose_name = 'Изменение цены'
+        verbose_name_plural = "История цен"
+        indexes = [
+            models.Index(fields=['product', 'shop', 'month', 'ts'], name='price_history_series'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}@{self.shop_id}: {self.price} ({self.ts})'
+
+    @staticmethod
+    def month_key(moment):
+        return moment.year * 100 + moment.month
+
+    @classmethod
+    def entries_for_changes(cls, shop_id, old_prices, new_prices, moment):
+        """
+        Записи истории для изменившихся цен.
+
+        old_prices / new_prices: {(product_id, external_id): (price, price_rrc)} -
+        у магазина может быть несколько позиций одного продукта
+        """
+        month = cls.month_key(moment)
+        ts = int(moment.timestamp())
+        return [
+            cls(shop_id=shop_id, product_id=product_id, month=month, ts=ts,
+                price=prices[0], price_rrc=prices[1])
+            for (product_id, external_id), prices in new_prices.items()
+            if old_prices.get((product_id, external_id)) != prices
+        ]
+
 
 class Parameter(models.Model):
     name = models.CharField(max_length=40, verbose_name='Название')
@@ -174,6 +290,14 @@ class Parameter(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        renamed = self.pk and Parameter.objects.filter(pk=self.pk).exclude(name=self.name).exists()
+        super().save(*args, **kwargs)
+        if renamed:
+            product_infos = ProductInfo.all_versions.filter(product_parameters__parameter=self).distinct()
+            for product_info in product_infos:
+                product_info.refresh_parameters_json()
+
 
 class ProductParameter(models.Model):
     product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте',
@@ -193,6 +317,17 @@ class ProductParameter(models.Model):
     def __str__(self):
         return f'{self.parameter.name}: {self.value}'
 
+    # Импорт пишет параметры через bulk_create вместе с JSON-копией,
+    # остальные изменения (админка) синхронизируются здесь
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.product_info.refresh_parameters_json()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.product_info.refresh_parameters_json()
+        return result
+
 
 class Contact(models.Model):
     CONTACT_TYPE_CHOICES = (
@@ -225,6 +360,12 @@ class Order(models.Model):
                              related_name='orders', blank=True,
                              on_delete=models.CASCADE)
     dt = models.DateTimeField(auto_now_add=True)
+    # Последнее изменение: смена статуса, правка заказа, позиции корзины.
+    # По нему отбираются брошенные корзины и закрытые заказы для архива
+    updated_at = models.DateTimeField(verbose_name='Изменен', auto_now=True)
+    # Первый переход из корзины в учитываемый статус; по нему датируются
+    # агрегаты продаж (dt - время создания корзины)
+    confirmed_at = models.DateTimeField(verbose_name='Подтвержден', null=True, blank=True)
     status = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15)
     contact = models.ForeignKey(Contact, verbose_name='Контакт',
                                 blank=True, null=True,
@@ -234,10 +375,25 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = "Список заказов"
         ordering = ('-dt',)
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='order_status_updated'),
+        ]
 
     def __str__(self):
         return f'Заказ №{self.id} от {self.dt.strftime("%d.%m.%Y %H:%M")}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус на момент загрузки - по нему сигналы определяют смену статуса
+        instance._loaded_status = dict(zip(field_names, values)).get('status')
+        return instance
+
+    def touch(self):
+        """Отметить изменение заказа без сохранения остальных полей (позиции корзины)."""
+        self.updated_at = timezone.now()
+        Order.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+
     def get_total_price(self):
         total = 0
         for item in self.items.all():
@@ -253,6 +409,8 @@ class OrderItem(models.Model):
     shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='order_items', blank=True,
                              on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество', default=1)
+    # Цена фиксируется при подтверждении заказа; пусто - у корзин и старых заказов
+    price_per_unit = models.PositiveIntegerField(verbose_name='Цена за единицу', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Заказанная позиция'
@@ -265,6 +423,10 @@ class OrderItem(models.Model):
         return f'{self.product.name} x {self.quantity}'
 
     def get_item_price(self):
+        # Подтвержденный заказ - по цене на момент подтверждения
+        if self.price_per_unit is not None:
+            return self.price_per_unit * self.quantity
+
         # Если у нас уже есть product_infos через prefetch_related
         if hasattr(self, '_prefetched_objects_cache') and 'product__product_infos' in self._prefetched_objects_cache:
             product_infos = self._prefetched_objects_cache['product__product_infos']
@@ -319,3 +481,179 @@ class ConfirmEmailToken(models.Model):
 
     def __str__(self):
         return f"Токен подтверждения для {self.user.email}"
+
+
+class QueuedEmail(models.Model):
+    """
+    Очередь исходящих email для пакетной доставки (см. core/email_delivery.py).
+
+    Письмо со статусом 'sending' захвачено воркером до next_attempt_at;
+    если воркер не успел его обработать, письмо снова становится доступным.
+    """
+    to = models.EmailField(verbose_name='Получатель')
+    domain = models.CharField(verbose_name='Домен получателя', max_length=255)
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст')
+    status = models.CharField(verbose_name='Статус', choices=EMAIL_STATUS_CHOICES, max_length=10,
+                              default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', default=timezone.now)
+    claim = models.CharField(verbose_name='Захвачено воркером', max_length=32, blank=True)
+    created_at = models.DateTimeField(verbose_name='Создано', auto_now_add=True)
+    sent_at = models.DateTimeField(verbose_name='Отправлено', null=True, blank=True)
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='queued_email_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.to}: {self.subject} ({self.get_status_display()})'
+
+
+class OutboxMessage(models.Model):
+    """
+    Транзакционный outbox для побочных эффектов запросов (письма и т.п.).
+
+    Запись создается в той же транзакции, что и бизнес-данные, и
+    обрабатывается диспетчером (core/outbox.py) после коммита: либо
+    передается в Celery, либо выполняется локально без брокера.
+    """
+    task = models.CharField(verbose_name='Задача', max_length=200)
+    payload = models.JSONField(verbose_name='Аргументы', default=dict)
+    status = models.CharField(verbose_name='Статус', choices=OUTBOX_STATUS_CHOICES, max_length=10,
+                              default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток', default=0)
+    available_at = models.DateTimeField(verbose_name='Доступно с', default=timezone.now)
+    claim = models.CharField(verbose_name='Захвачено диспетчером', max_length=32, blank=True)
+    created_at = models.DateTimeField(verbose_name='Создано', auto_now_add=True)
+    processed_at = models.DateTimeField(verbose_name='Обработано', null=True, blank=True)
+    last_error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+
+    class Meta:
+        verbose_name = 'Сообщение outbox'
+        verbose_name_plural = 'Outbox'
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_due'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} ({self.get_status_display()})'
+
+
+class CatalogQueryStat(models.Model):
+    """
+    Частота запросов к каталогу по нормализованным параметрам.
+
+    Накапливается из реального трафика ProductListView и используется
+    прогревом кэша после импорта и деплоя.
+    """
+    signature = models.CharField(verbose_name='Параметры запроса', max_length=500, unique=True)
+    hits = models.PositiveBigIntegerField(verbose_name='Запросов', default=0)
+    last_seen = models.DateTimeField(verbose_name='Последний запрос', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Статистика запросов каталога'
+        verbose_name_plural = 'Статистика запросов каталога'
+        indexes = [
+            models.Index(fields=['last_seen', 'hits'], name='catalog_query_recent'),
+        ]
+
+    def __str__(self):
+        return f'{self.signature or "(без фильтров)"}: {self.hits}'
+
+
+class ShopDailySales(models.Model):
+    """
+    Продажи магазина за день (агрегат по заказам).
+
+    Обновляется при подтверждении и смене статуса заказа
+    (core/sales_rollup.py), пересчитывается командой rebuild_sales_rollups.
+    """
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='daily_sales',
+                             on_delete=models.CASCADE)
+    date = models.DateField(verbose_name='Дата')
+    orders = models.IntegerField(verbose_name='Заказов', default=0)
+    units = models.IntegerField(verbose_name='Продано единиц', default=0)
+    revenue = models.BigIntegerField(verbose_name='Выручка', default=0)
+
+    class Meta:
+        verbose_name = 'Продажи магазина за день'
+        verbose_name_plural = 'Продажи магазинов по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'date'], name='unique_shop_daily_sales'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop} {self.date}: {self.revenue}'
+
+
+class ProductDailySales(models.Model):
+    """Продажи товара в магазине за день."""
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='product_daily_sales',
+                             on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='daily_sales',
+                                on_delete=models.CASCADE)
+    date = models.DateField(verbose_name='Дата')
+    units = models.IntegerField(verbose_name='Продано единиц', default=0)
+    revenue = models.BigIntegerField(verbose_name='Выручка', default=0)
+
+    class Meta:
+        verbose_name = 'Продажи товара за день'
+        verbose_name_plural = 'Продажи товаров по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'date', 'product'], name='unique_product_daily_sales'),
+        ]
+
+    def __str__(self):
+        return f'{self.product} ({self.shop}) {self.date}: {self.units}'
+
+
+class ArchivedOrder(models.Model):
+    """
+    Архив закрытых (доставленных и отмененных) заказов.
+
+    Заказ переносится сюда задачей хранения (core/retention.py) вместе с
+    позициями и снимком контакта, сохраняя свой ID, чтобы рабочие таблицы
+    и их индексы не росли бесконечно.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID заказа')
+    user = models.ForeignKey(User, verbose_name='Пользователь', related_name='archived_orders',
+                             on_delete=models.CASCADE)
+    dt = models.DateTimeField(verbose_name='Дата заказа')
+    confirmed_at = models.DateTimeField(verbose_name='Подтвержден', null=True, blank=True)
+    status = models.CharField(verbose_name='Статус', choices=STATE_CHOICES, max_length=15)
+    contact = models.JSONField(verbose_name='Контакт', null=True, blank=True)
+    total_price = models.BigIntegerField(verbose_name='Сумма', default=0)
+    archived_at = models.DateTimeField(verbose_name='Перенесен в архив', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архив заказов'
+        ordering = ('-dt',)
+
+    def __str__(self):
+        return f'Заказ №{self.id} от {self.dt.strftime("%d.%m.%Y %H:%M")} (архив)'
+
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, verbose_name='Заказ', related_name='items',
+                              on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='archived_order_items',
+                                null=True, blank=True, on_delete=models.SET_NULL)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='archived_order_items',
+                             null=True, blank=True, on_delete=models.SET_NULL)
+    product_name = models.CharField(verbose_name='Название продукта', max_length=80)
+    shop_name = models.CharField(verbose_name='Название магазина', max_length=50)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price_per_unit = models.PositiveIntegerField(verbose_name='Цена за единицу')
+
+    class Meta:
+        verbose_name = 'Позиция архивного заказа'
+        verbose_name_plural = 'Позиции архивных заказов'
+
+    def __str__(self):
+        return f'{self.product_name} x {self.quantity}'
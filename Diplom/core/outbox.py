@@ -0,0 +1,110 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(task, **kwargs):
+    """
+    Поставить задачу Celery в outbox.
+
+    Вызывается внутри транзакции запроса: задача будет выполнена только
+    если транзакция закоммитится, и запрос не ждет брокер.
+    """
+    return OutboxMessage.objects.create(task=task.name, payload=kwargs)
+
+
+class OutboxDispatcher:
+    """
+    Диспетчер outbox: забирает сообщения пачками и
+
+    - в режиме 'celery' публикует их в брокер (apply_async);
+    - в режиме 'local' выполняет задачи прямо в процессе диспетчера,
+      используя таблицу outbox как очередь (Redis не нужен).
+    """
+
+    MODES = ('celery', 'local')
+
+    def __init__(self, mode=None, batch_size=None):
+        self.mode = mode or settings.OUTBOX_DISPATCH_MODE
+        if self.mode not in self.MODES:
+            raise ValueError(f'Неизвестный режим диспетчера outbox: {self.mode}')
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+
+    @staticmethod
+    def resolve_task(name):
+        from celery import current_app
+        from . import tasks  # noqa: F401 - регистрирует задачи core
+
+        return current_app.tasks[name]
+
+    def claim_batch(self):
+        now = timezone.now()
+        due = OutboxMessage.objects.filter(
+            Q(status='pending') | Q(status='processing'),
+            available_at__lte=now
+        ).order_by('id').values_list('id', flat=True)[:self.batch_size]
+
+        claim = uuid.uuid4().hex
+        OutboxMessage.objects.filter(
+            Q(status='pending') | Q(status='processing'),
+            id__in=list(due),
+            available_at__lte=now
+        ).update(
+            status='processing',
+            claim=claim,
+            available_at=now + timedelta(seconds=settings.OUTBOX_LEASE)
+        )
+        return list(OutboxMessage.objects.filter(claim=claim, status='processing').order_by('id'))
+
+    def dispatch_batch(self):
+        batch = self.claim_batch()
+        stats = {'done': 0, 'retry': 0, 'failed': 0}
+
+        for message in batch:
+            message.attempts += 1
+            try:
+                task = self.resolve_task(message.task)
+                if self.mode == 'celery':
+                    task.apply_async(kwargs=message.payload)
+                else:
+                    result = task.apply(kwargs=message.payload)
+                    # Задачи core сообщают об ошибке, возвращая False
+                    if result.failed() or result.result is False:
+                        raise RuntimeError(f'Задача завершилась с ошибкой: {result.result}')
+            except Exception as e:
+                self._schedule_retry(message, e)
+                stats[message.status if message.status == 'failed' else 'retry'] += 1
+                continue
+
+            message.status = 'done'
+            message.processed_at = timezone.now()
+            message.last_error = ''
+            stats['done'] += 1
+
+        if batch:
+            OutboxMessage.objects.bulk_update(
+                batch,
+                ['status', 'attempts', 'available_at', 'processed_at', 'last_error']
+            )
+            logger.info(f"Outbox ({self.mode}): {stats}")
+        return stats
+
+    @staticmethod
+    def _schedule_retry(message, error):
+        message.last_error = str(error)
+        if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            message.status = 'failed'
+            logger.error(f"Сообщение outbox {message.id} ({message.task}) не обработано: {error}")
+            return
+        message.status = 'pending'
+        message.available_at = timezone.now() + timedelta(
+            seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1)
+        )
@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import zlib
+
+import requests
+import yaml
+from django.conf import settings
+from django.utils import timezone
+
+from .import_service import CatalogImportService
+from .models import Shop
+
+logger = logging.getLogger(__name__)
+
+
+class PriceListSyncService:
+    """
+    Периодическая синхронизация прайс-листов по Shop.url.
+
+    Каждый магазин опрашивается условным GET (If-None-Match / If-Modified-Since),
+    поэтому неизмененный прайс-лист стоит один ответ 304 без записи в БД.
+    Магазины распределены по окну опроса детерминированным смещением,
+    чтобы не обращаться ко всем серверам одновременно.
+    """
+
+    NOT_MODIFIED = 'not_modified'
+    UNCHANGED = 'unchanged'
+    IMPORTED = 'imported'
+
+    @staticmethod
+    def active_shops():
+        return Shop.objects.filter(
+            state=True,
+            user__isnull=False,
+            url__isnull=False
+        ).exclude(url='')
+
+    @staticmethod
+    def schedule_offset(shop_id, window=None):
+        """Смещение (в секундах) опроса магазина внутри окна синхронизации."""
+        window = window or settings.PRICE_LIST_SYNC_INTERVAL
+        return zlib.crc32(str(shop_id).encode()) % window
+
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def validators(response):
+        """Поля Shop, по которым следующая синхронизация узнает неизмененный прайс-лист."""
+        return {
+            'price_list_etag': response.headers.get('ETag', ''),
+            'price_list_last_modified': response.headers.get('Last-Modified', ''),
+            'price_list_hash': PriceListSyncService.content_hash(response.content),
+            'price_list_synced_at': timezone.now(),
+        }
+
+    @staticmethod
+    def sync_shop(shop):
+        headers = {}
+        if shop.price_list_etag:
+            headers['If-None-Match'] = shop.price_list_etag
+        if shop.price_list_last_modified:
+            headers['If-Modified-Since'] = shop.price_list_last_modified
+
+        response = requests.get(shop.url, headers=headers, timeout=settings.PRICE_LIST_SYNC_TIMEOUT)
+        if response.status_code == 304:
+            return PriceListSyncService.NOT_MODIFIED
+        response.raise_for_status()
+
+        validators = PriceListSyncService.validators(response)
+
+        # Сервер без валидаторов отдает файл целиком - сравниваем по содержимому
+        if validators['price_list_hash'] == shop.price_list_hash:
+            Shop.objects.filter(pk=shop.pk).update(**validators)
+            return PriceListSyncService.UNCHANGED
+
+        data = yaml.safe_load(response.content)
+        if not data or data.get('shop') != shop.name:
+            raise ValueError(f'Прайс-лист по адресу {shop.url} не относится к магазину {shop.name}')
+
+        CatalogImportService.import_shop_data(shop.user, data)
+        Shop.objects.filter(pk=shop.pk).update(**validators)
+        logger.info(f"Прайс-лист магазина {shop.name} обновлен по {shop.url}")
+        return PriceListSyncService.IMPORTED
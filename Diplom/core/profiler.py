@@ -0,0 +1,183 @@
+"""
+Профилирование отдельных запросов в production.
+
+Профилируется запрос с заголовком X-Profile, равным
+REQUEST_PROFILER_SECRET, или случайная доля REQUEST_PROFILER_SAMPLE_RATE
+запросов. Для каждого такого запроса в REQUEST_PROFILER_DIR пишутся:
+- <id>.prof - статистика cProfile (snakeviz, gprof2dot -f pstats, flameprof);
+- <id>.sql.json - метаданные запроса и все SQL-запросы с длительностью.
+Хранятся последние REQUEST_PROFILER_KEEP профилей, старые удаляются.
+Id профиля возвращается в заголовке ответа X-Profile-Id.
+
+Параметры SQL-запросов (токены, хэши паролей, персональные данные) и
+строка запроса URL на диск не пишутся - только число параметров.
+Сохранять их целиком можно только явно, REQUEST_PROFILER_CAPTURE_PARAMS.
+
+Если не задан ни секрет, ни доля, middleware отключается при загрузке
+(MiddlewareNotUsed) и в обработке запросов не участвует.
+В async view cProfile видит только поток event loop: SQL-запросы из
+пула потоков попадают в трассировку, но не в .prof.
+
+Одновременно профилируется только один запрос: cProfile не допускает
+нескольких активных профилировщиков (в Python 3.12+ enable() второго
+бросает исключение). Запрос, пришедший во время профилирования другого,
+обрабатывается без профиля.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+from .metrics import current_request_stats, reset_request_stats, start_request_stats
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+_profile_lock = threading.Lock()
+
+
+class RequestProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILER_SECRET and not settings.REQUEST_PROFILER_SAMPLE_RATE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.should_profile(request) or not _profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            profile, stats, token = self.start()
+            start = time.perf_counter()
+            try:
+                profile.enable()
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+                if token is not None:
+                    reset_request_stats(token)
+        finally:
+            _profile_lock.release()
+        self.finish(request, response, profile, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        if not self.should_profile(request) or not _profile_lock.acquire(blocking=False):
+            return await self.get_response(request)
+
+        try:
+            profile, stats, token = self.start()
+            start = time.perf_counter()
+            try:
+                profile.enable()
+                response = await self.get_response(request)
+            finally:
+                profile.disable()
+                if token is not None:
+                    reset_request_stats(token)
+        finally:
+            _profile_lock.release()
+        await sync_to_async(self.finish, thread_sensitive=False)(
+            request, response, profile, stats, time.perf_counter() - start
+        )
+        return response
+
+    @staticmethod
+    def should_profile(request):
+        secret = settings.REQUEST_PROFILER_SECRET
+        header = request.headers.get(PROFILE_HEADER)
+        if secret and header and hmac.compare_digest(header, secret):
+            return True
+        rate = settings.REQUEST_PROFILER_SAMPLE_RATE
+        return bool(rate) and random.random() < rate
+
+    @staticmethod
+    def start():
+        # Трассировку SQL пишет execute wrapper метрик (core/metrics.py)
+        stats, token = current_request_stats(), None
+        if stats is None:
+            stats, token = start_request_stats()
+        stats.trace = []
+        return cProfile.Profile(), stats, token
+
+    def finish(self, request, response, profile, stats, duration):
+        try:
+            profile_id = self.write(request, response, profile, stats, duration)
+        except OSError:
+            logger.exception("Не удалось сохранить профиль запроса")
+            return
+        finally:
+            stats.trace = None
+        response[f'{PROFILE_HEADER}-Id'] = profile_id
+
+    @staticmethod
+    def write(request, response, profile, stats, duration):
+        directory = Path(settings.REQUEST_PROFILER_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        match = request.resolver_match
+        route = match.route if match is not None else request.path
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', route).strip('-')[:60] or 'root'
+        profile_id = (
+            f"{timezone.now().strftime('%Y%m%dT%H%M%S%f')}_{request.method}_{slug}_{int(duration * 1000)}ms"
+        )
+
+        capture_params = settings.REQUEST_PROFILER_CAPTURE_PARAMS
+        profile.dump_stats(directory / f'{profile_id}.prof')
+        trace = {
+            'method': request.method,
+            'path': request.get_full_path() if capture_params else request.path,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'queries': len(stats.trace),
+            'query_time_ms': round(sum(query[-1] for query in stats.trace) * 1000, 3),
+            'sql': [
+                {
+                    'database': alias,
+                    'sql': sql,
+                    'params': RequestProfilerMiddleware.query_params(params, many, capture_params),
+                    'many': many,
+                    'duration_ms': round(query_duration * 1000, 3),
+                }
+                for alias, sql, params, many, query_duration in stats.trace
+            ],
+        }
+        (directory / f'{profile_id}.sql.json').write_text(json.dumps(trace, ensure_ascii=False, indent=2))
+
+        RequestProfilerMiddleware.rotate(directory)
+        return profile_id
+
+    @staticmethod
+    def query_params(params, many, capture):
+        if many or params is None:
+            return None
+        if capture:
+            return repr(params)
+        return f'<скрыто: {len(params)}>'
+
+    @staticmethod
+    def rotate(directory):
+        """Удалить профили сверх REQUEST_PROFILER_KEEP, начиная со старых (id начинается со времени)."""
+        profiles = sorted(directory.glob('*.prof'))
+        for old in profiles[:max(0, len(profiles) - settings.REQUEST_PROFILER_KEEP)]:
+            old.unlink(missing_ok=True)
+            old.with_name(old.name[:-len('.prof')] + '.sql.json').unlink(missing_ok=True)
@@ -0,0 +1,156 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .email_service import EmailSpool
+from .models import (
+    Order, OrderItem, ArchivedOrder, ArchivedOrderItem, ConfirmEmailToken, QueuedEmail, OutboxMessage
+)
+from .sales_rollup import frozen_rollups, item_unit_price
+
+logger = logging.getLogger(__name__)
+
+# Заказы в этих статусах больше не меняются и переносятся в архив
+CLOSED_STATUSES = ('delivered', 'canceled')
+
+
+class RetentionService:
+    """
+    Очистка рабочих таблиц от устаревших данных.
+
+    Все операции идут небольшими пачками с короткими транзакциями и паузой
+    между пачками, чтобы не блокировать таблицы для живых запросов.
+    """
+
+    @staticmethod
+    def run(batch_size=None, pause=None, now=None):
+        now = now or timezone.now()
+        return {
+            'archived_orders': RetentionService.archive_orders(
+                now - timedelta(days=settings.RETENTION_ORDER_ARCHIVE_DAYS), batch_size, pause),
+            'baskets': RetentionService.purge_baskets(
+                now - timedelta(days=settings.RETENTION_BASKET_DAYS), batch_size, pause),
+            'confirm_tokens': RetentionService.purge_confirm_tokens(
+                now - timedelta(seconds=settings.CONFIRM_EMAIL_TOKEN_TTL), batch_size, pause),
+            'queued_emails': RetentionService.purge_queues(
+                now - timedelta(days=settings.RETENTION_QUEUE_DAYS), batch_size, pause),
+            'spool_emails': EmailSpool.compact(
+                (timezone.localtime(now) - timedelta(days=settings.RETENTION_EMAIL_SPOOL_DAYS)).replace(tzinfo=None)),
+        }
+
+    @staticmethod
+    def archive_orders(before, batch_size=None, pause=None):
+        """Перенести в архив закрытые заказы, не менявшиеся с before. Возвращает количество."""
+        candidates = Order.objects.filter(status__in=CLOSED_STATUSES, updated_at__lt=before)
+        items = OrderItem.objects.select_related('product', 'shop').annotate(unit_price=item_unit_price())
+
+        def archive_batch(ids):
+            # Условия отбора повторяются: заказ мог измениться после выборки ID
+            orders = candidates.filter(id__in=ids).select_related('contact').prefetch_related(
+                Prefetch('items', queryset=items)
+            )
+            archived, archived_items = [], []
+            for order in orders:
+                total = 0
+                for item in order.items.all():
+                    price = item.unit_price or 0
+                    total += price * item.quantity
+                    archived_items.append(ArchivedOrderItem(
+                        order_id=order.id,
+                        product_id=item.product_id,
+                        shop_id=item.shop_id,
+                        product_name=item.product.name,
+                        shop_name=item.shop.name,
+                        quantity=item.quantity,
+                        price_per_unit=price
+                    ))
+                archived.append(ArchivedOrder(
+                    id=order.id,
+                    user_id=order.user_id,
+                    dt=order.dt,
+                    confirmed_at=order.confirmed_at,
+                    status=order.status,
+                    contact=RetentionService.contact_snapshot(order.contact),
+                    total_price=total
+                ))
+
+            ArchivedOrder.objects.bulk_create(archived)
+            ArchivedOrderItem.objects.bulk_create(archived_items)
+            # Архивные заказы остаются в агрегатах продаж
+            with frozen_rollups():
+                candidates.filter(id__in=[order.id for order in archived]).delete()
+            return len(archived)
+
+        return RetentionService._in_batches(candidates, archive_batch, batch_size, pause)
+
+    @staticmethod
+    def contact_snapshot(contact):
+        if contact is None:
+            return None
+        return {
+            'id': contact.id,
+            'type': contact.type,
+            'value': contact.value,
+            'city': contact.city,
+            'street': contact.street,
+            'house': contact.house,
+        }
+
+    @staticmethod
+    def purge_baskets(before, batch_size=None, pause=None):
+        """Удалить брошенные корзины, не менявшиеся с before."""
+        return RetentionService._delete_in_batches(
+            Order.objects.filter(status='basket', updated_at__lt=before), batch_size, pause)
+
+    @staticmethod
+    def purge_confirm_tokens(before, batch_size=None, pause=None):
+        """Удалить просроченные токены подтверждения email."""
+        return RetentionService._delete_in_batches(
+            ConfirmEmailToken.objects.filter(created_at__lt=before), batch_size, pause)
+
+    @staticmethod
+    def purge_queues(before, batch_size=None, pause=None):
+        """Удалить обработанные письма очереди доставки и сообщения outbox."""
+        emails = RetentionService._delete_in_batches(
+            QueuedEmail.objects.filter(status__in=('sent', 'failed'), created_at__lt=before), batch_size, pause)
+        messages = RetentionService._delete_in_batches(
+            OutboxMessage.objects.filter(status__in=('done', 'failed'), created_at__lt=before), batch_size, pause)
+        return emails + messages
+
+    @staticmethod
+    def _delete_in_batches(queryset, batch_size=None, pause=None):
+        def delete_batch(ids):
+            _, deleted = queryset.filter(pk__in=ids).delete()
+            return deleted.get(queryset.model._meta.label, 0)
+
+        return RetentionService._in_batches(queryset, delete_batch, batch_size, pause)
+
+    @staticmethod
+    def _in_batches(queryset, handle_batch, batch_size=None, pause=None):
+        batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+        ids_query = queryset.order_by('pk').values_list('pk', flat=True)
+
+        processed = 0
+        last_id = None
+        while True:
+            batch_query = ids_query if last_id is None else ids_query.filter(pk__gt=last_id)
+            ids = list(batch_query[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                processed += handle_batch(ids)
+            last_id = ids[-1]
+            if len(ids) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+
+        if processed:
+            logger.info(f"Хранение данных, {queryset.model.__name__}: обработано {processed}")
+        return processed
@@ -0,0 +1,200 @@
+import contextvars
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import (
+    STATE_CHOICES, OrderItem, ArchivedOrderItem, ProductInfo, ShopDailySales, ProductDailySales
+)
+
+logger = logging.getLogger(__name__)
+
+# Статусы, в которых заказ учитывается в продажах
+SALES_STATUSES = frozenset(state for state, _ in STATE_CHOICES if state not in ('basket', 'canceled'))
+
+_frozen = contextvars.ContextVar('sales_rollups_frozen', default=False)
+
+
+@contextmanager
+def frozen_rollups():
+    """Удаление заказов внутри блока не меняет агрегаты (перенос в архив)."""
+    token = _frozen.set(True)
+    try:
+        yield
+    finally:
+        _frozen.reset(token)
+
+
+def item_unit_price():
+    # Для заказов, подтвержденных до фиксации цены, - текущая цена магазина
+    current_price = ProductInfo.objects.filter(
+        product_id=OuterRef('product_id'),
+        shop_id=OuterRef('shop_id')
+    ).values('price')[:1]
+    return Coalesce('price_per_unit', Subquery(current_price))
+
+
+class SalesRollupService:
+    """
+    Дневные агрегаты продаж по магазинам и товарам.
+
+    Заказ добавляется в агрегаты, когда переходит в учитываемый статус
+    (подтверждение), и вычитается при отмене или удалении. Изменения
+    позиций уже подтвержденного заказа в агрегаты не попадают - для этого
+    есть rebuild (команда rebuild_sales_rollups).
+    """
+
+    @staticmethod
+    def apply_status_change(order, previous_status):
+        was_counted = previous_status in SALES_STATUSES
+        is_counted = order.status in SALES_STATUSES
+        if was_counted != is_counted:
+            SalesRollupService.apply_order(order, 1 if is_counted else -1)
+
+    @staticmethod
+    def is_frozen():
+        return _frozen.get()
+
+    @staticmethod
+    def apply_order(order, sign):
+        """Добавить (sign=1) или вычесть (sign=-1) заказ из агрегатов дня его подтверждения."""
+        date = timezone.localdate(order.confirmed_at or order.dt)
+        items = OrderItem.objects.filter(order_id=order.id).annotate(
+            unit_price=item_unit_price()
+        ).values_list('shop_id', 'product_id', 'quantity', 'unit_price')
+
+        shop_totals = defaultdict(lambda: [0, 0])
+        product_totals = defaultdict(lambda: [0, 0])
+        for shop_id, product_id, quantity, unit_price in items:
+            revenue = quantity * (unit_price or 0)
+            for totals in (shop_totals[shop_id], product_totals[(shop_id, product_id)]):
+                totals[0] += quantity
+                totals[1] += revenue
+
+        with transaction.atomic():
+            SalesRollupService._add_many(ShopDailySales, ('shop_id', 'date'), {
+                (shop_id, date): {'orders': sign, 'units': sign * units, 'revenue': sign * revenue}
+                for shop_id, (units, revenue) in shop_totals.items()
+            })
+            SalesRollupService._add_many(ProductDailySales, ('shop_id', 'product_id', 'date'), {
+                (shop_id, product_id, date): {'units': sign * units, 'revenue': sign * revenue}
+                for (shop_id, product_id), (units, revenue) in product_totals.items()
+            })
+
+    @staticmethod
+    def _add_many(model, key_fields, deltas):
+        """
+        Прибавить приращения {ключ: {поле: приращение}} к строкам агрегатов
+        за постоянное число запросов: существующие строки блокируются и
+        обновляются одним bulk_update, недостающие создаются одним bulk_create.
+        Вызывается внутри транзакции.
+        """
+        if not deltas:
+            return
+        rows = model.objects.select_for_update().filter(**{
+            f'{field}__in': {key[position] for key in deltas}
+            for position, field in enumerate(key_fields)
+        })
+        existing = {tuple(getattr(row, field) for field in key_fields): row for row in rows}
+
+        changed = []
+        for key, increments in deltas.items():
+            row = existing.get(key)
+            if row is not None:
+                for field, value in increments.items():
+                    setattr(row, field, getattr(row, field) + value)
+                changed.append(row)
+        model.objects.bulk_update(changed, sorted({field for values in deltas.values() for field in values}))
+
+        missing = {key: increments for key, increments in deltas.items() if key not in existing}
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    model(**dict(zip(key_fields, key)), **increments) for key, increments in missing.items()
+                )
+        except IntegrityError:
+            # Часть строк успели создать параллельно - добавляем по одной
+            for key, increments in missing.items():
+                SalesRollupService._add(model, dict(zip(key_fields, key)), **increments)
+
+    @staticmethod
+    def _add(model, key, **deltas):
+        increments = {field: F(field) + value for field, value in deltas.items()}
+        if model.objects.filter(**key).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**key, **deltas)
+        except IntegrityError:
+            # Строку за этот день успели создать параллельно
+            model.objects.filter(**key).update(**increments)
+
+    @staticmethod
+    def rebuild(date_from=None, date_to=None):
+        """
+        Пересчитать агрегаты за период (по умолчанию - за всю историю)
+        по позициям рабочих и архивных заказов. Возвращает число строк.
+        """
+        shop_rollups = ShopDailySales.objects.all()
+        product_rollups = ProductDailySales.objects.all()
+        if date_from:
+            shop_rollups = shop_rollups.filter(date__gte=date_from)
+            product_rollups = product_rollups.filter(date__gte=date_from)
+        if date_to:
+            shop_rollups = shop_rollups.filter(date__lte=date_to)
+            product_rollups = product_rollups.filter(date__lte=date_to)
+
+        sources = [
+            OrderItem.objects.filter(order__status__in=SALES_STATUSES).annotate(unit_price=item_unit_price()),
+            ArchivedOrderItem.objects.filter(
+                order__status__in=SALES_STATUSES, shop__isnull=False, product__isnull=False
+            ).annotate(unit_price=F('price_per_unit')),
+        ]
+
+        shop_totals = defaultdict(lambda: [0, 0, 0])
+        product_totals = defaultdict(lambda: [0, 0])
+        for items in sources:
+            items = items.annotate(date=TruncDate(Coalesce('order__confirmed_at', 'order__dt')))
+            if date_from:
+                items = items.filter(date__gte=date_from)
+            if date_to:
+                items = items.filter(date__lte=date_to)
+
+            revenue = Sum(F('quantity') * F('unit_price'))
+            for row in items.values('shop_id', 'date').annotate(
+                total_orders=Count('order_id', distinct=True),
+                total_units=Sum('quantity'),
+                total_revenue=revenue
+            ).order_by():
+                totals = shop_totals[(row['shop_id'], row['date'])]
+                totals[0] += row['total_orders']
+                totals[1] += row['total_units']
+                totals[2] += row['total_revenue'] or 0
+
+            for row in items.values('shop_id', 'product_id', 'date').annotate(
+                total_units=Sum('quantity'),
+                total_revenue=revenue
+            ).order_by():
+                totals = product_totals[(row['shop_id'], row['product_id'], row['date'])]
+                totals[0] += row['total_units']
+                totals[1] += row['total_revenue'] or 0
+
+        with transaction.atomic():
+            shop_rollups.delete()
+            product_rollups.delete()
+            ShopDailySales.objects.bulk_create([
+                ShopDailySales(shop_id=shop_id, date=date, orders=orders, units=units, revenue=revenue)
+                for (shop_id, date), (orders, units, revenue) in shop_totals.items()
+            ], batch_size=1000)
+            ProductDailySales.objects.bulk_create([
+                ProductDailySales(shop_id=shop_id, product_id=product_id, date=date, units=units, revenue=revenue)
+                for (shop_id, product_id, date), (units, revenue) in product_totals.items()
+            ], batch_size=1000)
+
+        logger.info(f"Агрегаты продаж пересчитаны: {len(product_totals)} строк по товарам")
+        return len(product_totals)
@@ -1,14 +1,13 @@
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from .thumbnails import thumbnail_name
 from .models import (
     User, Shop, Category, Product, ProductInfo, 
     Parameter, ProductParameter, Contact, Order, 
-    OrderItem, ConfirmEmailToken
+    OrderItem, ConfirmEmailToken, ArchivedOrder, ArchivedOrderItem
 )
 
-from allauth.socialaccount.models import SocialAccount
-from rest_framework.authtoken.models import Token
-
 
 # Сначала определим базовые сериализаторы
 class ShopSerializer(serializers.ModelSerializer):
@@ -28,16 +27,33 @@ class CategorySerializer(serializers.ModelSerializer):
 class ProductSerializer(serializers.ModelSerializer):
     category = serializers.StringRelatedField()
     image = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'category', 'image']
+        fields = ['id', 'name', 'category', 'image', 'images']
         read_only_fields = ['id']
     
     def get_image(self, obj):
-        if obj.image:
-            return obj.image.url
-        return '/static/images/no-image.png'
+        # Размер зависит от контекста: в списках - миниатюра, в карточке - крупная
+        variant = self.context.get('image_variant', 'detail')
+        return self.get_images(obj)[variant]
+
+    def get_images(self, obj):
+        # URL миниатюр строятся по сохраненному хэшу без обращений к файловой системе
+        if obj.image_hash:
+            return {
+                variant: settings.MEDIA_URL + thumbnail_name(obj.image_hash, size)
+                for variant, size in settings.PRODUCT_IMAGE_VARIANTS.items()
+            } | {
+                'srcset': ', '.join(
+                    f'{settings.MEDIA_URL}{thumbnail_name(obj.image_hash, size)} {size}w'
+                    for size in sorted(settings.PRODUCT_THUMBNAIL_SIZES)
+                )
+            }
+
+        url = obj.image.url if obj.image else '/static/images/no-image.png'
+        return dict.fromkeys(settings.PRODUCT_IMAGE_VARIANTS, url) | {'srcset': ''}
 
 
 
@@ -132,6 +148,16 @@ class ContactSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+def order_item_price(item, prices):
+    """
+    Цена единицы позиции: зафиксированная при подтверждении заказа (так же
+    считается архив), для корзины - текущая цена из prices.
+    """
+    if item.price_per_unit is not None:
+        return item.price_per_unit
+    return prices.get((item.product_id, item.shop_id), 0)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     shop_name = serializers.CharField(source='shop.name', read_only=True)
@@ -144,6 +170,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
     
     def get_price(self, obj):
+        # Текущие цены, загруженные заранее одним запросом (context['prices'])
+        prices = self.context.get('prices')
+        if prices is not None or obj.price_per_unit is not None:
+            return order_item_price(obj, prices or {})
         try:
             product_info = ProductInfo.objects.get(product=obj.product, shop=obj.shop)
             return product_info.price
@@ -151,6 +181,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
             return 0
     
     def get_total_price(self, obj):
+        prices = self.context.get('prices')
+        if prices is not None:
+            return order_item_price(obj, prices) * obj.quantity
         return obj.get_item_price()
 
 
@@ -165,9 +198,39 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'dt']
     
     def get_total_price(self, obj):
+        prices = self.context.get('prices')
+        if prices is not None:
+            return sum(order_item_price(item, prices) * item.quantity for item in obj.items.all())
         return obj.get_total_price()
 
 
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    price = serializers.IntegerField(source='price_per_unit', read_only=True)
+    total_price = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['id', 'product', 'product_name', 'shop', 'shop_name', 'quantity', 'price', 'total_price']
+
+    def get_total_price(self, obj):
+        return obj.price_per_unit * obj.quantity
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Архивный заказ в том же формате, что и OrderSerializer."""
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    user_email = serializers.CharField(source='user.email', read_only=True)
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'user', 'user_email', 'dt', 'status', 'contact', 'items', 'total_price', 'archived']
+        read_only_fields = fields
+
+    def get_archived(self, obj):
+        return True
+
+
 class BasketItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     shop_name = serializers.CharField(source='shop.name', read_only=True)
@@ -179,6 +242,9 @@ class BasketItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'product_name', 'shop', 'shop_name', 'quantity', 'price', 'total_price']
     
     def get_price(self, obj):
+        prices = self.context.get('prices')
+        if prices is not None:
+            return prices.get((obj.product_id, obj.shop_id), 0)
         try:
             product_info = ProductInfo.objects.get(product=obj.product, shop=obj.shop)
             return product_info.price
@@ -186,12 +252,15 @@ class BasketItemSerializer(serializers.ModelSerializer):
             return 0
     
     def get_total_price(self, obj):
+        prices = self.context.get('prices')
+        if prices is not None:
+            return prices.get((obj.product_id, obj.shop_id), 0) * obj.quantity
         return obj.get_item_price()
 
 
 class ProductInfoDetailSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
-    parameters = ProductParameterSerializer(source='product_parameters', many=True, read_only=True)
+    parameters = serializers.SerializerMethodField()
     shop_name = serializers.CharField(source='shop.name', read_only=True)
     
     class Meta:
@@ -200,9 +269,24 @@ class ProductInfoDetailSerializer(serializers.ModelSerializer):
                   'quantity', 'price', 'price_rrc', 'parameters']
         read_only_fields = ['id']
 
+    def get_parameters(self, obj):
+        # JSON-копия параметров избавляет от prefetch ProductParameter/Parameter
+        if settings.CATALOG_INLINE_PARAMETERS and obj.parameters_json is not None:
+            return [{'parameter': name, 'value': value} for name, value in obj.parameters_json.items()]
+        return ProductParameterSerializer(obj.product_parameters.all(), many=True).data
+
+
+class StockDeltaSerializer(serializers.Serializer):
+    external_id = serializers.IntegerField(min_value=0)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    price = serializers.IntegerField(min_value=0, required=False)
+    price_rrc = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if not {'quantity', 'price', 'price_rrc'} & attrs.keys():
+            raise serializers.ValidationError('Необходимо указать quantity, price или price_rrc')
+        return attrs
 
-from allauth.socialaccount.models import SocialAccount
-from rest_framework.authtoken.models import Token
 
 class SocialAuthSerializer(serializers.Serializer):
     provider = serializers.CharField()
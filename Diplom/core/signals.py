@@ -0,0 +1,113 @@
+from django.db import models, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import outbox
+from .authentication import credential_cache
+from .catalog_cache import bump_catalog_versions
+from .events import broker
+from .metrics import install_query_recorder
+from .models import User, Order, OrderItem, Product, ProductInfo
+from .sales_rollup import SalesRollupService, SALES_STATUSES
+
+
+@receiver(pre_save, sender=Order, dispatch_uid='core_order_confirmed_at')
+def mark_order_confirmed(sender, instance, **kwargs):
+    # Продажи датируются подтверждением заказа, а не созданием корзины
+    if instance.status in SALES_STATUSES and instance.confirmed_at is None:
+        instance.confirmed_at = timezone.now()
+
+
+@receiver(post_save, sender=Order, dispatch_uid='core_order_status_changed')
+def order_status_changed(sender, instance, created, **kwargs):
+    """Обновляет агрегаты продаж и уведомляет магазины о смене статуса заказа."""
+    previous = getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+    if instance.status == previous:
+        return
+
+    # В той же транзакции, что и смена статуса
+    SalesRollupService.apply_status_change(instance, previous)
+
+    if not created and instance.status != 'basket':
+        publish_order_event(instance, previous)
+
+
+@receiver(pre_delete, sender=Order, dispatch_uid='core_order_deleted')
+def order_deleted(sender, instance, **kwargs):
+    # Позиции удаляются каскадно после этого сигнала, поэтому вычитаем сейчас.
+    # Заказы, переносимые в архив, остаются в агрегатах
+    if instance.status in SALES_STATUSES and not SalesRollupService.is_frozen():
+        SalesRollupService.apply_order(instance, -1)
+
+
+def publish_order_event(order, previous):
+    """Уведомляет магазины заказа о подтверждении и смене статуса."""
+    event = {
+        'type': 'order_created' if previous == 'basket' else 'order_status',
+        'order_id': order.id,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'previous_status': previous,
+    }
+
+    def publish():
+        shop_ids = OrderItem.objects.filter(order_id=order.id).values_list('shop_id', flat=True).distinct()
+        broker.publish(list(shop_ids), event)
+
+    # Подписчики не должны увидеть заказ, транзакция которого откатится
+    transaction.on_commit(publish, robust=True)
+
+
+def image_replaced(instance):
+    loaded = getattr(instance, '_loaded_image', None)
+    if loaded is models.DEFERRED:
+        # Поле image не загружалось - при сохранении оно не меняется
+        return False
+    return (instance.image.name or '') != (loaded or '')
+
+
+@receiver(pre_save, sender=Product, dispatch_uid='core_product_image_reset')
+def reset_image_hash(sender, instance, update_fields=None, **kwargs):
+    # Миниатюры старой картинки больше не подходят: до пересчета хэша
+    # API отдает исходное изображение
+    if (update_fields is None or 'image' in update_fields) and image_replaced(instance):
+        instance.image_hash = ''
+        instance._image_replaced = True
+
+
+@receiver(post_save, sender=Product, dispatch_uid='core_product_image_changed')
+def product_image_changed(sender, instance, update_fields=None, **kwargs):
+    """Ставит в очередь миниатюры новой картинки и сбрасывает кэш каталога с этим товаром."""
+    replaced = getattr(instance, '_image_replaced', False)
+    instance._image_replaced = False
+    if update_fields is None or 'image' in update_fields:
+        instance._loaded_image = instance.image.name
+    if not replaced and not (update_fields and 'image_hash' in update_fields):
+        return
+
+    if replaced and instance.image:
+        from .tasks import create_product_thumbnails
+        outbox.enqueue(create_product_thumbnails, product_id=instance.pk)
+    shop_ids = ProductInfo.all_versions.filter(product=instance).values_list('shop_id', flat=True).distinct()
+    bump_catalog_versions(list(shop_ids))
+
+
+@receiver(post_save, sender=User, dispatch_uid='core_user_changed')
+@receiver(post_delete, sender=User, dispatch_uid='core_user_deleted')
+def invalidate_user_credentials(sender, instance, **kwargs):
+    # Смена пароля, блокировка и т.п. - проверенные учетные данные больше не действуют
+    credential_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token, dispatch_uid='core_token_deleted')
+def invalidate_token(sender, instance, **kwargs):
+    # Выход или перевыпуск токена
+    credential_cache.invalidate_user(instance.user_id)
+
+
+# Учет SQL-запросов для метрик - на каждом новом соединении
+connection_created.connect(install_query_recorder, dispatch_uid='core_install_query_recorder')
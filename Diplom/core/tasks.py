@@ -21,14 +21,19 @@ def send_confirm_email_task(user_email, token):
 
 
 @shared_task
-def send_order_confirmation_task(user_email, order_id):
+def send_order_confirmation_task(user_email, order_id, snapshot=None):
     """
     Асинхронная отправка email с подтверждением заказа.
+
+    snapshot - снимок заказа из OrderConfirmView; с ним письмо
+    собирается без запросов к БД.
     """
     try:
-        from .models import Order
-        order = Order.objects.get(id=order_id)
-        DemoEmailService.send_order_confirmation(user_email, order)
+        if snapshot is None:
+            from .models import Order
+            order = Order.objects.select_related('contact').get(id=order_id)
+            snapshot = DemoEmailService.order_snapshot(order)
+        DemoEmailService.send_order_confirmation(user_email, snapshot)
         logger.info(f"Подтверждение заказа {order_id} отправлено на {user_email}")
         return True
     except Exception as e:
@@ -37,23 +42,100 @@ def send_order_confirmation_task(user_email, order_id):
     
 @shared_task
 def create_product_thumbnails(product_id):
-    """Асинхронное создание миниатюр для товара"""
+    """Асинхронное создание миниатюр для товара (все размеры за одно декодирование)"""
     from .models import Product
-    from easy_thumbnails.files import get_thumbnailer
+    from .thumbnails import ThumbnailPipeline
     
     try:
         product = Product.objects.get(id=product_id)
         if product.image:
-            # Генерация миниатюр разных размеров
-            sizes = [(200, 200), (400, 400), (800, 800)]
-            for size in sizes:
-                thumb = get_thumbnailer(product.image).get_thumbnail({
-                    'size': size,
-                    'crop': True,
-                    'upscale': True,
-                })
-                print(f"Создана миниатюра {size}: {thumb.url}")
+            created = ThumbnailPipeline.process_product(product)
+            logger.info(f"Миниатюры товара {product_id}: создано {created}, хэш {product.image_hash}")
         return True
     except Exception as e:
         logger.error(f"Ошибка обработки изображения: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+@shared_task
+def sync_price_lists_task():
+    """
+    Планирует синхронизацию прайс-листов всех активных магазинов,
+    равномерно распределяя их по окну опроса.
+    """
+    from .price_list_sync import PriceListSyncService
+
+    shop_ids = list(PriceListSyncService.active_shops().values_list('id', flat=True))
+    for shop_id in shop_ids:
+        sync_shop_price_list_task.apply_async(
+            args=[shop_id],
+            countdown=PriceListSyncService.schedule_offset(shop_id)
+        )
+    return len(shop_ids)
+
+
+@shared_task
+def sync_shop_price_list_task(shop_id):
+    """Условная загрузка и импорт прайс-листа одного магазина."""
+    from .price_list_sync import PriceListSyncService
+
+    try:
+        shop = PriceListSyncService.active_shops().select_related('user').get(id=shop_id)
+        result = PriceListSyncService.sync_shop(shop)
+        logger.info(f"Синхронизация прайс-листа магазина {shop_id}: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Ошибка синхронизации прайс-листа магазина {shop_id}: {e}")
+        return False
+
+
+@shared_task
+def deliver_queued_emails_task(max_batches=10):
+    """Доставка накопившихся писем пачками с общим SMTP-соединением."""
+    from .email_delivery import EmailDeliveryService
+
+    sent = 0
+    for _ in range(max_batches):
+        stats = EmailDeliveryService.deliver_batch()
+        sent += stats['sent']
+        if not any(stats.values()):
+            break
+    return sent
+
+
+@shared_task
+def dispatch_outbox_task(max_batches=10):
+    """Передача накопившихся сообщений outbox в брокер (запускается beat)."""
+    from .outbox import OutboxDispatcher
+
+    dispatcher = OutboxDispatcher(mode='celery')
+    done = 0
+    for _ in range(max_batches):
+        stats = dispatcher.dispatch_batch()
+        done += stats['done']
+        if not any(stats.values()):
+            break
+    return done
+
+
+@shared_task
+def warm_catalog_cache_task():
+    """
+    Прогрев кэша каталога самыми частыми запросами покупателей.
+    """
+    from .cache_warmup import CatalogCacheWarmer
+
+    stats = CatalogCacheWarmer.warm()
+    return stats or {'skipped': True}
+
+
+@shared_task
+def apply_retention_task():
+    """
+    Перенос старых заказов в архив и очистка устаревших данных.
+    """
+    from .retention import RetentionService
+
+    stats = RetentionService.run()
+    logger.info(f"Хранение данных: {stats}")
+    return stats
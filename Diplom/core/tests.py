@@ -1,8 +1,108 @@
 from django.test import TestCase
-from django.urls import reverse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import get_resolver, path, reverse
 from rest_framework.test import APITestCase
-from rest_framework import status
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.throttling import AnonRateThrottle
+from django.core.management import CommandError, call_command
+from django.test.utils import CaptureQueriesContext
+from django.core import mail
 from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.mail.backends import locmem
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse, QueryDict
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import base64
+import io
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+import yaml
+from PIL import Image
+
+from myproject.urls import urlpatterns as project_urlpatterns
+
+from .authentication import (
+    CachedBasicAuthentication, CachedTokenAuthentication, VerifiedCredentialCache, credential_cache
+)
+from .cache_warmup import CatalogCacheWarmer, WARMUP_LOCK_KEY
+from .checks import check_credential_cache, check_shared_cache
+from .db_router import ReplicaRouter, replica_reads
+from .catalog_cache import CatalogQueryRecorder, catalog_query_signature, product_list_cache_key, query_recorder
+from .email_delivery import EmailDeliveryService
+from .email_service import DemoEmailService
+from .events import broker
+from .import_service import CatalogImportError, CatalogImportService
+from .metrics import registry as metrics_registry
+from .profiler import RequestProfilerMiddleware
+from .models import (
+    User, Shop, Category, Product, ProductInfo, Parameter, PriceHistory, QueuedEmail,
+    Contact, Order, OrderItem, OutboxMessage, CatalogQueryStat, ShopDailySales, ProductDailySales,
+    ArchivedOrder, ConfirmEmailToken
+)
+from .price_list_sync import PriceListSyncService
+from .retention import RetentionService
+from .sales_rollup import SalesRollupService
+from .serializers import ProductSerializer
+from .outbox import OutboxDispatcher
+from .thumbnails import ThumbnailPipeline, thumbnail_name
+from .tasks import (
+    create_product_thumbnails, dispatch_outbox_task, send_confirm_email_task, send_order_confirmation_task,
+    warm_catalog_cache_task
+)
+from .throttles import RegisterThrottle, BasketThrottle
+from .views import serve_thumbnail
+from . import async_views, email_service, outbox, urls as core_urls
+
+@contextmanager
+def shared_cache():
+    """Кэш Django, общий для процессов (файловый), вместо LocMemCache тестов."""
+    location = tempfile.mkdtemp()
+    try:
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}):
+            yield
+    finally:
+        shutil.rmtree(location)
+
+
+def create_shop_user(email='shop@example.com', **extra):
+    return User.objects.create_user(email=email, password='TestPass123', type='shop', **extra)
+
+
+def good(external_id, price=100, name='Телефон', **extra):
+    """Товар прайс-листа: категория 1, price_rrc равна цене, 5 шт., если не задано иное."""
+    return {
+        'id': external_id, 'category': 1, 'name': name, 'price': price, 'price_rrc': price, 'quantity': 5
+    } | extra
+
+
+def price_list(*goods, shop='Магазин'):
+    return {'shop': shop, 'categories': [{'id': 1, 'name': 'Смартфоны'}], 'goods': list(goods)}
+
+
+def import_shop(*goods, user=None):
+    """Импорт прайс-листа goods (по умолчанию - один телефон) от user или нового shop@example.com."""
+    user = user or create_shop_user()
+    shop, _ = CatalogImportService.import_shop_data(user, price_list(*(goods or [good(1)])))
+    return shop
+
 
 class ThrottlingTestCase(APITestCase):
     def setUp(self):
@@ -26,4 +126,1728 @@ class ThrottlingTestCase(APITestCase):
         
         # 6й запрос должен быть отклонен
         response = self.client.post(url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+class CatalogImportTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_shop_user()
+        self.client.force_authenticate(self.user)
+
+    def _price_list(self, price=100, goods_count=2):
+        return price_list(*(
+            good(1000 + i, price, f'Телефон {i}', model=f'model-{i}', price_rrc=price + 10,
+                 parameters={'Цвет': 'черный', 'Память': 64})
+            for i in range(goods_count)
+        ))
+
+    def test_import_publishes_new_version(self):
+        """Повторный импорт публикует новую версию и хранит предыдущую"""
+        shop, _ = CatalogImportService.import_shop_data(self.user, self._price_list(price=100))
+        self.assertEqual(shop.catalog_version, 1)
+
+        shop, _ = CatalogImportService.import_shop_data(self.user, self._price_list(price=200))
+        shop.refresh_from_db()
+        self.assertEqual(shop.catalog_version, 2)
+        self.assertEqual(shop.previous_catalog_version, 1)
+
+        # Читатели видят только опубликованную версию
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), 2)
+        self.assertEqual(set(ProductInfo.objects.values_list('price', flat=True)), {200})
+        self.assertEqual(ProductInfo.all_versions.filter(shop=shop).count(), 4)
+
+        # Третий импорт удаляет самую старую версию
+        CatalogImportService.import_shop_data(self.user, self._price_list(price=300))
+        self.assertEqual(
+            set(ProductInfo.all_versions.filter(shop=shop).values_list('version', flat=True)),
+            {2, 3}
+        )
+
+    def test_failed_import_keeps_published_version(self):
+        """Ошибка посреди импорта не затрагивает опубликованную версию"""
+        shop, _ = CatalogImportService.import_shop_data(self.user, self._price_list(price=100))
+
+        broken = self._price_list(price=200)
+        del broken['goods'][1]['price']
+        with self.assertRaises(KeyError):
+            CatalogImportService.import_shop_data(self.user, broken)
+
+        shop.refresh_from_db()
+        self.assertEqual(shop.catalog_version, 1)
+        self.assertEqual(ProductInfo.all_versions.filter(shop=shop).count(), 2)
+        self.assertEqual(set(ProductInfo.objects.values_list('price', flat=True)), {100})
+
+    def test_reimport_with_numeric_parameter_name(self):
+        """Числовое имя параметра из YAML не создает новый Parameter при каждом импорте"""
+        data = price_list(good(1, parameters={64: 'ГБ'}))
+        CatalogImportService.import_shop_data(self.user, data)
+        CatalogImportService.import_shop_data(self.user, data)
+        self.assertEqual(Parameter.objects.filter(name='64').count(), 1)
+        self.assertEqual(ProductInfo.objects.get().parameters_json, {'64': 'ГБ'})
+
+    def test_cleanup_keeps_newer_staging(self):
+        """Удаляются только версии старше предыдущей, staging параллельного импорта остается"""
+        CatalogImportService.import_shop_data(self.user, self._price_list(price=100))
+        shop, _ = CatalogImportService.import_shop_data(self.user, self._price_list(price=200))
+        staging = ProductInfo.all_versions.filter(shop=shop).first()
+        staging.pk, staging.version = None, 99
+        staging.save()
+
+        CatalogImportService.import_shop_data(self.user, self._price_list(price=300))
+        self.assertEqual(
+            set(ProductInfo.all_versions.filter(shop=shop).values_list('version', flat=True)), {2, 3, 99}
+        )
+
+    def test_concurrent_import_does_not_touch_other_staging(self):
+        """Параллельный импорт получает свою версию, проигравший удаляет только свою"""
+        shop, _ = CatalogImportService.import_shop_data(self.user, self._price_list(price=100))
+        write_batch = CatalogImportService._write_batch
+
+        def interleaved(shop, version, goods):
+            # Второй импорт стартует и публикуется, пока первый пишет товары
+            if goods[0]['price'] == 200:
+                CatalogImportService.import_shop_data(self.user, self._price_list(price=300))
+            return write_batch(shop, version, goods)
+
+        with mock.patch.object(CatalogImportService, '_write_batch', side_effect=interleaved):
+            with self.assertRaises(CatalogImportError):
+                CatalogImportService.import_shop_data(self.user, self._price_list(price=200))
+
+        shop.refresh_from_db()
+        self.assertEqual(shop.catalog_version, 3)
+        self.assertEqual(set(ProductInfo.objects.filter(shop=shop).values_list('price', flat=True)), {300})
+        self.assertFalse(ProductInfo.all_versions.filter(shop=shop, version=2).exists())
+
+    def test_rollback(self):
+        """Откат к предыдущей версии прайс-листа"""
+        CatalogImportService.import_shop_data(self.user, self._price_list(price=100))
+        shop, _ = CatalogImportService.import_shop_data(self.user, self._price_list(price=200))
+
+        CatalogImportService.rollback(shop)
+        self.assertEqual(set(ProductInfo.objects.values_list('price', flat=True)), {100})
+
+    def test_partner_update_endpoint(self):
+        """Импорт через PartnerUpdate и чтение каталога"""
+        yaml_file = SimpleUploadedFile('price.yaml', yaml.safe_dump(self._price_list(), allow_unicode=True).encode())
+        response = self.client.post(reverse('core:partner-update'), {'file': yaml_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['CatalogVersion'], 1)
+
+        response = self.client.get(reverse('core:product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+
+class PriceListStubHandler(BaseHTTPRequestHandler):
+    """Локальная замена сервера магазина с поддержкой ETag"""
+    body = b''
+    etag = '"v1"'
+    requests_log = []
+
+    def do_GET(self):
+        type(self).requests_log.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PriceListSyncTestCase(APITestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PriceListStubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        PriceListStubHandler.requests_log = []
+        PriceListStubHandler.etag = '"v1"'
+        PriceListStubHandler.body = self._price_list_yaml(price=100)
+
+        self.shop = Shop.objects.create(
+            name='Магазин',
+            user=create_shop_user(),
+            url=f'http://127.0.0.1:{self.server.server_port}/price.yaml'
+        )
+
+    def _price_list_yaml(self, price):
+        return yaml.safe_dump(price_list(good(1, price, quantity=3)), allow_unicode=True).encode()
+
+    def _sync(self):
+        self.shop.refresh_from_db()
+        return PriceListSyncService.sync_shop(self.shop)
+
+    def test_unchanged_price_list_costs_one_304(self):
+        """Неизмененный прайс-лист: один ответ 304 и ни одного запроса к БД"""
+        self.assertEqual(self._sync(), PriceListSyncService.IMPORTED)
+        self.shop.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            result = PriceListSyncService.sync_shop(self.shop)
+        self.assertEqual(result, PriceListSyncService.NOT_MODIFIED)
+        self.assertEqual(PriceListStubHandler.requests_log, [None, '"v1"'])
+
+    def test_changed_price_list_is_imported(self):
+        """Новый ETag приводит к импорту новой версии"""
+        self._sync()
+        PriceListStubHandler.etag = '"v2"'
+        PriceListStubHandler.body = self._price_list_yaml(price=150)
+
+        self.assertEqual(self._sync(), PriceListSyncService.IMPORTED)
+        self.assertEqual(ProductInfo.objects.get(shop=self.shop).price, 150)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.catalog_version, 2)
+
+    def test_same_content_is_not_reimported(self):
+        """Сервер сменил ETag, но содержимое то же - импорт не выполняется"""
+        self._sync()
+        PriceListStubHandler.etag = '"v2"'
+
+        self.assertEqual(self._sync(), PriceListSyncService.UNCHANGED)
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.catalog_version, 1)
+        self.assertEqual(self.shop.price_list_etag, '"v2"')
+
+    def test_manual_import_not_repeated_by_sync(self):
+        """Прайс-лист, загруженный вручную по URL или файлом, синхронизация не импортирует заново"""
+        self.client.force_authenticate(self.shop.user)
+        response = self.client.post(reverse('core:partner-update'), {'url': self.shop.url}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._sync(), PriceListSyncService.NOT_MODIFIED)
+
+        PriceListStubHandler.etag = '"v2"'
+        PriceListStubHandler.body = self._price_list_yaml(price=150)
+        upload = SimpleUploadedFile('price.yaml', PriceListStubHandler.body)
+        response = self.client.post(reverse('core:partner-update'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._sync(), PriceListSyncService.UNCHANGED)
+
+        self.shop.refresh_from_db()
+        self.assertEqual(self.shop.catalog_version, 2)
+
+    def test_schedule_offsets_within_window(self):
+        """Смещения магазинов лежат внутри окна опроса"""
+        offsets = {PriceListSyncService.schedule_offset(shop_id, 3600) for shop_id in range(1, 101)}
+        self.assertTrue(all(0 <= offset < 3600 for offset in offsets))
+        self.assertGreater(len(offsets), 90)
+
+
+class PartnerStockUpdateTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_shop_user()
+        self.client.force_authenticate(self.user)
+        self.shop = import_shop(
+            *(good(i, name=f'Телефон {i}', price_rrc=110) for i in range(1, 4)), user=self.user
+        )
+        self.url = reverse('core:partner-stock')
+
+    def test_apply_deltas(self):
+        """Изменения применяются по external_id, неизвестные ИД возвращаются"""
+        response = self.client.post(self.url, {'items': [
+            {'external_id': 1, 'quantity': 0},
+            {'external_id': 2, 'price': 90, 'price_rrc': 95},
+            {'external_id': 3, 'quantity': 5},
+            {'external_id': 999, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['Updated'], 2)
+        self.assertEqual(response.json()['NotFound'], [999])
+
+        infos = {pi.external_id: pi for pi in ProductInfo.objects.filter(shop=self.shop)}
+        self.assertEqual(infos[1].quantity, 0)
+        self.assertEqual((infos[2].price, infos[2].price_rrc), (90, 95))
+
+    def test_invalid_delta(self):
+        """Изменение без полей отклоняется"""
+        response = self.client.post(self.url, {'items': [{'external_id': 1}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Тело - список, а не объект
+        response = self.client.post(self.url, [{'external_id': 1, 'quantity': 1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_only_affected_cache_versions_bumped(self):
+        """Меняется версия кэша только этого магазина и общей выдачи"""
+        shop_params = QueryDict(f'shop_id={self.shop.id}')
+        other_params = QueryDict('shop_id=999')
+        keys_before = [product_list_cache_key(p) for p in (shop_params, other_params, QueryDict())]
+
+        CatalogImportService.apply_deltas(self.shop, [{'external_id': 1, 'quantity': 1}])
+
+        keys_after = [product_list_cache_key(p) for p in (shop_params, other_params, QueryDict())]
+        self.assertNotEqual(keys_before[0], keys_after[0])
+        self.assertEqual(keys_before[1], keys_after[1])
+        self.assertNotEqual(keys_before[2], keys_after[2])
+
+
+class PriceHistoryTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_shop_user()
+
+    def _import(self, prices):
+        return import_shop(*(good(i, price, f'Телефон {i}') for i, price in enumerate(prices)), user=self.user)
+
+    def test_only_real_changes_recorded(self):
+        """В историю попадают только изменившиеся цены"""
+        shop = self._import([100, 200])
+        self.assertEqual(PriceHistory.objects.count(), 2)
+
+        self._import([100, 250])
+        self.assertEqual(PriceHistory.objects.count(), 3)
+
+        CatalogImportService.apply_deltas(shop, [{'external_id': 0, 'price': 90}, {'external_id': 1, 'quantity': 1}])
+        self.assertEqual(
+            list(PriceHistory.objects.order_by('id').values_list('price', flat=True)),
+            [100, 200, 250, 90]
+        )
+
+    def test_positions_of_one_product_tracked_separately(self):
+        """Несколько позиций одного продукта (разные external_id) не схлопываются"""
+        shop = import_shop(good(1, 100), good(2, 150), user=self.user)
+        self.assertEqual(sorted(PriceHistory.objects.values_list('price', flat=True)), [100, 150])
+
+        CatalogImportService.apply_deltas(shop, [{'external_id': 2, 'price': 140}])
+        self.assertEqual(sorted(PriceHistory.objects.values_list('price', flat=True)), [100, 140, 150])
+
+    def test_downsampled_series(self):
+        """Точки истории группируются в интервалы заданного размера"""
+        shop = self._import([100])
+        product_id = ProductInfo.objects.get(shop=shop).product_id
+        PriceHistory.objects.all().delete()
+
+        base = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+        PriceHistory.objects.bulk_create([
+            PriceHistory(shop=shop, product_id=product_id, month=PriceHistory.month_key(moment),
+                         ts=int(moment.timestamp()), price=price, price_rrc=price)
+            for moment, price in [
+                (base - timedelta(days=3), 80),
+                (base + timedelta(hours=1), 100),
+                (base + timedelta(hours=5), 120),
+                (base + timedelta(days=9), 90),
+            ]
+        ])
+
+        response = self.client.get(
+            reverse('core:product-price-history', args=[product_id]),
+            {'shop_id': shop.id, 'date_from': '2026-03-01', 'date_to': '2026-03-10', 'points': 10}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['Step'], 86400)
+        self.assertEqual(response.data['Start']['price'], 80)
+        points = response.data['Series'][0]['points']
+        self.assertEqual(
+            [(p['min_price'], p['max_price'], p['changes']) for p in points],
+            [(100, 120, 2), (90, 90, 1)]
+        )
+        self.assertEqual(points[1]['ts'], int((base + timedelta(days=9)).timestamp()))
+
+
+class InlineParametersTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.shop = import_shop(*(
+            good(i, name=f'Телефон {i}', price_rrc=110, parameters={'Цвет': 'черный', 'Память': 64})
+            for i in range(5)
+        ))
+
+    def test_import_writes_parameters_json(self):
+        """Импорт заполняет JSON-копию параметров"""
+        product_info = ProductInfo.objects.filter(shop=self.shop).first()
+        self.assertEqual(product_info.parameters_json, {'Цвет': 'черный', 'Память': '64'})
+
+    @override_settings(CATALOG_INLINE_PARAMETERS=True)
+    def test_catalog_reads_parameters_without_extra_queries(self):
+        """Каталог отдается одним запросом"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('core:product-list'))
+        self.assertEqual(len(response.data), 5)
+        self.assertIn({'parameter': 'Память', 'value': '64'}, response.data[0]['parameters'])
+
+    def test_parameters_json_follows_eav_changes(self):
+        """Изменения в таблицах параметров отражаются в JSON-копии"""
+        product_info = ProductInfo.objects.filter(shop=self.shop).first()
+        product_parameter = product_info.product_parameters.get(parameter__name='Цвет')
+        product_parameter.value = 'белый'
+        product_parameter.save()
+
+        memory = Parameter.objects.get(name='Память')
+        memory.name = 'Объем памяти'
+        memory.save()
+
+        product_info.refresh_from_db()
+        self.assertEqual(product_info.parameters_json, {'Цвет': 'белый', 'Объем памяти': '64'})
+
+        product_parameter.delete()
+        product_info.refresh_from_db()
+        self.assertEqual(product_info.parameters_json, {'Объем памяти': '64'})
+
+
+class EmailSpoolTestCase(APITestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        settings_override = override_settings(DEMO_EMAIL_SPOOL_DIR=self.spool_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        stdout_patch = mock.patch('sys.stdout', new_callable=io.StringIO)
+        stdout_patch.start()
+        self.addCleanup(stdout_patch.stop)
+
+        self.user = User.objects.create_user(email='buyer@example.com', password='TestPass123')
+        self.client.force_authenticate(self.user)
+
+    def _send(self, count, to='buyer@example.com'):
+        for i in range(count):
+            DemoEmailService.send_confirm_email(to, f'token-{i}')
+
+    def test_legacy_files_are_imported(self):
+        """Письма старого формата переносятся в журнал"""
+        with open(os.path.join(self.spool_dir, 'email_20260101_000000.json'), 'w', encoding='utf-8') as f:
+            json.dump({'type': 'confirm_email', 'to': 'old@example.com', 'token': 'old'}, f)
+
+        self._send(1)
+        emails, _ = DemoEmailService.list_sent_emails()
+        self.assertEqual([email['token'] for email in emails], ['token-0', 'old'])
+
+    def test_lost_index_is_rebuilt_from_spool(self):
+        """Потерянный индекс строится заново, письма журнала сохраняются"""
+        self._send(3)
+        os.remove(os.path.join(self.spool_dir, 'spool.idx'))
+
+        self._send(1, to='other@example.com')
+        emails, _ = DemoEmailService.list_sent_emails()
+        self.assertEqual([email['token'] for email in emails], ['token-0', 'token-2', 'token-1', 'token-0'])
+        emails, _ = DemoEmailService.list_sent_emails(to='other@example.com')
+        self.assertEqual(len(emails), 1)
+
+    def test_torn_records_are_repaired(self):
+        """Оборванная запись индекса и строка журнала без индекса не сбивают выравнивание"""
+        self._send(2)
+        with open(os.path.join(self.spool_dir, 'spool.jsonl'), 'ab') as spool:
+            spool.write(json.dumps({'type': 'confirm_email', 'to': 'buyer@example.com', 'token': 'token-2'}).encode()
+                        + b'\n{"type": "conf')
+        with open(os.path.join(self.spool_dir, 'spool.idx'), 'ab') as index:
+            index.write(b'\x00' * 5)
+
+        self._send(1, to='other@example.com')
+        emails, _ = DemoEmailService.list_sent_emails()
+        self.assertEqual([email['token'] for email in emails], ['token-0', 'token-2', 'token-1', 'token-0'])
+
+    def test_readers_take_shared_lock(self):
+        """Чтение страницы не берет эксклюзивную блокировку"""
+        self._send(1)
+        with mock.patch('core.email_service.fcntl.flock') as flock:
+            DemoEmailService.list_sent_emails()
+        self.assertNotIn(mock.call(mock.ANY, email_service.fcntl.LOCK_EX), flock.call_args_list)
+        self.assertIn(mock.call(mock.ANY, email_service.fcntl.LOCK_SH), flock.call_args_list)
+
+    def test_concurrent_writes_are_not_lost(self):
+        """Письма, отправленные одновременно, не перезаписывают друг друга"""
+        threads = [threading.Thread(target=self._send, args=(10, f'user{i}@example.com')) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        emails, _ = DemoEmailService.list_sent_emails(limit=100)
+        self.assertEqual(len(emails), 50)
+
+    def test_pagination_and_filters(self):
+        """Постраничный просмотр с фильтрами по получателю и типу"""
+        self._send(5)
+        self._send(3, to='other@example.com')
+
+        url = reverse('core:sent-emails')
+        response = self.client.get(url, {'limit': 2, 'to': 'buyer@example.com'})
+        self.assertEqual([email['token'] for email in response.data['Emails']], ['token-4', 'token-3'])
+
+        response = self.client.get(url, {'limit': 10, 'to': 'buyer@example.com', 'before': response.data['Next']})
+        self.assertEqual([email['token'] for email in response.data['Emails']], ['token-2', 'token-1', 'token-0'])
+        self.assertIsNone(response.data['Next'])
+
+        response = self.client.get(url, {'type': 'order_confirmation'})
+        self.assertEqual(response.data['Count'], 0)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """locmem-бэкенд, который не принимает письма на адреса fail@..."""
+    opened = 0
+
+    def open(self):
+        type(self).opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(to.startswith('fail@') for message in messages for to in message.to):
+            raise smtplib.SMTPRecipientsRefused({})
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='core.tests.FlakyEmailBackend',
+    EMAIL_DOMAIN_RATE_LIMITS={},
+    EMAIL_DELIVERY_MAX_ATTEMPTS=2,
+)
+class EmailDeliveryTestCase(TestCase):
+    def setUp(self):
+        FlakyEmailBackend.opened = 0
+        EmailDeliveryService._rate_limiter = None
+        self.addCleanup(setattr, EmailDeliveryService, '_rate_limiter', None)
+
+    def test_batch_uses_one_connection(self):
+        """Пачка писем отправляется через одно соединение"""
+        for i in range(10):
+            EmailDeliveryService.enqueue(f'user{i}@example.com', 'Тема', 'Текст')
+
+        stats = EmailDeliveryService.deliver_batch()
+        self.assertEqual(stats['sent'], 10)
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual(QueuedEmail.objects.filter(status='sent').count(), 10)
+
+    def test_failures_are_retried_individually(self):
+        """Ошибка одного письма не мешает остальным и приводит к повтору"""
+        EmailDeliveryService.enqueue('ok@example.com', 'Тема', 'Текст')
+        failing = EmailDeliveryService.enqueue('fail@example.com', 'Тема', 'Текст')
+
+        stats = EmailDeliveryService.deliver_batch()
+        self.assertEqual((stats['sent'], stats['retry']), (1, 1))
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('pending', 1))
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+
+        QueuedEmail.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(EmailDeliveryService.deliver_batch()['failed'], 1)
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, 'failed')
+
+    @override_settings(EMAIL_DOMAIN_RATE_LIMITS={'default': 3})
+    def test_domain_rate_limit_defers(self):
+        """Письма сверх лимита домена откладываются без учета попытки"""
+        for i in range(5):
+            EmailDeliveryService.enqueue(f'user{i}@example.com', 'Тема', 'Текст')
+
+        stats = EmailDeliveryService.deliver_batch()
+        self.assertEqual((stats['sent'], stats['deferred']), (3, 2))
+        self.assertFalse(QueuedEmail.objects.filter(status='pending', attempts__gt=0).exists())
+
+    def test_reconnect_failure_releases_rest_of_batch(self):
+        """Если соединение не открывается заново, остаток пачки сразу возвращается в очередь"""
+        EmailDeliveryService.enqueue('fail@example.com', 'Тема', 'Текст')
+        rest = [EmailDeliveryService.enqueue(f'user{i}@example.com', 'Тема', 'Текст') for i in range(3)]
+
+        def send_messages(self, messages):
+            raise smtplib.SMTPServerDisconnected()
+
+        opened = []
+
+        def open_once(self):
+            # Первое соединение открывается, повторное - нет
+            opened.append(self)
+            if len(opened) > 1:
+                raise OSError('connection refused')
+
+        with mock.patch.object(FlakyEmailBackend, 'send_messages', send_messages), \
+                mock.patch.object(FlakyEmailBackend, 'open', open_once):
+            stats = EmailDeliveryService.deliver_batch()
+
+        self.assertEqual((stats['retry'], stats['deferred']), (1, 3))
+        for queued in rest:
+            queued.refresh_from_db()
+            self.assertEqual((queued.status, queued.attempts), ('pending', 0))
+            self.assertLess(queued.next_attempt_at, timezone.now() + timedelta(seconds=60))
+
+    def test_loop_sleeps_when_batch_only_deferred(self):
+        """deliver_emails --loop не крутится вхолостую, пока письма откладываются"""
+        passes = iter([{'sent': 0, 'retry': 0, 'failed': 0, 'deferred': 5}])
+
+        def deliver_batch(batch_size=None):
+            try:
+                return next(passes)
+            except StopIteration:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(EmailDeliveryService, 'deliver_batch', side_effect=deliver_batch), \
+                mock.patch('core.management.commands.deliver_emails.time.sleep') as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('deliver_emails', loop=True, interval=3, stdout=io.StringIO())
+        sleep.assert_called_once_with(3)
+
+
+class OrderConfirmationEmailTestCase(TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        settings_override = override_settings(DEMO_EMAIL_SPOOL_DIR=self.spool_dir, EMAIL_DELIVERY_QUEUE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        stdout_patch = mock.patch('sys.stdout', new_callable=io.StringIO)
+        stdout_patch.start()
+        self.addCleanup(stdout_patch.stop)
+
+    def test_email_rendered_from_snapshot_without_queries(self):
+        """Письмо о заказе собирается из снимка без запросов к БД"""
+        snapshot = {
+            'id': 42,
+            'status': 'new',
+            'status_display': 'Новый',
+            'date': '2026-10-19 12:30:00',
+            'total_price': 300,
+            'contact': {'id': 1, 'type': 'address', 'value': 'дом',
+                        'full_address': 'Москва, Тверская, д. 1'},
+            'items': [{'product_id': 1, 'product_name': 'Телефон', 'shop_id': 1, 'shop_name': 'Магазин',
+                       'quantity': 3, 'price_per_unit': 100, 'item_total': 300}],
+            'items_count': 1,
+        }
+
+        with self.assertNumQueries(0):
+            self.assertTrue(send_order_confirmation_task(
+                user_email='buyer@example.com', order_id=42, snapshot=snapshot
+            ))
+
+        emails, _ = DemoEmailService.list_sent_emails()
+        self.assertEqual(emails[0]['order_total'], 300)
+        self.assertIn('Телефон x3: 300 руб.', emails[0]['message'])
+        self.assertIn('Москва, Тверская, д. 1', emails[0]['message'])
+
+    def test_snapshot_fallback_from_order(self):
+        """Снимок для задач без снимка строится из заказа"""
+        shop = import_shop()
+        buyer = User.objects.create_user(email='buyer@example.com', password='TestPass123')
+        contact = Contact.objects.create(user=buyer, type='phone', value='+70000000000')
+        order = Order.objects.create(user=buyer, status='new', contact=contact)
+        OrderItem.objects.create(order=order, product=Product.objects.get(), shop=shop, quantity=2)
+
+        snapshot = DemoEmailService.order_snapshot(order)
+        self.assertEqual(snapshot['total_price'], 200)
+        self.assertEqual(snapshot['contact']['full_address'], '+70000000000')
+        self.assertEqual(snapshot['items'][0]['price_per_unit'], 100)
+
+
+class OutboxTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        settings_override = override_settings(DEMO_EMAIL_SPOOL_DIR=self.spool_dir, EMAIL_DELIVERY_QUEUE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        stdout_patch = mock.patch('sys.stdout', new_callable=io.StringIO)
+        stdout_patch.start()
+        self.addCleanup(stdout_patch.stop)
+
+    def _register(self):
+        with mock.patch.object(send_confirm_email_task, 'delay') as delay:
+            response = self.client.post(reverse('core:user-register'), {
+                'email': 'buyer@example.com',
+                'first_name': 'Test',
+                'last_name': 'User',
+                'password': 'TestPass123',
+                'password2': 'TestPass123'
+            }, format='json')
+        delay.assert_not_called()
+        return response
+
+    def test_registration_writes_outbox_instead_of_broker(self):
+        """Регистрация пишет письмо в outbox и не обращается к брокеру"""
+        response = self._register()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task, send_confirm_email_task.name)
+        self.assertEqual(message.payload['token'], response.data['ConfirmToken'])
+
+    def test_local_dispatcher_runs_tasks_without_broker(self):
+        """Локальный диспетчер выполняет задачи из outbox в своем процессе"""
+        self._register()
+
+        stats = OutboxDispatcher(mode='local').dispatch_batch()
+        self.assertEqual(stats['done'], 1)
+        self.assertEqual(OutboxMessage.objects.get().status, 'done')
+
+        emails, _ = DemoEmailService.list_sent_emails()
+        self.assertEqual(emails[0]['to'], 'buyer@example.com')
+        self.assertEqual(OutboxDispatcher(mode='local').dispatch_batch(), {'done': 0, 'retry': 0, 'failed': 0})
+
+    def test_celery_dispatcher_publishes_tasks(self):
+        """В режиме celery диспетчер публикует задачи в брокер"""
+        self._register()
+
+        with mock.patch.object(send_confirm_email_task, 'apply_async') as apply_async:
+            OutboxDispatcher(mode='celery').dispatch_batch()
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['kwargs']['user_email'], 'buyer@example.com')
+
+    def test_beat_schedules_outbox_dispatch(self):
+        """Beat запускает диспетчер, и он передает сообщения в брокер"""
+        self.assertIn(dispatch_outbox_task.name, [entry['task'] for entry in settings.CELERY_BEAT_SCHEDULE.values()])
+        self._register()
+
+        with mock.patch.object(send_confirm_email_task, 'apply_async') as apply_async:
+            self.assertEqual(dispatch_outbox_task(), 1)
+        apply_async.assert_called_once()
+        self.assertEqual(OutboxMessage.objects.get().status, 'done')
+
+    def test_failed_task_is_retried(self):
+        """Ошибка задачи откладывает сообщение для повторной попытки"""
+        message = outbox.enqueue(send_confirm_email_task, user_email='buyer@example.com', token='t')
+
+        with mock.patch.object(DemoEmailService, 'send_confirm_email', side_effect=RuntimeError('SMTP down')):
+            stats = OutboxDispatcher(mode='local').dispatch_batch()
+        self.assertEqual(stats['retry'], 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertGreater(message.available_at, timezone.now())
+
+
+class ThumbnailPipelineTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, PRODUCT_THUMBNAIL_SIZES=(800, 400, 200))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Смартфоны')
+
+    def _product(self, name, color, filename):
+        os.makedirs(os.path.join(self.media_root, 'products'), exist_ok=True)
+        Image.new('RGB', (1200, 900), color).save(os.path.join(self.media_root, 'products', filename))
+        return Product.objects.create(name=name, category=self.category, image=f'products/{filename}')
+
+    def test_backfill_dedupes_identical_images(self):
+        """Одинаковые картинки дают один набор миниатюр всех размеров"""
+        first = self._product('Телефон 1', 'red', 'a.jpg')
+        second = self._product('Телефон 2', 'red', 'b.jpg')
+        third = self._product('Телефон 3', 'blue', 'c.jpg')
+        Product.objects.create(name='Без картинки', category=self.category)
+
+        stats = ThumbnailPipeline.backfill(Product.objects.all(), workers=2)
+        self.assertEqual((stats['sources'], stats['unique'], stats['errors']), (3, 2, 0))
+        self.assertEqual(stats['created'], 6)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual(first.image_hash, second.image_hash)
+        self.assertNotEqual(first.image_hash, third.image_hash)
+
+        for size in (800, 400, 200):
+            with Image.open(os.path.join(self.media_root, thumbnail_name(first.image_hash, size))) as thumb:
+                self.assertEqual(thumb.size, (size, size))
+
+        # Повторный запуск ничего не пересоздает
+        self.assertEqual(ThumbnailPipeline.backfill(Product.objects.all(), workers=2)['created'], 0)
+
+
+    def test_image_change_resets_hash_and_schedules_thumbnails(self):
+        """Новая картинка сбрасывает хэш старой и ставит миниатюры в outbox"""
+        product = self._product('Телефон', 'red', 'a.jpg')
+        ThumbnailPipeline.process_product(product)
+        old_hash = product.image_hash
+        OutboxMessage.objects.all().delete()
+
+        product = Product.objects.get(pk=product.pk)
+        Image.new('RGB', (1200, 900), 'blue').save(os.path.join(self.media_root, 'products', 'b.jpg'))
+        product.image = 'products/b.jpg'
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_hash, '')
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.task, message.payload), (create_product_thumbnails.name, {'product_id': product.pk}))
+        create_product_thumbnails(**message.payload)
+        new_hash = Product.objects.get(pk=product.pk).image_hash
+        self.assertNotIn(new_hash, ('', old_hash))
+
+        # Сохранение без замены картинки хэш не трогает
+        product = Product.objects.get(pk=product.pk)
+        product.name = 'Телефон 2'
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_hash, new_hash)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+class ProductImageVariantsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        import_shop()
+        self.image_hash = 'ab' + '0' * 62
+        Product.objects.update(image='products/phone.jpg', image_hash=self.image_hash)
+
+    def test_list_returns_small_variant_and_srcset(self):
+        """В списке товаров отдается миниатюра 200px и srcset, без проверок файлов"""
+        with mock.patch('os.path.exists', side_effect=AssertionError('обращение к ФС')):
+            response = self.client.get(reverse('core:product-list'))
+
+        product = response.data[0]['product']
+        self.assertEqual(product['image'], f'/media/thumbs/ab/{self.image_hash}_200.jpg')
+        self.assertEqual(product['images']['detail'], f'/media/thumbs/ab/{self.image_hash}_800.jpg')
+        self.assertEqual(product['images']['srcset'].count('w,'), 2)
+
+    def test_detail_context_returns_large_variant(self):
+        """Без контекста списка отдается крупная миниатюра"""
+        data = ProductSerializer(Product.objects.get()).data
+        self.assertTrue(data['image'].endswith('_800.jpg'))
+
+    def test_thumbnails_served_as_immutable(self):
+        """Миниатюры отдаются с заголовком долгосрочного кэширования"""
+        os.makedirs(os.path.join(self.media_root, 'thumbs', 'ab'))
+        with open(os.path.join(self.media_root, 'thumbs', 'ab', f'{self.image_hash}_200.jpg'), 'wb') as f:
+            f.write(b'jpeg')
+
+        request = RequestFactory().get('/')
+        response = serve_thumbnail(request, f'ab/{self.image_hash}_200.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+
+class PartnerOrderEventsTestCase(TestCase):
+    def setUp(self):
+        self.shop_user = create_shop_user()
+        self.shop = import_shop(user=self.shop_user)
+        self.token = Token.objects.create(user=self.shop_user)
+        buyer = User.objects.create_user(email='buyer@example.com', password='TestPass123')
+        self.order = Order.objects.create(user=buyer, status='basket')
+        OrderItem.objects.create(order=self.order, product=Product.objects.get(), shop=self.shop, quantity=1)
+
+    def test_status_change_published_after_commit(self):
+        """Смена статуса заказа публикуется магазинам заказа после коммита"""
+        order = Order.objects.get(pk=self.order.pk)
+        with mock.patch('core.signals.broker.publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                order.status = 'new'
+                order.save()
+            order.save()
+
+        publish.assert_called_once()
+        shop_ids, event = publish.call_args.args
+        self.assertEqual(shop_ids, [self.shop.id])
+        self.assertEqual(event['type'], 'order_created')
+        self.assertEqual(event['order_id'], order.id)
+
+    async def test_event_stream_delivers_events(self):
+        """SSE-поток магазина получает опубликованные события"""
+        response = await self.async_client.get(
+            reverse('core:partner-order-events'),
+            headers={'Authorization': f'Token {self.token.key}'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = aiter(response.streaming_content)
+        self.assertIn(b': connected', await anext(stream))
+        self.assertEqual(broker.subscriber_count(self.shop.id), 1)
+
+        broker.publish([self.shop.id + 1], {'type': 'order_created', 'order_id': 1})
+        broker.publish([self.shop.id], {'type': 'order_status', 'order_id': self.order.id})
+        chunk = (await anext(stream)).decode()
+        self.assertIn('event: order_status', chunk)
+        self.assertIn(f'"order_id": {self.order.id}', chunk)
+
+        # Отключение клиента: ASGI-сервер отменяет ожидание следующего события
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(broker.subscriber_count(self.shop.id), 0)
+
+    async def test_event_stream_requires_shop(self):
+        response = await self.async_client.get(reverse('core:partner-order-events'))
+        self.assertEqual(response.status_code, 403)
+
+
+class CatalogCacheWarmupTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        # Команда прогрева сбрасывает общий счетчик: подписи прошлых тестов не нужны
+        query_recorder.pending.clear()
+        self.shop = import_shop()
+
+    def test_query_signatures_recorded_in_batches(self):
+        """Запросы каталога нормализуются и сбрасываются в БД пачкой"""
+        recorder = CatalogQueryRecorder(flush_interval=3600)
+        recorder.record(catalog_query_signature(QueryDict('shop_id=1&category_id=1&format=json')))
+        recorder.record(catalog_query_signature(QueryDict('category_id=1&shop_id=1')))
+        self.assertFalse(CatalogQueryStat.objects.exists())
+
+        recorder.flush()
+        stat = CatalogQueryStat.objects.get()
+        self.assertEqual((stat.signature, stat.hits), ('category_id=1&shop_id=1', 2))
+
+    def test_import_schedules_single_warmup(self):
+        """Импорт ставит прогрев в outbox, повторный импорт его не дублирует"""
+        OutboxMessage.objects.all().delete()
+        with shared_cache():
+            CatalogImportService.import_shop_data(self.shop.user, {'shop': 'Магазин', 'goods': []})
+            CatalogImportService.import_shop_data(self.shop.user, {'shop': 'Магазин', 'goods': []})
+        self.assertEqual(OutboxMessage.objects.filter(task=warm_catalog_cache_task.name).count(), 1)
+
+    def test_warmup_not_scheduled_with_process_local_cache(self):
+        """С кэшем в памяти процесса прогрев в воркере бесполезен и не ставится"""
+        OutboxMessage.objects.all().delete()
+        CatalogImportService.import_shop_data(self.shop.user, {'shop': 'Магазин', 'goods': []})
+        self.assertFalse(OutboxMessage.objects.filter(task=warm_catalog_cache_task.name).exists())
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['core.W001'])
+        with self.assertRaisesMessage(CommandError, 'в памяти процесса'):
+            call_command('warm_catalog_cache', stdout=io.StringIO())
+        with shared_cache():
+            out = io.StringIO()
+            call_command('warm_catalog_cache', stdout=out)
+        self.assertIn('Запросов: 0', out.getvalue())
+
+    def test_warmup_fills_cache_for_top_queries(self):
+        """Прогрев заполняет кэш частыми запросами с ограничением частоты"""
+        CatalogQueryStat.objects.create(signature=f'shop_id={self.shop.id}', hits=10)
+        CatalogQueryStat.objects.create(signature='', hits=5)
+        CatalogQueryStat.objects.create(signature='search=редкий', hits=1)
+
+        sleep = mock.Mock()
+        stats = CatalogCacheWarmer.warm(limit=2, rate=1000, sleep=sleep)
+        self.assertEqual(stats['warmed'], 2)
+        self.assertTrue(cache.get(product_list_cache_key(QueryDict(f'shop_id={self.shop.id}'))))
+        self.assertIsNone(cache.get(product_list_cache_key(QueryDict('search=редкий'))))
+
+        self.assertEqual(CatalogCacheWarmer.warm(limit=2, rate=1000, sleep=sleep)['cached'], 2)
+        self.assertEqual(CatalogQueryStat.objects.get(signature='').hits, 5)
+
+    def test_concurrent_warmup_skipped(self):
+        cache.add(WARMUP_LOCK_KEY, 1)
+        self.assertIsNone(CatalogCacheWarmer.warm())
+
+
+class SalesRollupTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.shop_user = create_shop_user()
+        self.shop = import_shop(good(1, quantity=50), good(2, 10, 'Чехол', quantity=50), user=self.shop_user)
+        self.phone = Product.objects.get(name='Телефон')
+        self.case = Product.objects.get(name='Чехол')
+        self.buyer = User.objects.create_user(email='buyer@example.com', password='TestPass123')
+        self.contact = Contact.objects.create(user=self.buyer, type='phone', value='+70000000000')
+
+    def _confirm_order(self, items):
+        order = Order.objects.create(user=self.buyer, status='basket')
+        for product, quantity in items:
+            OrderItem.objects.create(order=order, product=product, shop=self.shop, quantity=quantity)
+        self.client.force_authenticate(self.buyer)
+        response = self.client.post(reverse('core:order-confirm'),
+                                    {'order_id': order.id, 'contact_id': self.contact.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return Order.objects.get(pk=order.pk)
+
+    def test_confirmation_and_cancel_update_rollups(self):
+        """Подтверждение добавляет заказ в агрегаты, отмена - вычитает"""
+        self._confirm_order([(self.phone, 2), (self.case, 3)])
+        order = self._confirm_order([(self.phone, 1)])
+
+        day = ShopDailySales.objects.get(shop=self.shop)
+        self.assertEqual((day.orders, day.units, day.revenue), (2, 6, 330))
+        self.assertEqual(ProductDailySales.objects.get(product=self.phone).units, 3)
+
+        order.status = 'canceled'
+        order.save()
+        day.refresh_from_db()
+        self.assertEqual((day.orders, day.units, day.revenue), (1, 5, 230))
+
+    def test_rollups_dated_by_confirmation(self):
+        """Корзина, собранная в другой день, попадает в продажи дня подтверждения"""
+        basket_day = timezone.now() - timedelta(days=3)
+        with mock.patch('django.utils.timezone.now', return_value=basket_day):
+            order = Order.objects.create(user=self.buyer, status='basket')
+            OrderItem.objects.create(order=order, product=self.phone, shop=self.shop, quantity=1)
+        self.client.force_authenticate(self.buyer)
+        self.client.post(reverse('core:order-confirm'), {'order_id': order.id, 'contact_id': self.contact.id},
+                         format='json')
+
+        today = timezone.localdate()
+        self.assertEqual(list(ShopDailySales.objects.values_list('date', 'orders')), [(today, 1)])
+        SalesRollupService.rebuild()
+        self.assertEqual(list(ShopDailySales.objects.values_list('date', 'orders')), [(today, 1)])
+
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'canceled'
+        order.save()
+        self.assertEqual(list(ShopDailySales.objects.values_list('date', 'orders')), [(today, 0)])
+
+    def test_rebuild_matches_incremental(self):
+        """Пересчет с нуля дает те же агрегаты, что и инкрементальное обновление"""
+        self._confirm_order([(self.phone, 2), (self.case, 3)])
+        self._confirm_order([(self.case, 1)])
+        before = list(ProductDailySales.objects.order_by('product_id').values_list('product_id', 'units', 'revenue'))
+
+        ProductDailySales.objects.all().delete()
+        ShopDailySales.objects.all().delete()
+        SalesRollupService.rebuild()
+
+        self.assertEqual(
+            list(ProductDailySales.objects.order_by('product_id').values_list('product_id', 'units', 'revenue')),
+            before
+        )
+        self.assertEqual(ShopDailySales.objects.get().orders, 2)
+
+    def test_analytics_endpoint(self):
+        """Аналитика за период суммирует дневные агрегаты"""
+        self._confirm_order([(self.phone, 2), (self.case, 3)])
+
+        self.client.force_authenticate(self.shop_user)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('core:partner-analytics'), {'top': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['Totals'], {'revenue': 230, 'units': 5, 'orders': 1})
+        self.assertEqual(response.data['TopProducts'], [
+            {'product_id': self.phone.id, 'product_name': 'Телефон', 'units': 2, 'revenue': 200}
+        ])
+
+
+class RetentionTestCase(APITestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        settings_override = override_settings(DEMO_EMAIL_SPOOL_DIR=self.spool_dir, EMAIL_DELIVERY_QUEUE=False,
+                                              RETENTION_BATCH_PAUSE=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        stdout_patch = mock.patch('sys.stdout', new_callable=io.StringIO)
+        stdout_patch.start()
+        self.addCleanup(stdout_patch.stop)
+
+        self.shop = import_shop()
+        self.buyer = User.objects.create_user(email='buyer@example.com', password='TestPass123')
+        self.old = timezone.now() - timedelta(days=365)
+
+    def _order(self, status, dt, price_per_unit=100):
+        order = Order.objects.create(user=self.buyer, status=status)
+        OrderItem.objects.create(order=order, product=Product.objects.get(), shop=self.shop,
+                                 quantity=2, price_per_unit=price_per_unit)
+        Order.objects.filter(pk=order.pk).update(dt=dt, updated_at=dt)
+        return order
+
+    def test_closed_orders_archived_in_batches(self):
+        """Старые закрытые заказы переносятся в архив пачками, остальные не трогаются"""
+        archived = [self._order('delivered', self.old) for _ in range(3)]
+        recent = self._order('delivered', timezone.now())
+        active = self._order('sent', self.old)
+        SalesRollupService.rebuild()
+
+        count = RetentionService.archive_orders(timezone.now() - timedelta(days=180), batch_size=2, pause=0)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {recent.id, active.id})
+        self.assertEqual(ArchivedOrder.objects.get(pk=archived[0].pk).total_price, 200)
+        # Архивные заказы по-прежнему учитываются в продажах, в том числе после пересчета
+        units = ProductDailySales.objects.aggregate(total=Sum('units'))['total']
+        SalesRollupService.rebuild()
+        self.assertEqual(ProductDailySales.objects.aggregate(total=Sum('units'))['total'], units)
+
+    def test_order_total_unchanged_by_price_change_and_archiving(self):
+        """Сумма заказа считается по ценам подтверждения - до и после переноса в архив"""
+        order = self._order('delivered', self.old)
+        ProductInfo.objects.update(price=500)
+        url = reverse('core:order-detail', args=[order.id])
+        self.client.force_authenticate(self.buyer)
+
+        live = self.client.get(url).data
+        self.assertEqual((live['total_price'], live['items'][0]['price']), (200, 100))
+        self.assertEqual(self.client.get(reverse('core:order-list')).data['Orders'][0]['total_price'], 200)
+
+        RetentionService.archive_orders(timezone.now(), pause=0)
+        archived = self.client.get(url).data
+        self.assertTrue(archived['archived'])
+        self.assertEqual((archived['total_price'], archived['items'][0]['price']), (200, 100))
+
+    def test_recent_activity_keeps_old_orders(self):
+        """Отбор по последнему изменению, а не по дате создания заказа"""
+        basket = self._order('basket', self.old)
+        delivered = self._order('sent', self.old)
+
+        self.client.force_authenticate(self.buyer)
+        self.client.post(reverse('core:basket'), {
+            'product_id': Product.objects.get().id, 'shop_id': self.shop.id, 'quantity': 1
+        }, format='json')
+        delivered.status = 'delivered'
+        delivered.save()
+
+        stats = RetentionService.run(pause=0)
+        self.assertEqual((stats['baskets'], stats['archived_orders']), (0, 0))
+        self.assertEqual(Order.objects.filter(pk__in=[basket.pk, delivered.pk]).count(), 2)
+
+    def test_archived_order_available_in_detail_api(self):
+        order = self._order('canceled', self.old)
+        RetentionService.archive_orders(timezone.now(), pause=0)
+
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get(reverse('core:order-detail', args=[order.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['archived'])
+        self.assertEqual(response.data['items'][0]['total_price'], 200)
+
+        other = User.objects.create_user(email='other@example.com', password='TestPass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('core:order-detail', args=[order.id])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_purges_stale_baskets_tokens_and_spool(self):
+        """Очистка брошенных корзин, просроченных токенов и старых писем журнала"""
+        stale_basket = self._order('basket', self.old)
+        fresh_basket = self._order('basket', timezone.now())
+        token = ConfirmEmailToken.objects.create(user=self.buyer)
+        ConfirmEmailToken.objects.filter(pk=token.pk).update(created_at=self.old)
+        DemoEmailService._save_to_file({'type': 'confirm_email', 'to': 'old@example.com',
+                                        'timestamp': '2020-01-01T00:00:00'})
+        DemoEmailService.send_confirm_email('new@example.com', 'token')
+
+        stats = RetentionService.run(pause=0)
+
+        self.assertEqual(stats['baskets'], 1)
+        self.assertEqual(stats['confirm_tokens'], 1)
+        self.assertEqual(stats['spool_emails'], 1)
+        self.assertFalse(Order.objects.filter(pk=stale_basket.pk).exists())
+        self.assertTrue(Order.objects.filter(pk=fresh_basket.pk).exists())
+        emails, _ = DemoEmailService.list_sent_emails()
+        self.assertEqual([email['to'] for email in emails], ['new@example.com'])
+
+
+class CachedAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        shared = shared_cache()
+        shared.__enter__()
+        self.addCleanup(shared.__exit__, None, None, None)
+        cache.clear()
+        credential_cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', password='TestPass123', is_active=True)
+        self.token = Token.objects.create(user=self.user)
+        self.factory = RequestFactory()
+
+    def _token_request(self, key=None):
+        return self.factory.get('/', HTTP_AUTHORIZATION=f'Token {key or self.token.key}')
+
+    def _basic_request(self, password='TestPass123'):
+        credentials = base64.b64encode(f'buyer@example.com:{password}'.encode()).decode()
+        return self.factory.get('/', HTTP_AUTHORIZATION=f'Basic {credentials}')
+
+    def test_verified_token_served_without_queries(self):
+        """Повторная проверка токена не обращается к БД"""
+        authentication = CachedTokenAuthentication()
+        user, _ = authentication.authenticate(self._token_request())
+        self.assertEqual(user.pk, self.user.pk)
+
+        with self.assertNumQueries(0):
+            cached_user, token = authentication.authenticate(self._token_request())
+        self.assertEqual((cached_user.pk, token.key), (self.user.pk, self.token.key))
+        self.assertIsNot(cached_user, user)
+
+    def test_logout_invalidates_token(self):
+        CachedTokenAuthentication().authenticate(self._token_request())
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.post(reverse('core:user-logout')).status_code, status.HTTP_200_OK)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            CachedTokenAuthentication().authenticate(self._token_request())
+
+    def test_basic_password_checked_once_per_window(self):
+        """Basic: пароль проверяется один раз, смена пароля сбрасывает кэш"""
+        authentication = CachedBasicAuthentication()
+        authentication.authenticate(self._basic_request())
+        with mock.patch.object(User, 'check_password') as check_password:
+            authentication.authenticate(self._basic_request())
+        check_password.assert_not_called()
+
+        self.user.set_password('NewPass456')
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authentication.authenticate(self._basic_request())
+
+    def test_invalidation_during_lookup_not_cached(self):
+        """Выход, случившийся во время проверки в БД, не попадает в кэш под новой эпохой"""
+        since = credential_cache.snapshot()
+        credential_cache.invalidate_user(self.user.pk)
+        credential_cache.set(('token', self.token.key), self.user, self.token, since)
+        self.assertIsNone(credential_cache.get(('token', self.token.key)))
+
+    def test_disabled_with_process_local_cache(self):
+        """С LocMemCache сброс не дошел бы до других процессов - кэш не используется"""
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            authentication = CachedTokenAuthentication()
+            authentication.authenticate(self._token_request())
+            with self.assertNumQueries(1):
+                authentication.authenticate(self._token_request())
+            self.assertEqual([error.id for error in check_credential_cache(None)], ['core.W002'])
+
+    def test_cache_is_bounded_lru(self):
+        lru = VerifiedCredentialCache(max_size=2, ttl=60)
+        lru.set('a', self.user, None, lru.snapshot())
+        lru.set('b', self.user, None, lru.snapshot())
+        lru.get('a')
+        lru.set('c', self.user, None, lru.snapshot())
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get('b'))
+        self.assertIsNotNone(lru.get('a'))
+
+
+class ConstantStateThrottleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1')
+        self.now = 1_000_000.0
+
+    def _throttle(self, throttle_class, rate):
+        throttle = throttle_class()
+        throttle.rate = rate
+        throttle.num_requests, throttle.duration = throttle.parse_rate(rate)
+        throttle.timer = lambda: self.now
+        return throttle
+
+    def test_sliding_window_weights_previous_window(self):
+        """Скользящее окно учитывает предыдущее окно пропорционально"""
+        throttle = self._throttle(RegisterThrottle, '10/min')
+        self.now = 60 * 1000 + 30
+        results = [throttle.allow_request(self.request, None) for _ in range(12)]
+        self.assertEqual(results.count(True), 10)
+        self.assertGreater(throttle.wait(), 0)
+
+        # Середина следующего окна: 10 * 0.5 от предыдущего - доступно еще 5
+        self.now += 60
+        results = [throttle.allow_request(self.request, None) for _ in range(10)]
+        self.assertEqual(results.count(True), 5)
+
+        # Состояние - два счетчика, а не список отметок времени
+        self.assertEqual(len(cache._cache), 2)
+
+    def test_token_bucket_refills(self):
+        throttle = self._throttle(BasketThrottle, '60/min')
+        user_request = RequestFactory().get('/')
+        user_request.user = User(pk=1)
+
+        results = [throttle.allow_request(user_request, None) for _ in range(61)]
+        self.assertEqual(results.count(True), 60)
+        self.assertAlmostEqual(throttle.wait(), 1.0)
+
+        self.now += 2
+        self.assertTrue(throttle.allow_request(user_request, None))
+        self.assertTrue(throttle.allow_request(user_request, None))
+        self.assertFalse(throttle.allow_request(user_request, None))
+
+    def test_token_bucket_concurrent_requests(self):
+        """Параллельные воркеры не тратят один и тот же токен дважды"""
+        class SlowCache:
+            # Расширяет окно между чтением и записью состояния корзины
+            def __getattr__(self, name):
+                return getattr(cache, name)
+
+            def get(self, *args, **kwargs):
+                value = cache.get(*args, **kwargs)
+                time.sleep(0.01)
+                return value
+
+        user_request = RequestFactory().get('/')
+        user_request.user = User(pk=1)
+        barrier = threading.Barrier(20)
+        results = []
+
+        def worker():
+            throttle = self._throttle(BasketThrottle, '5/min')
+            throttle.cache = SlowCache()
+            barrier.wait()
+            results.append(throttle.allow_request(user_request, None))
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 5)
+
+
+# Маршруты для AsyncViewsTestCase: основные + async-версии view
+urlpatterns = project_urlpatterns + [
+    path('async/products/', async_views.product_list),
+    path('async/basket/', async_views.basket),
+    path('async/orders/', async_views.order_list),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shop = import_shop(
+            good(1, price_rrc=110, parameters={'Цвет': 'черный'}),
+            good(2, 300, 'Планшет', price_rrc=320, quantity=2),
+        )
+        self.buyer = User.objects.create_user(email='buyer@example.com', password='TestPass123', is_active=True)
+        self.auth = {'Authorization': f'Token {Token.objects.create(user=self.buyer).key}'}
+        tablet, phone = Product.objects.order_by('name')
+        for status_value in ('new', 'delivered', 'basket'):
+            order = Order.objects.create(user=self.buyer, status=status_value)
+            OrderItem.objects.create(order=order, product=phone, shop=self.shop, quantity=2)
+            OrderItem.objects.create(order=order, product=tablet, shop=self.shop, quantity=1)
+
+    async def _compare(self, sync_url, async_url, params=None, **kwargs):
+        sync_response = await self.async_client.get(sync_url, params, **kwargs)
+        await cache.aclear()
+        async_response = await self.async_client.get(async_url, params, **kwargs)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        return json.loads(async_response.content)
+
+    async def test_product_list_matches_sync(self):
+        data = await self._compare(reverse('core:product-list'), '/async/products/')
+        self.assertEqual(len(data), 2)
+        data = await self._compare(reverse('core:product-list'), '/async/products/', {'search': 'План'})
+        self.assertEqual([item['product']['name'] for item in data], ['Планшет'])
+
+    async def test_basket_matches_sync(self):
+        data = await self._compare(reverse('core:basket'), '/async/basket/', headers=self.auth)
+        self.assertEqual(data['Total'], 500)
+        await self._compare(reverse('core:basket'), '/async/basket/')
+
+    async def test_basket_changes_delegated_to_sync_view(self):
+        """Изменение корзины через async-маршрут выполняет синхронный BasketView"""
+        item = await OrderItem.objects.filter(order__status='basket').afirst()
+        response = await self.async_client.delete(
+            '/async/basket/', {'item_id': item.id}, content_type='application/json', headers=self.auth
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await OrderItem.objects.filter(order__status='basket').acount(), 1)
+
+    async def test_order_list_matches_sync(self):
+        data = await self._compare(reverse('core:order-list'), '/async/orders/', headers=self.auth)
+        self.assertEqual(data['Count'], 2)
+        self.assertEqual([order['total_price'] for order in data['Orders']], [500, 500])
+
+    async def test_product_list_flushes_query_stats(self):
+        """Сброс статистики запросов в БД не выполняется в event loop"""
+        query_recorder.pending.clear()
+        with mock.patch.object(query_recorder, 'flush_interval', 0):
+            response = await self.async_client.get('/async/products/', {'search': 'План'})
+        self.assertEqual(response.status_code, 200)
+        stat = await CatalogQueryStat.objects.aget(signature=catalog_query_signature({'search': 'План'}))
+        self.assertEqual(stat.hits, 1)
+
+    async def test_product_list_without_inline_parameters(self):
+        """Позиции без JSON-копии параметров отдаются без синхронных запросов"""
+        await ProductInfo.objects.aupdate(parameters_json=None)
+        data = await self._compare(reverse('core:product-list'), '/async/products/')
+        phone = next(item for item in data if item['product']['name'] == 'Телефон')
+        self.assertEqual(phone['parameters'], [{'parameter': 'Цвет', 'value': 'черный'}])
+
+    @mock.patch.object(AnonRateThrottle, 'THROTTLE_RATES', {'anon': '1/day'})
+    async def test_throttling_applies(self):
+        self.assertEqual((await self.async_client.get('/async/products/')).status_code, 200)
+        response = await self.async_client.get('/async/products/')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class DatabaseProfileTestCase(TestCase):
+    def test_sqlite_pragmas_applied_on_connect(self):
+        """PRAGMA из SQLITE_PRAGMAS выполняются при создании соединения"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Профиль SQLite не используется')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['cache_size'])
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_wal_is_opt_in(self):
+        """Режим журнала меняет файл БД - без DJANGO_SQLITE_WAL соединение его не трогает"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Профиль SQLite не используется')
+        self.assertFalse(settings.SQLITE_WAL)
+        self.assertNotIn('journal_mode', connection.settings_dict['OPTIONS']['init_command'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.shop = import_shop()
+        self.buyer = User.objects.create_user(email='buyer@example.com', password='TestPass123', is_active=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.buyer).key}')
+
+        # Реплика - файловая копия основной БД на момент снимка. Соединение
+        # создается без записи в DATABASES: тестовая БД для него не нужна
+        replica_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, replica_dir, ignore_errors=True)
+        primary = connections['default']
+        replica_settings = {**primary.settings_dict, 'NAME': os.path.join(replica_dir, 'replica.sqlite3')}
+        replica = type(primary)(replica_settings, 'replica')
+        primary.ensure_connection()
+        replica.ensure_connection()
+        # backup() ждет снятия блокировки открытой транзакции теста, поэтому
+        # дамп; в нем таблицы идут не в порядке внешних ключей
+        replica.connection.execute('PRAGMA foreign_keys=OFF')
+        replica.connection.executescript('\n'.join(primary.connection.iterdump()))
+        replica.connection.execute('PRAGMA foreign_keys=ON')
+        connections['replica'] = replica
+        self.addCleanup(self._drop_replica)
+
+    def _drop_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+
+    def test_catalog_reads_served_from_replica(self):
+        """Каталог читается с реплики и может отставать от основной БД"""
+        ProductInfo.objects.update(price=150)
+
+        response = self.client.get(reverse('core:product-list'))
+        self.assertEqual([item['price'] for item in response.data], [100])
+
+    def test_user_reads_own_writes_after_write(self):
+        """После изменения пользователь читает с основной БД"""
+        Order.objects.create(user=self.buyer, status='new')
+        self.assertEqual(self.client.get(reverse('core:order-list')).data['Count'], 0)
+
+        response = self.client.post(reverse('core:basket'), {
+            'product_id': Product.objects.get().id, 'shop_id': self.shop.id, 'quantity': 1
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('core:order-list')).data['Count'], 1)
+
+    def test_writes_use_primary(self):
+        router = ReplicaRouter()
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Order), 'replica')
+            self.assertEqual(router.db_for_write(Order), 'default')
+            self.assertEqual(Order.objects.select_for_update().db, 'default')
+        self.assertEqual(router.db_for_read(Order), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+
+
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        metrics_registry.reset()
+        import_shop()
+
+    def _metrics(self):
+        with override_settings(METRICS_AUTH_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_request_metrics_by_route(self):
+        """Время, SQL-запросы, размер ответа и попадания в кэш по шаблону маршрута"""
+        self.client.get(reverse('core:product-list'))
+        self.client.get(reverse('core:product-list'))
+        self.client.get('/api/v1/products/1/price-history/')
+
+        text = self._metrics()
+        labels = 'route="/api/v1/products/",method="GET"'
+        self.assertIn(f'http_requests_total{{{labels},status="200"}} 2', text)
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'http_response_size_bytes_count{{{labels}}} 2', text)
+        self.assertIn('route="/api/v1/products/<int:product_id>/price-history/"', text)
+        self.assertIn('cache_lookups_total{cache="catalog",result="hit"} 1', text)
+        self.assertIn('cache_lookups_total{cache="catalog",result="miss"} 1', text)
+
+        # Первый запрос читает каталог из БД, второй - из кэша
+        histogram = metrics_registry.histograms['http_request_db_queries'][
+            (('route', '/api/v1/products/'), ('method', 'GET'))
+        ]
+        self.assertGreater(histogram.sum, 0)
+        self.assertEqual(histogram.counts[0], 1)
+
+    @override_settings(METRICS_AUTH_TOKEN=None)
+    def test_metrics_closed_without_token(self):
+        """Без настроенного токена метрики не отдаются никому"""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(METRICS_AUTH_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RequestProfilerTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+        settings_override = override_settings(
+            REQUEST_PROFILER_SECRET='secret', REQUEST_PROFILER_DIR=self.profile_dir, REQUEST_PROFILER_KEEP=2
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _files(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_profiles_only_authorized_requests(self):
+        """Профиль и трассировка SQL пишутся только для запроса с секретом"""
+        self.client.get(reverse('core:product-list'))
+        self.client.get(reverse('core:product-list'), HTTP_X_PROFILE='wrong')
+        self.assertEqual(self._files(), [])
+
+        response = self.client.get(reverse('core:product-list'), HTTP_X_PROFILE='secret')
+        profile_id = response['X-Profile-Id']
+        self.assertEqual(self._files(), [f'{profile_id}.prof', f'{profile_id}.sql.json'])
+
+        with open(os.path.join(self.profile_dir, f'{profile_id}.sql.json')) as f:
+            trace = json.load(f)
+        self.assertEqual(trace['route'], 'api/v1/products/')
+        self.assertEqual(trace['queries'], len(trace['sql']))
+        self.assertGreater(trace['queries'], 0)
+
+        import pstats
+        pstats.Stats(os.path.join(self.profile_dir, f'{profile_id}.prof'))
+
+    def test_sql_params_redacted_by_default(self):
+        """Значения параметров SQL и строка запроса не попадают на диск без явной настройки"""
+        user = User.objects.create_user(email='buyer@example.com', password='TestPass123', is_active=True)
+        token = Token.objects.create(user=user)
+
+        def trace_text(**settings_kwargs):
+            with override_settings(**settings_kwargs):
+                profile_id = self.client.get(
+                    reverse('core:basket'), {'key': 'secret-value'},
+                    HTTP_X_PROFILE='secret', HTTP_AUTHORIZATION=f'Token {token.key}'
+                )['X-Profile-Id']
+            with open(os.path.join(self.profile_dir, f'{profile_id}.sql.json')) as f:
+                return f.read()
+
+        trace = trace_text()
+        self.assertNotIn(token.key, trace)
+        self.assertNotIn('secret-value', trace)
+        self.assertIn('<скрыто: 1>', trace)
+
+        credential_cache.clear()
+        trace = trace_text(REQUEST_PROFILER_CAPTURE_PARAMS=True)
+        self.assertIn(token.key, trace)
+        self.assertIn('secret-value', trace)
+
+    def test_rotation_keeps_latest(self):
+        ids = [
+            self.client.get(reverse('core:product-list'), HTTP_X_PROFILE='secret')['X-Profile-Id']
+            for _ in range(3)
+        ]
+        self.assertEqual(len(self._files()), 4)
+        self.assertNotIn(f'{ids[0]}.prof', self._files())
+
+    def test_single_profile_at_a_time(self):
+        """Запрос во время профилирования другого обрабатывается без профиля"""
+        inner_responses = []
+
+        def outer_view(request):
+            # Вложенный вызов - второй запрос, пока первый профилируется
+            inner_responses.append(middleware(RequestFactory().get('/inner/', HTTP_X_PROFILE='secret')))
+            return HttpResponse()
+
+        middleware = RequestProfilerMiddleware(
+            lambda request: outer_view(request) if request.path == '/outer/' else HttpResponse('inner')
+        )
+        response = middleware(RequestFactory().get('/outer/', HTTP_X_PROFILE='secret'))
+
+        self.assertEqual(inner_responses[0].content, b'inner')
+        self.assertFalse(inner_responses[0].has_header('X-Profile-Id'))
+        self.assertEqual(self._files(), [f"{response['X-Profile-Id']}.prof", f"{response['X-Profile-Id']}.sql.json"])
+
+        # Блокировка освобождена - следующий запрос снова профилируется
+        response = middleware(RequestFactory().get('/inner/', HTTP_X_PROFILE='secret'))
+        self.assertTrue(response.has_header('X-Profile-Id'))
+
+    @override_settings(REQUEST_PROFILER_SECRET=None, REQUEST_PROFILER_SAMPLE_RATE=0)
+    def test_disabled_without_trigger(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestProfilerMiddleware(lambda request: None)
+
+
+class ImportTimeReportTestCase(SimpleTestCase):
+    def test_worker_settings_skip_web_stack(self):
+        """Воркер с settings_worker загружает задачи без allauth и админки"""
+        out = io.StringIO()
+        call_command(
+            'import_time_report', settings_module='myproject.settings_worker',
+            module=['core.tasks'], top=10000, stdout=out
+        )
+        report = out.getvalue()
+        self.assertIn('core.tasks', report)
+        self.assertNotIn('allauth', report)
+        self.assertNotIn('django.contrib.admin', report)
+
+
+class QueryBudgetTestCase(APITestCase):
+    """
+    Число SQL-запросов endpoint'ов не зависит от объема данных.
+
+    Каждый endpoint из core/urls.py вызывается на двух наборах данных: SMALL
+    и LARGE товаров в прайс-листе, позиций в корзине и заказов у покупателя.
+    Число запросов должно совпадать и укладываться в бюджет из BUDGETS.
+    Пользователь подставляется через force_authenticate, поэтому бюджет
+    не включает запросы аутентификации.
+    """
+    SMALL, LARGE = 2, 12
+    # Считаются все запросы, включая SAVEPOINT/RELEASE вложенных транзакций
+    BUDGETS = {
+        'api-root': 0,
+        'user-login': 5,
+        'user-logout': 1,
+        'user-register': 9,
+        'confirm-email': 8,
+        'sent-emails': 0,
+        'product-list': 1,
+        'product-price-history': 2,
+        'basket': 3,
+        'contact-list': 1,
+        'contact-detail': 1,
+        'order-confirm': 22,
+        'order-list': 2,
+        'order-detail': 2,
+        'partner-update': 20,
+        'partner-stock': 5,
+        'partner-state': 1,
+        'partner-orders': 2,
+        'partner-analytics': 3,
+    }
+    NOT_MEASURED = {
+        # Бесконечный поток: запросы к БД только при подключении (аутентификация)
+        'partner-order-events',
+    }
+
+    def setUp(self):
+        cache.clear()
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        settings_override = override_settings(DEMO_EMAIL_SPOOL_DIR=spool_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.datasets = {size: self.seed(size) for size in (self.SMALL, self.LARGE)}
+
+    @staticmethod
+    def price_list(size, price=100):
+        return price_list(*(
+            good(1000 + i, price + i, f'Телефон {size}-{i}', model=f'model-{size}-{i}',
+                 price_rrc=price + i + 10, quantity=100, parameters={'Цвет': 'черный', 'Память': 64})
+            for i in range(size)
+        ), shop=f'Магазин {size}')
+
+    def seed(self, size):
+        """Магазин с size товарами, корзина из size позиций и size заказов по size позиций."""
+        seller = create_shop_user(f'shop{size}@example.com', username=f'shop{size}')
+        shop, _ = CatalogImportService.import_shop_data(seller, self.price_list(size))
+        infos = list(ProductInfo.objects.filter(shop=shop))
+
+        buyer = User.objects.create_user(
+            email=f'buyer{size}@example.com', password='TestPass123', username=f'buyer{size}'
+        )
+        contact = Contact.objects.create(
+            user=buyer, type='address', value='Доставка', city='Москва', street='Тверская', house='1'
+        )
+        basket = Order.objects.create(user=buyer, status='basket')
+        orders = [Order.objects.create(user=buyer, status='new', contact=contact) for _ in range(size)]
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_id=info.product_id, shop=shop, quantity=1, price_per_unit=info.price)
+            for order in [basket, *orders] for info in infos
+        )
+        SalesRollupService.rebuild()
+
+        pending = User.objects.create_user(
+            email=f'pending{size}@example.com', password='TestPass123', username=f'pending{size}', is_active=False
+        )
+        return {
+            'size': size, 'seller': seller, 'shop': shop, 'infos': infos, 'buyer': buyer, 'contact': contact,
+            'basket': basket, 'orders': orders, 'pending': pending,
+            'confirm_token': ConfirmEmailToken.objects.create(user=pending),
+        }
+
+    def endpoint_requests(self, data):
+        """Запрос к каждому endpoint: имя маршрута -> (пользователь, функция запроса)."""
+        client = self.client
+        size, shop, infos = data['size'], data['shop'], data['infos']
+        buyer, seller = data['buyer'], data['seller']
+        price_list = SimpleUploadedFile(
+            'price.yaml', yaml.dump(self.price_list(size, price=200), allow_unicode=True).encode()
+        )
+        return {
+            'api-root': (buyer, lambda: client.get(reverse('core:api-root'))),
+            'user-login': (None, lambda: client.post(
+                reverse('core:user-login'), {'email': buyer.email, 'password': 'TestPass123'}, format='json'
+            )),
+            'user-logout': (buyer, lambda: client.post(reverse('core:user-logout'))),
+            'user-register': (None, lambda: client.post(reverse('core:user-register'), {
+                'email': f'new{size}@example.com', 'first_name': 'Новый', 'last_name': 'Покупатель',
+                'password': 'TestPass123', 'password2': 'TestPass123'
+            }, format='json')),
+            'confirm-email': (None, lambda: client.post(reverse('core:confirm-email'), {
+                'email': data['pending'].email, 'token': data['confirm_token'].key
+            }, format='json')),
+            'sent-emails': (buyer, lambda: client.get(reverse('core:sent-emails'))),
+            'product-list': (None, lambda: client.get(reverse('core:product-list'), {'shop_id': shop.id})),
+            'product-price-history': (None, lambda: client.get(
+                reverse('core:product-price-history', args=[infos[0].product_id]), {'shop_id': shop.id}
+            )),
+            'basket': (buyer, lambda: client.get(reverse('core:basket'))),
+            'contact-list': (buyer, lambda: client.get(reverse('core:contact-list'))),
+            'contact-detail': (buyer, lambda: client.get(reverse('core:contact-detail', args=[data['contact'].id]))),
+            'order-confirm': (buyer, lambda: client.post(reverse('core:order-confirm'), {
+                'order_id': data['basket'].id, 'contact_id': data['contact'].id
+            }, format='json')),
+            'order-list': (buyer, lambda: client.get(reverse('core:order-list'))),
+            'order-detail': (buyer, lambda: client.get(reverse('core:order-detail', args=[data['orders'][0].id]))),
+            'partner-update': (seller, lambda: client.post(
+                reverse('core:partner-update'), {'file': price_list}, format='multipart'
+            )),
+            'partner-stock': (seller, lambda: client.post(reverse('core:partner-stock'), {
+                'items': [{'external_id': 1000 + i, 'quantity': 50} for i in range(size)]
+            }, format='json')),
+            'partner-state': (seller, lambda: client.get(reverse('core:partner-state'))),
+            'partner-orders': (seller, lambda: client.get(reverse('core:partner-orders'))),
+            'partner-analytics': (seller, lambda: client.get(reverse('core:partner-analytics'))),
+        }
+
+    def count_queries(self, user, make_request):
+        """Запросы одного вызова; изменения в БД откатываются, кэш очищается."""
+        cache.clear()
+        self.client.force_authenticate(user)
+        try:
+            # Периодический сброс статистики каталога не относится к запросу
+            with mock.patch.object(query_recorder, 'flush_interval', 3600), transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    response = make_request()
+                transaction.set_rollback(True)
+        finally:
+            self.client.force_authenticate(None)
+        self.assertLess(response.status_code, 300, getattr(response, 'content', b'')[:500])
+        return len(queries)
+
+    def test_every_endpoint_has_budget(self):
+        names = {getattr(pattern, 'name', None) for pattern in get_resolver('core.urls').url_patterns}
+        names |= {pattern.name for pattern in core_urls.router.urls}
+        self.assertEqual(names - {None}, set(self.BUDGETS) | self.NOT_MEASURED)
+
+    def test_product_list_without_inline_parameters(self):
+        """Позиции без JSON-копии параметров не дают запроса на каждую строку"""
+        ProductInfo.objects.update(parameters_json=None)
+        requests = {size: self.endpoint_requests(data)['product-list'] for size, data in self.datasets.items()}
+        small, large = (self.count_queries(*requests[size]) for size in (self.SMALL, self.LARGE))
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.BUDGETS['product-list'] + 2)
+
+    def test_query_count_does_not_grow_with_data(self):
+        requests = {size: self.endpoint_requests(data) for size, data in self.datasets.items()}
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                small, large = (self.count_queries(*requests[size][name]) for size in (self.SMALL, self.LARGE))
+                self.assertEqual(small, large, f'{name}: {small} запросов при N={self.SMALL}, {large} при N={self.LARGE}')
+                self.assertLessEqual(large, budget, f'{name}: бюджет {budget}, выполнено {large}')
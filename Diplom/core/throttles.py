@@ -1,24 +1,137 @@
+import time
+
 from rest_framework.throttling import SimpleRateThrottle
 
-class RegisterThrottle(SimpleRateThrottle):
+
+class SlidingWindowCounterThrottle(SimpleRateThrottle):
+    """
+    Скользящее окно на двух счетчиках.
+
+    SimpleRateThrottle хранит список всех отметок времени за окно и
+    перезаписывает его на каждый запрос. Здесь на ключ хранятся только
+    счетчики текущего и предыдущего окна фиксированной длины; число
+    запросов за скользящее окно оценивается как
+    предыдущий * (доля предыдущего окна) + текущий.
+    Счетчик увеличивается атомарным incr, поэтому ограничение общее для
+    всех воркеров при общем бэкенде кэша (Redis).
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, position = divmod(self.now, self.duration)
+        elapsed = position / self.duration
+        current_key = f'{self.key}:{int(window)}'
+        previous_key = f'{self.key}:{int(window) - 1}'
+
+        counts = self.cache.get_many([previous_key, current_key])
+        previous = counts.get(previous_key, 0)
+        current = counts.get(current_key, 0)
+
+        if previous * (1 - elapsed) + current >= self.num_requests:
+            self.wait_time = self._wait_time(previous, current, elapsed)
+            return self.throttle_failure()
+
+        try:
+            self.cache.incr(current_key)
+        except ValueError:
+            # Первый запрос окна; хранится два окна - потом оно станет предыдущим
+            if not self.cache.add(current_key, 1, self.duration * 2):
+                self.cache.incr(current_key)
+        return True
+
+    def _wait_time(self, previous, current, elapsed):
+        if current < self.num_requests and previous:
+            # Оценка опустится ниже лимита, когда вес предыдущего окна уменьшится
+            needed = 1 - (self.num_requests - current) / previous
+            return max(0, (needed - elapsed) * self.duration)
+        return (1 - elapsed) * self.duration
+
+    def wait(self):
+        return self.wait_time
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket: емкость - num_requests, пополнение - num_requests за duration.
+
+    Допускает короткие всплески до емкости при той же средней скорости.
+    Состояние ключа - пара (токены, время), ее нельзя изменить одним incr,
+    поэтому чтение-изменение-запись выполняется под короткой блокировкой
+    на cache.add (атомарен в Redis и memcached). Воркер, не дождавшийся
+    блокировки, отказывает запросу: всплеск не проходит мимо корзины.
+    """
+
+    LOCK_TIMEOUT = 1
+    LOCK_ATTEMPTS = 20
+    LOCK_RETRY_DELAY = 0.005
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        refill_rate = self.num_requests / self.duration
+        lock_key = f'{self.key}:lock'
+        if not self._acquire(lock_key):
+            self.now = self.timer()
+            self.wait_time = 1 / refill_rate
+            return self.throttle_failure()
+
+        try:
+            self.now = self.timer()
+            tokens, updated = self.cache.get(self.key, (self.num_requests, self.now))
+            tokens = min(self.num_requests, tokens + (self.now - updated) * refill_rate)
+
+            if tokens < 1:
+                self.wait_time = (1 - tokens) / refill_rate
+                return self.throttle_failure()
+
+            # Через duration корзина полна в любом случае - дольше хранить незачем
+            self.cache.set(self.key, (tokens - 1, self.now), self.duration)
+            return True
+        finally:
+            self.cache.delete(lock_key)
+
+    def _acquire(self, lock_key):
+        # Блокировка с таймаутом: упавший воркер не заблокирует ключ навсегда
+        for _ in range(self.LOCK_ATTEMPTS):
+            if self.cache.add(lock_key, 1, self.LOCK_TIMEOUT):
+                return True
+            time.sleep(self.LOCK_RETRY_DELAY)
+        return False
+
+    def wait(self):
+        return self.wait_time
+
+
+class RegisterThrottle(SlidingWindowCounterThrottle):
+    """Регистрации с одного IP: email в запросе задает сам клиент и не годится как ключ."""
     scope = 'register'
-    
+
     def get_cache_key(self, request, view):
-        email = request.data.get('email')
-        if email:
-            return self.cache_format % {
-                'scope': self.scope,
-                'ident': email
-            }
-        return request.META.get('REMOTE_ADDR')
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
 
-class BasketThrottle(SimpleRateThrottle):
+class BasketThrottle(TokenBucketThrottle):
     scope = 'basket'
-    
+
     def get_cache_key(self, request, view):
         if request.user.is_authenticated:
             return self.cache_format % {
                 'scope': self.scope,
                 'ident': request.user.pk
             }
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,134 @@
+"""
+Конвейер миниатюр товаров.
+
+Исходное изображение читается и декодируется один раз, из него по очереди
+получаются все размеры (каждый следующий - из предыдущего, большего).
+Файлы миниатюр адресуются хэшем содержимого исходника, поэтому одинаковые
+картинки разных товаров обрабатываются и хранятся один раз, а имена файлов
+никогда не меняют содержимое (их можно кэшировать навсегда).
+
+Функции верхнего уровня этого модуля не зависят от Django, чтобы их можно
+было выполнять в дочерних процессах пула.
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+THUMBNAIL_DIR = 'thumbs'
+DEFAULT_SIZES = (800, 400, 200)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def thumbnail_name(image_hash, size):
+    return f'{THUMBNAIL_DIR}/{image_hash[:2]}/{image_hash}_{size}.jpg'
+
+
+def render_thumbnails(source_path, media_root, sizes=DEFAULT_SIZES, quality=85):
+    """
+    Создает миниатюры всех размеров для одного исходника.
+
+    Возвращает (хэш содержимого, количество созданных файлов);
+    уже существующие миниатюры не пересоздаются.
+    """
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    image_hash = content_hash(data)
+
+    sizes = sorted(sizes, reverse=True)
+    targets = {size: os.path.join(media_root, thumbnail_name(image_hash, size)) for size in sizes}
+    missing = [size for size in sizes if not os.path.exists(targets[size])]
+    if not missing:
+        return image_hash, 0
+
+    image = Image.open(io.BytesIO(data))
+    # Для JPEG декодер сразу уменьшает изображение до нужного масштаба
+    image.draft('RGB', (sizes[0], sizes[0]))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+
+    os.makedirs(os.path.dirname(targets[sizes[0]]), exist_ok=True)
+    created = 0
+    for size in sizes:
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+        if size not in missing:
+            continue
+        # Запись через временный файл: параллельная обработка одинаковых
+        # картинок не оставит недописанную миниатюру
+        tmp_path = f'{targets[size]}.{os.getpid()}.tmp'
+        image.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+        os.replace(tmp_path, targets[size])
+        created += 1
+
+    return image_hash, created
+
+
+def _render_job(args):
+    source_path, media_root, sizes = args
+    try:
+        return source_path, render_thumbnails(source_path, media_root, sizes), None
+    except Exception as e:
+        return source_path, None, str(e)
+
+
+class ThumbnailPipeline:
+    """Пакетная генерация миниатюр для товаров в пуле процессов."""
+
+    @staticmethod
+    def sizes():
+        from django.conf import settings
+        return tuple(settings.PRODUCT_THUMBNAIL_SIZES)
+
+    @staticmethod
+    def process_product(product):
+        from django.conf import settings
+
+        image_hash, created = render_thumbnails(product.image.path, settings.MEDIA_ROOT,
+                                                ThumbnailPipeline.sizes())
+        if product.image_hash != image_hash:
+            product.image_hash = image_hash
+            product.save(update_fields=['image_hash'])
+        return created
+
+    @staticmethod
+    def backfill(products, workers=None, chunk_size=16, progress=None):
+        """
+        Генерирует миниатюры для всех товаров с изображениями.
+
+        Каждый исходный файл обрабатывается один раз, даже если он
+        используется несколькими товарами.
+        """
+        from django.conf import settings
+        from .models import Product
+
+        products_by_path = {}
+        for product in products.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_hash'):
+            products_by_path.setdefault(product.image.path, []).append(product)
+
+        stats = {'sources': len(products_by_path), 'created': 0, 'errors': 0, 'unique': 0}
+        hashes = set()
+        changed = []
+        jobs = [(path, str(settings.MEDIA_ROOT), ThumbnailPipeline.sizes()) for path in products_by_path]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for done, (path, result, error) in enumerate(pool.map(_render_job, jobs, chunksize=chunk_size), 1):
+                if error:
+                    stats['errors'] += 1
+                else:
+                    image_hash, created = result
+                    hashes.add(image_hash)
+                    stats['created'] += created
+                    for product in products_by_path[path]:
+                        if product.image_hash != image_hash:
+                            product.image_hash = image_hash
+                            changed.append(product)
+                if progress:
+                    progress(done, len(jobs), path, error)
+
+        Product.objects.bulk_update(changed, ['image_hash'], batch_size=500)
+        stats['unique'] = len(hashes)
+        return stats
@@ -1,39 +1,55 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
-    UserLoginView, UserRegistrationView, ProductListView,
+    UserLoginView, UserLogoutView, UserRegistrationView, ProductListView, ProductPriceHistoryView,
     BasketView, ContactViewSet, OrderConfirmView, OrderListView,
-    OrderDetailView, PartnerUpdate, PartnerState, PartnerOrders
+    OrderDetailView, PartnerUpdate, PartnerStockUpdate, PartnerState, PartnerOrders, PartnerAnalytics
 )
-from .views import ConfirmEmailView
+from .views import ConfirmEmailView, ViewSentEmailsView, partner_order_events
 
 router = DefaultRouter()
 router.register(r'contacts', ContactViewSet, basename='contact')
 
 app_name = 'core'
 
+
+def select_view(name, sync_view, async_view):
+    """Async- или sync-версия view в зависимости от ASYNC_VIEW_ROUTES."""
+    return async_view if name in settings.ASYNC_VIEW_ROUTES else sync_view
+
+
 urlpatterns = [
     # Аутентификация
     path('user/login/', UserLoginView.as_view(), name='user-login'),
+    path('user/logout/', UserLogoutView.as_view(), name='user-logout'),
     path('user/register/', UserRegistrationView.as_view(), name='user-register'),
     path('user/confirm-email/', ConfirmEmailView.as_view(), name='confirm-email'),
+    path('emails/', ViewSentEmailsView.as_view(), name='sent-emails'),
     # Товары
-    path('products/', ProductListView.as_view(), name='product-list'),
+    path('products/', select_view('product-list', ProductListView.as_view(), async_views.product_list),
+         name='product-list'),
+    path('products/<int:product_id>/price-history/', ProductPriceHistoryView.as_view(),
+         name='product-price-history'),
     
     # Корзина
-    path('basket/', BasketView.as_view(), name='basket'),
+    path('basket/', select_view('basket', BasketView.as_view(), async_views.basket), name='basket'),
     
     # Контакты
     path('', include(router.urls)),
     
     # Заказы
     path('order/confirm/', OrderConfirmView.as_view(), name='order-confirm'),
-    path('orders/', OrderListView.as_view(), name='order-list'),
+    path('orders/', select_view('order-list', OrderListView.as_view(), async_views.order_list), name='order-list'),
     path('order/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
     
     # Партнерские endpoints
     path('partner/update/', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/stock/', PartnerStockUpdate.as_view(), name='partner-stock'),
     path('partner/state/', PartnerState.as_view(), name='partner-state'),
     path('partner/orders/', PartnerOrders.as_view(), name='partner-orders'),
+    path('partner/orders/events/', partner_order_events, name='partner-order-events'),
+    path('partner/analytics/', PartnerAnalytics.as_view(), name='partner-analytics'),
     
 ]
\ No newline at end of file
@@ -1,11 +1,23 @@
+import asyncio
+import hmac
+import json
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from pathlib import Path
+
 import yaml
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models import (
+    Q, F, Count, Max, Min, Sum, IntegerField, ExpressionWrapper, Prefetch, prefetch_related_objects
+)
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views.static import serve as static_serve
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.core.cache import cache
 
 from rest_framework import status, generics, viewsets
 from rest_framework.views import APIView
@@ -22,14 +34,23 @@ from .tasks import send_confirm_email_task, send_order_confirmation_task
 from .models import (
     User, Shop, Category, Product, ProductInfo, 
     Parameter, ProductParameter, Contact, Order, 
-    OrderItem, ConfirmEmailToken
+    OrderItem, ConfirmEmailToken, PriceHistory, ShopDailySales, ProductDailySales, ArchivedOrder
 )
 from .serializers import (
     UserSerializer, UserLoginSerializer, UserRegistrationSerializer,
     ShopSerializer, CategorySerializer, ProductInfoDetailSerializer,
     ContactSerializer, OrderSerializer, OrderItemSerializer,
-    BasketItemSerializer
+    BasketItemSerializer, StockDeltaSerializer, ArchivedOrderSerializer
 )
+from .authentication import aauthenticate, credential_cache
+from .db_router import ReplicaReadMixin
+from .catalog_cache import catalog_query_signature, product_list_cache_key, query_recorder
+from .email_service import DemoEmailService
+from .metrics import current_request_stats, record_cache_lookup, registry as metrics_registry
+from .events import broker
+from . import outbox
+from .import_service import CatalogImportService
+from .price_list_sync import PriceListSyncService
 from .forms import UserLoginForm, UserRegistrationForm, ContactForm
 from .throttles import RegisterThrottle, BasketThrottle
 
@@ -77,6 +98,21 @@ class UserLoginView(APIView):
                        status=status.HTTP_400_BAD_REQUEST)
 
 
+class UserLogoutView(APIView):
+    """
+    Выход пользователя.
+
+    Удаляет токен авторизации (новый будет выдан при следующем входе)
+    и сбрасывает кэш проверенных учетных данных пользователя.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        Token.objects.filter(user=request.user).delete()
+        credential_cache.invalidate_user(request.user.pk)
+        return Response({'Status': True, 'Message': 'Выход выполнен'})
+
+
 class UserRegistrationView(generics.CreateAPIView):
     """
     Регистрация нового пользователя.
@@ -102,24 +138,29 @@ class UserRegistrationView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             try:
-                # Создаем пользователя
-                user = serializer.save()
-                
-                # Активируем пользователя сразу (для упрощения)
-                user.is_active = True
-                user.save()
-                
-                # Создаем токен для подтверждения email
-                token = None
-                try:
-                    token = ConfirmEmailToken.objects.create(user=user)
-                    # АСИНХРОННАЯ отправка email с подтверждением
-                    send_confirm_email_task.delay(
-                        user_email=user.email,
-                        token=token.key
-                    )
-                except Exception as e:
-                    print(f"Не удалось создать токен подтверждения: {e}")
+                with transaction.atomic():
+                    # Создаем пользователя
+                    user = serializer.save()
+
+                    # Активируем пользователя сразу (для упрощения)
+                    user.is_active = True
+                    user.save()
+
+                    # Создаем токен для подтверждения email
+                    token = None
+                    try:
+                        with transaction.atomic():
+                            token = ConfirmEmailToken.objects.create(user=user)
+                            # Письмо ставится в outbox той же транзакцией и
+                            # отправляется после коммита, без ожидания брокера
+                            outbox.enqueue(
+                                send_confirm_email_task,
+                                user_email=user.email,
+                                token=token.key
+                            )
+                    except Exception as e:
+                        token = None
+                        print(f"Не удалось создать токен подтверждения: {e}")
                 
                 # Формируем ответ
                 response_data = {
@@ -154,7 +195,87 @@ class UserRegistrationView(generics.CreateAPIView):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProductListView(generics.ListAPIView):
+def product_list_queryset(query_params):
+    """Выдача каталога по параметрам запроса (общая для sync и async версий)."""
+    queryset = ProductInfo.objects.select_related(
+        'product', 'product__category', 'shop'
+    ).filter(quantity__gt=0)
+
+    # Параметры берутся из JSON-копии, иначе - из таблиц параметров
+    if not settings.CATALOG_INLINE_PARAMETERS:
+        queryset = queryset.prefetch_related('product_parameters__parameter')
+    
+    # Фильтрация по категории
+    category_id = query_params.get('category_id')
+    if category_id:
+        queryset = queryset.filter(product__category_id=category_id)
+    
+    # Фильтрация по магазину
+    shop_id = query_params.get('shop_id')
+    if shop_id:
+        queryset = queryset.filter(shop_id=shop_id)
+    
+    # Поиск по названию продукта
+    search = query_params.get('search')
+    if search:
+        queryset = queryset.filter(
+            Q(product__name__icontains=search) |
+            Q(model__icontains=search)
+        )
+    
+    # Фильтрация по цене
+    min_price = query_params.get('min_price')
+    max_price = query_params.get('max_price')
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price:
+        queryset = queryset.filter(price__lte=max_price)
+    
+    return queryset
+
+
+def products_missing_parameters(products):
+    """
+    Позиции без JSON-копии параметров (еще не заполнена после импорта):
+    их параметры читаются из таблиц. Пустой список, если JSON-копия не
+    используется - тогда таблицы уже в prefetch_related запроса.
+    """
+    if not settings.CATALOG_INLINE_PARAMETERS:
+        return []
+    return [product_info for product_info in products if product_info.parameters_json is None]
+
+
+def item_prices_queryset(items):
+    """
+    Запрос текущих цен позиций: (product_id, shop_id, price); None, если цены не нужны.
+
+    Позиции подтвержденных заказов берут цену из price_per_unit - их текущая цена не запрашивается.
+    """
+    pairs = {(item.product_id, item.shop_id) for item in items if item.price_per_unit is None}
+    if not pairs:
+        return None
+    return ProductInfo.objects.filter(
+        product_id__in={product_id for product_id, _ in pairs},
+        shop_id__in={shop_id for _, shop_id in pairs}
+    ).values_list('product_id', 'shop_id', 'price')
+
+
+def item_prices(items):
+    """Текущие цены позиций одним запросом: {(product_id, shop_id): price}."""
+    rows = item_prices_queryset(items)
+    if rows is None:
+        return {}
+    return {(product_id, shop_id): price for product_id, shop_id, price in rows}
+
+
+def orders_with_items(queryset):
+    """Заказы с позициями, товарами и магазинами - без запросов на каждую позицию."""
+    return queryset.select_related('user').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product', 'shop'))
+    )
+
+
+class ProductListView(ReplicaReadMixin, generics.ListAPIView):
     """
     Получение списка товаров с фильтрацией.
     
@@ -171,53 +292,119 @@ class ProductListView(generics.ListAPIView):
     """
     serializer_class = ProductInfoDetailSerializer
     permission_classes = [AllowAny]
+
+    def get_serializer_context(self):
+        # В списке товаров отдаем миниатюры списочного размера
+        return super().get_serializer_context() | {'image_variant': 'list'}
     
     def get_queryset(self):
-        queryset = ProductInfo.objects.select_related(
-            'product', 'shop'
-        ).prefetch_related(
-            'product_parameters__parameter'
-        ).filter(quantity__gt=0)
-        
-        # Фильтрация по категории
-        category_id = self.request.query_params.get('category_id')
-        if category_id:
-            queryset = queryset.filter(product__category_id=category_id)
-        
-        # Фильтрация по магазину
-        shop_id = self.request.query_params.get('shop_id')
-        if shop_id:
-            queryset = queryset.filter(shop_id=shop_id)
-        
-        # Поиск по названию продукта
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(product__name__icontains=search) |
-                Q(model__icontains=search)
-            )
-        
-        # Фильтрация по цене
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        
-        return queryset
+        return product_list_queryset(self.request.query_params)
     
     def list(self, request, *args, **kwargs):
-        # Использование ключа на основе параметров запроса
-        cache_key = f"products_{request.GET.urlencode()}"
+        # Статистика реальных запросов - по ней прогревается кэш после импорта
+        if not getattr(request, 'catalog_warmup', False):
+            query_recorder.record(catalog_query_signature(request.query_params))
+
+        # Ключ на основе параметров запроса и версии кэша каталога
+        cache_key = product_list_cache_key(request.query_params)
         cached_data = cache.get(cache_key)
+        record_cache_lookup('catalog', bool(cached_data))
         
         if cached_data:
             return Response(cached_data)
         
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, 300) 
-        return response
+        products = list(self.filter_queryset(self.get_queryset()))
+        # Позиции без JSON-копии параметров - параметры из таблиц одним prefetch
+        prefetch_related_objects(products_missing_parameters(products), 'product_parameters__parameter')
+        data = self.get_serializer(products, many=True).data
+        cache.set(cache_key, data, 300)
+        return Response(data)
+
+
+class ProductPriceHistoryView(ReplicaReadMixin, APIView):
+    """
+    История цен товара с прореживанием.
+
+    Параметры:
+        - shop_id: ID магазина (необязательно)
+        - date_from / date_to: период в формате ГГГГ-ММ-ДД (по умолчанию последние 30 дней)
+        - points: максимальное количество точек на магазин (по умолчанию 100)
+
+    Возвращает:
+        - Series: точки по магазинам - начало интервала (unix time),
+          минимальная и максимальная цена, количество изменений
+        - Start: цена на начало периода (если указан shop_id)
+    """
+    permission_classes = [AllowAny]
+    max_points = 1000
+
+    def get(self, request, product_id):
+        try:
+            date_to = parse_date(request.query_params.get('date_to', '')) or timezone.now().date()
+            date_from = parse_date(request.query_params.get('date_from', '')) or date_to - timedelta(days=30)
+            points = min(int(request.query_params.get('points', 100)), self.max_points)
+            shop_id = request.query_params.get('shop_id')
+            shop_id = int(shop_id) if shop_id else None
+        except ValueError as e:
+            return Response({'Status': False, 'Error': f'Неверные параметры: {e}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if date_from > date_to or points < 1:
+            return Response({'Status': False, 'Error': 'Неверный период или количество точек'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        start = datetime.combine(date_from, time.min, tzinfo=dt_timezone.utc)
+        end = datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+        ts_from, ts_to = int(start.timestamp()), int(end.timestamp())
+        step = -(-(ts_to - ts_from) // points)
+
+        # Фильтр по месяцу отсекает остальные "секции" по индексу
+        history = PriceHistory.objects.filter(
+            product_id=product_id,
+            month__gte=PriceHistory.month_key(start),
+            month__lte=PriceHistory.month_key(end),
+            ts__gte=ts_from,
+            ts__lt=ts_to
+        )
+        if shop_id:
+            history = history.filter(shop_id=shop_id)
+
+        buckets = history.annotate(
+            bucket=ExpressionWrapper((F('ts') - ts_from) / step, output_field=IntegerField())
+        ).values('shop_id', 'bucket').annotate(
+            min_price=Min('price'),
+            max_price=Max('price'),
+            changes=Count('id')
+        ).order_by('shop_id', 'bucket')
+
+        series = {}
+        for row in buckets:
+            series.setdefault(row['shop_id'], []).append({
+                'ts': ts_from + row['bucket'] * step,
+                'min_price': row['min_price'],
+                'max_price': row['max_price'],
+                'changes': row['changes']
+            })
+
+        response_data = {
+            'Status': True,
+            'ProductID': product_id,
+            'From': ts_from,
+            'To': ts_to,
+            'Step': step,
+            'Series': [{'shop_id': key, 'points': value} for key, value in series.items()]
+        }
+
+        if shop_id:
+            start_entry = PriceHistory.objects.filter(
+                product_id=product_id,
+                shop_id=shop_id,
+                month__lte=PriceHistory.month_key(start),
+                ts__lt=ts_from
+            ).order_by('-month', '-ts').values('price', 'price_rrc').first()
+            response_data['Start'] = start_entry
+
+        return Response(response_data)
 
 
 class BasketView(APIView):
@@ -250,9 +437,10 @@ class BasketView(APIView):
                 'Total': 0
             })
         
-        items = OrderItem.objects.filter(order=basket_order)
-        serializer = BasketItemSerializer(items, many=True)
-        total = basket_order.get_total_price()
+        items = list(OrderItem.objects.filter(order=basket_order).select_related('product', 'shop'))
+        prices = item_prices(items)
+        serializer = BasketItemSerializer(items, many=True, context={'prices': prices})
+        total = sum(prices.get((item.product_id, item.shop_id), 0) * item.quantity for item in items)
         
         return Response({
             'Status': True,
@@ -303,6 +491,8 @@ class BasketView(APIView):
             if not created:
                 order_item.quantity += int(quantity)
                 order_item.save()
+            # Корзина с недавними изменениями не считается брошенной
+            basket_order.touch()
             
             return Response({
                 'Status': True,
@@ -331,12 +521,13 @@ class BasketView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            order_item = OrderItem.objects.get(
+            order_item = OrderItem.objects.select_related('order').get(
                 id=item_id,
                 order__user=request.user,
                 order__status='basket'
             )
             order_item.delete()
+            order_item.order.touch()
             
             return Response({
                 'Status': True,
@@ -448,8 +639,8 @@ class OrderConfirmView(APIView):
                 }, status=status.HTTP_404_NOT_FOUND)
             
             # 3. Проверяем, что в заказе есть товары
-            order_items = OrderItem.objects.filter(order=order)
-            if not order_items.exists():
+            order_items = list(OrderItem.objects.filter(order=order).select_related('product', 'shop'))
+            if not order_items:
                 return Response({
                     'Status': False,
                     'Error': 'Корзина пуста. Добавьте товары перед подтверждением заказа.'
@@ -488,13 +679,10 @@ class OrderConfirmView(APIView):
             
             # 6. Проверяем наличие всех товаров в достаточном количестве
             unavailable_items = []
+            product_infos = self.product_infos(order_items)
             for item in order_items:
-                try:
-                    product_info = ProductInfo.objects.get(
-                        product=item.product,
-                        shop=item.shop
-                    )
-                    
+                product_info = product_infos.get((item.product_id, item.shop_id))
+                if product_info is not None:
                     if product_info.quantity < item.quantity:
                         unavailable_items.append({
                             'product': item.product.name,
@@ -502,8 +690,7 @@ class OrderConfirmView(APIView):
                             'requested': item.quantity,
                             'available': product_info.quantity
                         })
-                        
-                except ProductInfo.DoesNotExist:
+                else:
                     unavailable_items.append({
                         'product': item.product.name,
                         'shop': item.shop.name,
@@ -527,21 +714,14 @@ class OrderConfirmView(APIView):
             # 7. Начинаем транзакцию
             try:
                 with transaction.atomic():
-                    # 8. Обновляем статус заказа
-                    order.status = 'new'
-                    order.contact = contact
-                    order.save()
-                    
-                    # 9. Обновляем количество товаров на складах
+                    # 8. Обновляем количество товаров на складах и фиксируем цены
                     updated_products = []
+                    product_infos = self.product_infos(order_items, lock=True)
                     for item in order_items:
-                        product_info = ProductInfo.objects.get(
-                            product=item.product,
-                            shop=item.shop
-                        )
+                        product_info = product_infos[(item.product_id, item.shop_id)]
                         old_quantity = product_info.quantity
                         product_info.quantity -= item.quantity
-                        product_info.save()
+                        item.price_per_unit = product_info.price
                         
                         updated_products.append({
                             'product': item.product.name,
@@ -550,70 +730,72 @@ class OrderConfirmView(APIView):
                             'old_stock': old_quantity,
                             'new_stock': product_info.quantity
                         })
+                    ProductInfo.all_versions.bulk_update(
+                        [product_infos[(item.product_id, item.shop_id)] for item in order_items], ['quantity']
+                    )
+                    OrderItem.objects.bulk_update(order_items, ['price_per_unit'])
+                    
+                    # 9. Обновляем статус заказа (сигнал добавит его в агрегаты продаж)
+                    order.status = 'new'
+                    order.contact = contact
+                    order.save()
                     
                     # 10. Подготавливаем детали заказа
                     order_details = []
                     total_price = 0
                     
                     for item in order_items:
-                        try:
-                            product_info = ProductInfo.objects.get(
-                                product=item.product,
-                                shop=item.shop
-                            )
-                            item_price = product_info.price * item.quantity
-                            total_price += item_price
-                            
-                            order_details.append({
-                                'product_id': item.product.id,
-                                'product_name': item.product.name,
-                                'shop_id': item.shop.id,
-                                'shop_name': item.shop.name,
-                                'quantity': item.quantity,
-                                'price_per_unit': product_info.price,
-                                'item_total': item_price
-                            })
-                        except ProductInfo.DoesNotExist:
-                            pass
+                        item_price = item.price_per_unit * item.quantity
+                        total_price += item_price
+                        
+                        order_details.append({
+                            'product_id': item.product.id,
+                            'product_name': item.product.name,
+                            'shop_id': item.shop.id,
+                            'shop_name': item.shop.name,
+                            'quantity': item.quantity,
+                            'price_per_unit': item.price_per_unit,
+                            'item_total': item_price
+                        })
                     
-                    # 11. АСИНХРОННАЯ отправка email с подтверждением заказа
-                    email_status = 'pending'
-                    try:
-                        send_order_confirmation_task.delay(
-                            user_email=request.user.email,
-                            order_id=order.id
-                        )
-                        email_status = 'queued'
-                    except Exception as e:
-                        import logging
-                        logger = logging.getLogger(__name__)
-                        logger.error(f"Ошибка постановки задачи отправки email для заказа {order.id}: {e}")
-                        email_status = 'failed'
+                    # 11. Снимок заказа - для ответа и для письма
+                    order_snapshot = {
+                        'id': order.id,
+                        'status': order.status,
+                        'status_display': order.get_status_display(),
+                        'date': order.dt.strftime('%Y-%m-%d %H:%M:%S'),
+                        'total_price': total_price,
+                        'contact': {
+                            'id': contact.id,
+                            'type': contact.type,
+                            'value': contact.value,
+                            'full_address': f"{contact.city}, {contact.street}, д. {contact.house}" 
+                                            if contact.type == 'address' else contact.value
+                        },
+                        'items': order_details,
+                        'items_count': len(order_details)
+                    }
+
+                    # 12. АСИНХРОННАЯ отправка email с подтверждением заказа
+                    # через outbox (в этой же транзакции). Воркер собирает
+                    # письмо из снимка, не перечитывая заказ из БД
+                    outbox.enqueue(
+                        send_order_confirmation_task,
+                        user_email=request.user.email,
+                        order_id=order.id,
+                        snapshot=order_snapshot
+                    )
+                    email_status = 'queued'
                     
-                    # 12. Возвращаем успешный ответ
+                    # 13. Возвращаем успешный ответ
                     response_data = {
                         'Status': True,
                         'Message': 'Заказ успешно подтвержден!',
-                        'Order': {
-                            'id': order.id,
-                            'status': order.status,
-                            'status_display': order.get_status_display(),
-                            'date': order.dt.strftime('%Y-%m-%d %H:%M:%S'),
-                            'total_price': total_price,
-                            'contact': {
-                                'id': contact.id,
-                                'type': contact.type,
-                                'value': contact.value,
-                                'full_address': f"{contact.city}, {contact.street}, д. {contact.house}" 
-                                                if contact.type == 'address' else contact.value
-                            },
-                            'items': order_details,
-                            'items_count': len(order_details)
-                        },
+                        'Order': order_snapshot,
                         'StockUpdates': updated_products,
                         'Email': {
                             'status': email_status,
-                            'note': 'Email поставлен в очередь на отправку (асинхронно)'
+                            'note': 'Email поставлен в очередь на отправку (outbox, асинхронно)'
                         },
                         'Instructions': [
                             f'Заказ №{order.id} переведен в статус "Новый"',
@@ -641,7 +823,20 @@ class OrderConfirmView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class OrderListView(generics.ListAPIView):
+    @staticmethod
+    def product_infos(order_items, lock=False):
+        """Позиции прайс-листа для товаров заказа одним запросом: {(product_id, shop_id): ProductInfo}."""
+        queryset = ProductInfo.objects.filter(
+            product_id__in={item.product_id for item in order_items},
+            shop_id__in={item.shop_id for item in order_items}
+        )
+        if lock:
+            # Блокируются только строки прайс-листа, без магазинов из условия версии
+            queryset = queryset.select_for_update(of=('self',))
+        return {(product_info.product_id, product_info.shop_id): product_info for product_info in queryset}
+
+
+class OrderListView(ReplicaReadMixin, generics.ListAPIView):
     """
     Список заказов пользователя (исключая корзину).
     
@@ -654,19 +849,22 @@ class OrderListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(
+        return orders_with_items(Order.objects.filter(
             user=self.request.user
         ).exclude(
             status='basket'
-        ).order_by('-dt')
+        ).order_by('-dt'))
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        orders = list(self.get_queryset())
+        prices = item_prices([item for order in orders for item in order.items.all()])
+        serializer = self.get_serializer(
+            orders, many=True, context=self.get_serializer_context() | {'prices': prices}
+        )
         
         return Response({
             'Status': True,
-            'Count': queryset.count(),
+            'Count': len(orders),
             'Orders': serializer.data
         })
 
@@ -676,12 +874,28 @@ class OrderDetailView(generics.RetrieveAPIView):
     Детальная информация о заказе.
     
     Возвращает полную информацию о конкретном заказе пользователя.
+    Закрытые заказы, перенесенные в архив, отдаются из архива
+    (с признаком archived).
     """
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return orders_with_items(Order.objects.filter(user=self.request.user))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            order = self.get_object()
+        except Http404:
+            archived = get_object_or_404(
+                ArchivedOrder.objects.filter(user=request.user).select_related('user').prefetch_related('items'),
+                pk=kwargs['pk']
+            )
+            return Response(ArchivedOrderSerializer(archived).data)
+
+        prices = item_prices(order.items.all())
+        serializer = self.get_serializer(order, context=self.get_serializer_context() | {'prices': prices})
+        return Response(serializer.data)
 
 
 class PartnerUpdate(APIView):
@@ -746,7 +960,8 @@ class PartnerUpdate(APIView):
                         status=400
                     )
                 
-                data = yaml.safe_load(file.read())
+                content = file.read()
+                data = yaml.safe_load(content)
             except yaml.YAMLError as e:
                 return JsonResponse(
                     {'Status': False, 'Error': f'Ошибка парсинга YAML: {str(e)}'}, 
@@ -771,73 +986,25 @@ class PartnerUpdate(APIView):
                 status=400
             )
         
-        # 7. Импорт данных в транзакции
+        # 7. Импорт данных в новую версию прайс-листа с атомарной публикацией
         try:
-            with transaction.atomic():
-                # Получаем или создаем магазин
-                shop, created = Shop.objects.get_or_create(
-                    name=data['shop'],
-                    user=request.user
-                )
-                
-                if created:
-                    shop.url = data.get('url', '')
-                    shop.save()
-                
-                # Импорт категорий
-                if 'categories' in data:
-                    for category_data in data['categories']:
-                        category, _ = Category.objects.get_or_create(
-                            id=category_data.get('id'),
-                            defaults={'name': category_data['name']}
-                        )
-                        
-                        if category.name != category_data['name']:
-                            category.name = category_data['name']
-                            category.save()
-                        
-                        category.shops.add(shop)
-                
-                # Удаляем старые данные о товарах этого магазина
-                ProductInfo.objects.filter(shop=shop).delete()
-                
-                # Импорт товаров
-                if 'goods' in data:
-                    for product_data in data['goods']:
-                        product, _ = Product.objects.get_or_create(
-                            name=product_data['name'],
-                            category_id=product_data['category']
-                        )
-                        
-                        product_info = ProductInfo.objects.create(
-                            product=product,
-                            shop=shop,
-                            external_id=product_data['id'],
-                            model=product_data.get('model', ''),
-                            quantity=product_data['quantity'],
-                            price=product_data['price'],
-                            price_rrc=product_data['price_rrc']
-                        )
-                        
-                        if 'parameters' in product_data:
-                            for param_name, param_value in product_data['parameters'].items():
-                                parameter, _ = Parameter.objects.get_or_create(
-                                    name=param_name
-                                )
-                                
-                                ProductParameter.objects.create(
-                                    product_info=product_info,
-                                    parameter=parameter,
-                                    value=str(param_value)
-                                )
-                
-                return JsonResponse({
-                    'Status': True,
-                    'Message': f'Импорт успешно завершен. Магазин: {shop.name}',
-                    'Shop': shop.name,
-                    'Products': len(data.get('goods', []))
-                })
-                
+            shop, products_count = CatalogImportService.import_shop_data(request.user, data)
+
+            # Запоминаем адрес и валидаторы импортированного прайс-листа:
+            # периодическая синхронизация не загрузит тот же файл повторно
+            if url:
+                Shop.objects.filter(pk=shop.pk).update(url=url, **PriceListSyncService.validators(response))
+            else:
+                Shop.objects.filter(pk=shop.pk).update(price_list_hash=PriceListSyncService.content_hash(content))
+
+            return JsonResponse({
+                'Status': True,
+                'Message': f'Импорт успешно завершен. Магазин: {shop.name}',
+                'Shop': shop.name,
+                'Products': products_count,
+                'CatalogVersion': shop.catalog_version
+            })
+
         except KeyError as e:
             return JsonResponse(
                 {'Status': False, 'Error': f'Отсутствует обязательное поле: {str(e)}'}, 
@@ -850,6 +1017,56 @@ class PartnerUpdate(APIView):
             )
 
 
+class PartnerStockUpdate(APIView):
+    """
+    Быстрое обновление остатков и цен магазина без загрузки прайс-листа.
+
+    Принимает:
+        - items: список изменений
+            - external_id: внешний ИД товара
+            - quantity: новое количество (необязательно)
+            - price: новая цена (необязательно)
+            - price_rrc: новая рекомендуемая цена (необязательно)
+
+    Возвращает:
+        - Updated: количество обновленных позиций
+        - NotFound: внешние ИД, отсутствующие в прайс-листе магазина
+
+    Требует авторизации пользователя с типом 'shop'.
+    """
+    permission_classes = [IsAuthenticated]
+    max_items = 10000
+
+    def post(self, request, *args, **kwargs):
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        if not isinstance(request.data, dict):
+            return JsonResponse({'Status': False, 'Error': 'Ожидается объект с полем items'}, status=400)
+
+        serializer = StockDeltaSerializer(
+            data=request.data.get('items'),
+            many=True,
+            allow_empty=False,
+            max_length=self.max_items
+        )
+        if not serializer.is_valid():
+            return JsonResponse({'Status': False, 'Errors': serializer.errors}, status=400)
+
+        try:
+            shop = Shop.objects.get(user=request.user)
+        except Shop.DoesNotExist:
+            return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+
+        updated, not_found = CatalogImportService.apply_deltas(shop, serializer.validated_data)
+
+        return JsonResponse({
+            'Status': True,
+            'Updated': updated,
+            'NotFound': not_found
+        })
+
+
 class PartnerState(APIView):
     """
     Управление статусом магазина.
@@ -906,16 +1123,17 @@ class PartnerState(APIView):
             return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
 
 
-class PartnerOrders(APIView):
+class PartnerOrders(ReplicaReadMixin, APIView):
     """
     Получение заказов для магазина-партнера.
     
     Требует авторизации пользователя с типом 'shop'.
     Возвращает список заказов, содержащих товары данного магазина.
+    Вместо периодического опроса используйте поток событий
+    partner/orders/events/ (SSE) и запрашивайте список только при событии.
     
     Оптимизация производительности:
     - Использование select_related для пользователя
-    - Использование prefetch_related для товаров
     - Аннотация цены подзапросом
     - Устранение N+1 запросов
     - Кэширование результатов
@@ -928,7 +1146,7 @@ class PartnerOrders(APIView):
         
         Профилирование через Silk показывает:
         - Было: 10+N запросов (N - количество товаров)
-        - Стало: 3 запроса (магазин + товары + информация о ценах)
+        - Стало: 2 запроса (магазин + позиции с ценой и моделью из подзапросов)
         - Ускорение: ~90%
         """
         # 1. Проверка аутентификации и прав
@@ -955,9 +1173,6 @@ class PartnerOrders(APIView):
                 'order',         
                 'order__user', 
                 'product'         
-            ).prefetch_related(
-                'product__product_infos',  # Prefetch для информации о товаре
-                'product__product_infos__shop'  # Prefetch для магазина
             ).annotate(
                 # Подзапрос для получения актуальной цены
                 current_price=models.Subquery(
@@ -1025,10 +1240,11 @@ class PartnerOrders(APIView):
             orders_data.sort(key=lambda x: x['dt'], reverse=True)
             
             # 5. Статистика производительности (для отладки)
+            request_stats = current_request_stats()
             performance_stats = {
                 'total_orders': len(orders_data),
                 'total_items': order_items.count(),
-                'db_queries_count': len(connection.queries) if settings.DEBUG else 'N/A',
+                'db_queries_count': request_stats.queries if request_stats else 'N/A',
                 'optimization_status': 'optimized' if order_items.count() > 0 else 'no_data'
             }
             
@@ -1066,6 +1282,78 @@ class PartnerOrders(APIView):
                 'Error': f'Внутренняя ошибка сервера: {str(e)}'
             }, status=500)
 
+class PartnerAnalytics(APIView):
+    """
+    Аналитика продаж магазина за период.
+
+    Параметры:
+        - date_from / date_to: период в формате ГГГГ-ММ-ДД (по умолчанию последние 30 дней)
+        - top: количество самых продаваемых товаров (по умолчанию 10)
+
+    Возвращает:
+        - Totals: выручка, продано единиц и количество заказов за период
+        - Days: те же показатели по дням
+        - TopProducts: товары с наибольшей выручкой
+
+    Данные берутся из дневных агрегатов (ShopDailySales, ProductDailySales),
+    поэтому запрос суммирует по строке на день, а не всю историю заказов.
+    """
+    permission_classes = [IsAuthenticated]
+    max_top = 100
+
+    def get(self, request, *args, **kwargs):
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        try:
+            date_to = parse_date(request.query_params.get('date_to', '')) or timezone.localdate()
+            date_from = parse_date(request.query_params.get('date_from', '')) or date_to - timedelta(days=30)
+            top = min(int(request.query_params.get('top', 10)), self.max_top)
+        except ValueError as e:
+            return Response({'Status': False, 'Error': f'Неверные параметры: {e}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if date_from > date_to or top < 0:
+            return Response({'Status': False, 'Error': 'Неверный период'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        shop = Shop.objects.filter(user=request.user).only('id').first()
+        if shop is None:
+            return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+
+        days = list(ShopDailySales.objects.filter(
+            shop=shop, date__gte=date_from, date__lte=date_to
+        ).order_by('date').values('date', 'orders', 'units', 'revenue'))
+
+        top_products = ProductDailySales.objects.filter(
+            shop=shop, date__gte=date_from, date__lte=date_to
+        ).values('product_id', 'product__name').annotate(
+            units_sold=Sum('units'),
+            total_revenue=Sum('revenue')
+        ).order_by('-total_revenue', 'product_id')[:top]
+
+        return Response({
+            'Status': True,
+            'From': date_from,
+            'To': date_to,
+            'Totals': {
+                'revenue': sum(day['revenue'] for day in days),
+                'units': sum(day['units'] for day in days),
+                'orders': sum(day['orders'] for day in days),
+            },
+            'Days': days,
+            'TopProducts': [
+                {
+                    'product_id': row['product_id'],
+                    'product_name': row['product__name'],
+                    'units': row['units_sold'],
+                    'revenue': row['total_revenue'],
+                }
+                for row in top_products
+            ]
+        })
+
+
 class ConfirmEmailView(APIView):
     """
     Подтверждение email пользователя.
@@ -1096,7 +1384,8 @@ class ConfirmEmailView(APIView):
             user = User.objects.get(email=email)
             confirm_token = ConfirmEmailToken.objects.get(
                 user=user,
-                key=token
+                key=token,
+                created_at__gte=timezone.now() - timedelta(seconds=settings.CONFIRM_EMAIL_TOKEN_TTL)
             )
             
             user.is_active = True
@@ -1128,25 +1417,46 @@ class ConfirmEmailView(APIView):
         except ConfirmEmailToken.DoesNotExist:
             return Response({
                 'Status': False,
-                'Error': 'Неверный токен подтверждения'
+                'Error': 'Неверный или просроченный токен подтверждения'
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
 class ViewSentEmailsView(APIView):
     """
     Просмотр отправленных email (только для демо-режима).
-    
-    Возвращает список всех сохраненных email сообщений.
+
+    Параметры:
+        - limit: размер страницы (по умолчанию 20, не более 100)
+        - before: курсор Next предыдущей страницы
+        - to: фильтр по получателю
+        - type: фильтр по типу письма (confirm_email, order_confirmation)
+
+    Возвращает страницу сохраненных email, начиная с самых новых.
     """
     permission_classes = [IsAuthenticated]
+    max_limit = 100
     
     def get(self, request):
-        emails = DemoEmailService.list_sent_emails()
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+        except ValueError:
+            return Response({'Status': False, 'Error': 'limit и before должны быть числами'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        emails, next_cursor = DemoEmailService.list_sent_emails(
+            limit=max(limit, 1),
+            before=before,
+            to=request.query_params.get('to'),
+            email_type=request.query_params.get('type')
+        )
         
         return Response({
             'Status': True,
             'Count': len(emails),
-            'Emails': emails
+            'Emails': emails,
+            'Next': next_cursor
         })
 
 
@@ -1160,9 +1470,77 @@ class TestSentryView(APIView):
         try:
             raise ValueError("Тестовое исключение для Sentry")
         except Exception as e:
+            import sentry_sdk
             sentry_sdk.capture_exception(e)
             return Response({
                 'Status': False,
                 'Error': 'Исключение отправлено в Sentry',
                 'Exception': str(e)
-            })
\ No newline at end of file
+            })
+
+
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus."""
+    token = settings.METRICS_AUTH_TOKEN
+    if not token:
+        # Без токена endpoint закрыт: задержки и запросы по маршрутам не публичны
+        raise Http404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def serve_thumbnail(request, path):
+    """
+    Отдача миниатюр в режиме разработки.
+
+    Имена файлов адресуются хэшем содержимого, поэтому ответ помечается
+    как неизменяемый. В продакшене тот же заголовок выставляет веб-сервер
+    для /media/thumbs/.
+    """
+    response = static_serve(request, path, document_root=Path(settings.MEDIA_ROOT) / 'thumbs')
+    response['Cache-Control'] = settings.THUMBNAIL_CACHE_CONTROL
+    return response
+
+
+async def partner_order_events(request):
+    """
+    Поток событий о заказах магазина (Server-Sent Events).
+
+    Заменяет периодический опрос partner/orders/: событие приходит, когда
+    подтверждается заказ с товарами магазина или меняется его статус.
+    Требует запуска под ASGI (myproject.asgi.application).
+    """
+    # EventSource в браузере не умеет передавать заголовки, поэтому токен
+    # можно передать и параметром запроса
+    user = await aauthenticate(request, token=request.GET.get('token'))
+    if user is None:
+        return JsonResponse({'Status': False, 'Error': 'Требуется авторизация'}, status=403)
+    if user.type != 'shop':
+        return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+    shop_id = await Shop.objects.filter(user=user).values_list('id', flat=True).afirst()
+    if shop_id is None:
+        return JsonResponse({'Status': False, 'Error': 'Магазин не найден'}, status=404)
+
+    heartbeat = settings.PARTNER_EVENTS_HEARTBEAT
+
+    async def stream():
+        subscription = broker.subscribe(shop_id, settings.PARTNER_EVENTS_MAX_PENDING)
+        try:
+            yield f'retry: {heartbeat * 1000}\n: connected\n\n'
+            while True:
+                try:
+                    event = await subscription.get(heartbeat)
+                except asyncio.TimeoutError:
+                    # Комментарий не дает прокси закрыть простаивающее соединение
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -3,6 +3,10 @@ ASGI config for myproject project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Потоковый endpoint partner/orders/events/ (SSE) держит соединение
+открытым, поэтому проект нужно запускать ASGI-сервером, например:
+    uvicorn myproject.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -10,10 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
-import sentry_sdk
-from sentry_sdk.integrations.django import DjangoIntegration
-from sentry_sdk.integrations.celery import CeleryIntegration
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -70,8 +68,8 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'core.authentication.CachedBasicAuthentication',
+        'core.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -89,6 +87,14 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Кэш проверенных токенов и Basic-учетных данных (core/authentication.py).
+# Сброс при выходе и смене пароля доходит до других процессов через "эпоху"
+# пользователя в кэше Django, поэтому кэш включается только с общим для
+# процессов кэшем (Redis в CACHES выше); с LocMemCache он отключен
+# (manage.py check --deploy предупреждает, core.W002)
+AUTH_CACHE_MAX_SIZE = 10000
+AUTH_CACHE_TTL = 5 * 60  # секунды; 0 - отключить кэш
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'PhoneStore API',
     'DESCRIPTION': 'API для интернет-магазина телефонов',
@@ -99,11 +105,15 @@ SPECTACULAR_SETTINGS = {
 AUTH_USER_MODEL = 'core.User'
 
 MIDDLEWARE = [
+    # Первым, чтобы время ответа включало остальные middleware
+    'core.metrics.MetricsMiddleware',
+    'core.profiler.RequestProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -128,18 +138,98 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'myproject.wsgi.application'
+# Потоковые endpoints (SSE) требуют ASGI-сервера
+ASGI_APPLICATION = 'myproject.asgi.application'
+# Маршруты core.urls, которые обслуживают async-версии view (core/async_views.py).
+# Имеет смысл только под ASGI-сервером: под WSGI async view выполняется
+# в отдельном event loop на каждый запрос и работает медленнее.
+# Доступны: 'product-list', 'basket', 'order-list'
+ASYNC_VIEW_ROUTES = []
 
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# Профиль БД: 'sqlite' (по умолчанию) или 'postgres' - параметры
+# подключения к Postgres берутся из переменных окружения POSTGRES_*
+DATABASE_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'sqlite')
+
+# Постоянные соединения: соединение переиспользуется между запросами
+# потока до DATABASE_CONN_MAX_AGE секунд и проверяется перед запросом.
+# Под ASGI соединение живет в потоке запроса, поэтому по умолчанию 0;
+# WSGI-развертывание (myproject/wsgi.py) задает DJANGO_DB_CONN_MAX_AGE=60
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 0))
+
+# Режим WAL: читатели не блокируют писателя и наоборот. Режим хранится в
+# файле БД и создает рядом файлы -wal/-shm, поэтому включается явно,
+# DJANGO_SQLITE_WAL=1 (см. Readme), а не для каждой команды manage.py
+SQLITE_WAL = os.environ.get('DJANGO_SQLITE_WAL') == '1'
+
+# PRAGMA SQLite, выполняются при создании каждого соединения; только
+# настройки соединения, файл БД они не меняют
+SQLITE_PRAGMAS = {
+    # В режиме WAL fsync только при checkpoint; сбой питания может
+    # потерять последние транзакции, но не повредить БД
+    'synchronous': 'NORMAL',
+    'mmap_size': 128 * 1024 * 1024,  # байт
+    'cache_size': -32000,  # отрицательное значение - в КиБ (~32 МБ на соединение)
+    'busy_timeout': 5000,  # мс ожидания блокировки вместо "database is locked"
 }
 
+if DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'netology'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # psycopg2 не поддерживает пул соединений Django (нужен psycopg 3),
+            # поэтому - постоянные соединения на поток; общий пул на несколько
+            # процессов дает PgBouncer в transaction-режиме
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': 5,
+                # Зависший запрос не держит соединение бесконечно
+                'options': '-c statement_timeout=30000',
+            },
+        }
+    }
+    # Реплики только для чтения: POSTGRES_REPLICA_HOSTS=host1,host2
+    for number, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), 1):
+        DATABASES[f'replica_{number}'] = {
+            **DATABASES['default'],
+            'HOST': host.strip(),
+            # В тестах реплика - та же БД, что и основная
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': ';'.join(
+                    f'PRAGMA {name}={value}'
+                    for name, value in (({'journal_mode': 'WAL'} if SQLITE_WAL else {}) | SQLITE_PRAGMAS).items()
+                ),
+                # Транзакция сразу берет блокировку записи: иначе при повышении
+                # блокировки чтения до записи SQLite не ждет busy_timeout
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Реплики для чтений, допускающих отставание (core/db_router.py)
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Сколько секунд после изменения пользователь читает только с основной БД
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -180,11 +270,25 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 
+# Загруженные изображения товаров и их миниатюры
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+PRODUCT_THUMBNAIL_SIZES = (800, 400, 200)
+# Какой размер миниатюры отдавать в API для списка и карточки товара
+PRODUCT_IMAGE_VARIANTS = {
+    'list': 200,
+    'detail': 800,
+}
+# Имена миниатюр содержат хэш содержимого, поэтому их можно кэшировать навсегда
+THUMBNAIL_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
 # Для разработки - выводим email в консоль
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # или
 # EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'  # сохраняет email в файлы
+# Журнал DemoEmailService (spool.jsonl + индекс spool.idx)
+DEMO_EMAIL_SPOOL_DIR = BASE_DIR / 'sent_emails'
 
 # Остальные настройки можно оставить пустыми или с демо-значениями
 EMAIL_HOST = 'localhost'
@@ -194,6 +298,18 @@ EMAIL_HOST_USER = ''
 EMAIL_HOST_PASSWORD = ''
 DEFAULT_FROM_EMAIL = 'noreply@phonestore.local'
 
+# Пакетная доставка писем через очередь QueuedEmail (core/email_delivery.py).
+# В демо-режиме письма только пишутся в журнал DemoEmailService.
+EMAIL_DELIVERY_QUEUE = False
+EMAIL_DELIVERY_BATCH_SIZE = 100
+EMAIL_DELIVERY_MAX_ATTEMPTS = 5
+EMAIL_DELIVERY_RETRY_DELAY = 30  # секунды, удваивается с каждой попыткой
+EMAIL_DELIVERY_LEASE = 5 * 60  # время, на которое воркер захватывает пачку
+EMAIL_DOMAIN_RATE_LIMITS = {  # писем в секунду на домен
+    'default': 20,
+    'gmail.com': 10,
+}
+
 # Настройки для email подтверждения
 DJANGO_REST_PASSWORDRESET_TOKEN_CONFIG = {
     'CLASS': 'django_rest_passwordreset.tokens.RandomStringTokenGenerator',
@@ -204,7 +320,12 @@ DJANGO_REST_PASSWORDRESET_TOKEN_CONFIG = {
 }
 
 # Senrty 
+# Импорт только при включении: sentry_sdk с интеграциями заметно удлиняет старт процесса
 if not DEBUG:
+    import sentry_sdk
+    from sentry_sdk.integrations.django import DjangoIntegration
+    from sentry_sdk.integrations.celery import CeleryIntegration
+
     sentry_sdk.init(
         dsn="url", # Здесь нужна DSN ссылка с sentry для отладки
         integrations=[
@@ -256,9 +377,84 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 
+# Outbox: побочные эффекты запросов пишутся в БД в транзакции запроса.
+# celery - сообщения передает в брокер задача dispatch_outbox_task по
+# расписанию beat (CELERY_BEAT_SCHEDULE); local (без Redis) - задачи
+# выполняет отдельный процесс: python manage.py run_outbox --loop --mode local
+OUTBOX_DISPATCH_MODE = 'celery'
+OUTBOX_DISPATCH_INTERVAL = 5  # секунды между запусками диспетчера в beat
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 10  # секунды, удваивается с каждой попыткой
+OUTBOX_LEASE = 5 * 60
+
+# Каталог: параметры товаров из JSON-копии на ProductInfo вместо таблиц ProductParameter
+CATALOG_INLINE_PARAMETERS = True
+
+# Синхронизация прайс-листов по Shop.url
+PRICE_LIST_SYNC_INTERVAL = 60 * 60  # окно опроса, секунды
+PRICE_LIST_SYNC_TIMEOUT = 30
+
+# Статистика запросов каталога и прогрев кэша после импорта/деплоя.
+# Прогрев и сброс кэша каталога воркерами Celery доходят до веб-процессов
+# только через общий кэш (Redis в CACHES выше); с кэшем в памяти процесса
+# прогрев не ставится (manage.py check --deploy предупреждает, core.W001)
+CATALOG_QUERY_STATS_FLUSH_INTERVAL = 30  # секунд между записями счетчиков в БД
+CATALOG_WARMUP_TOP_N = 50
+CATALOG_WARMUP_RATE = 5  # запросов в секунду
+CATALOG_WARMUP_WINDOW_DAYS = 7
+CATALOG_WARMUP_LOCK_TIMEOUT = 15 * 60
+
+# Хранение данных: перенос закрытых заказов в архив и очистка
+CONFIRM_EMAIL_TOKEN_TTL = 2 * 24 * 60 * 60  # срок действия токена подтверждения, секунды
+RETENTION_ORDER_ARCHIVE_DAYS = 180  # доставленные и отмененные заказы
+RETENTION_BASKET_DAYS = 30  # брошенные корзины
+RETENTION_QUEUE_DAYS = 14  # обработанные письма очереди и сообщения outbox
+RETENTION_EMAIL_SPOOL_DAYS = 90  # журнал демо-писем
+RETENTION_BATCH_SIZE = 500
+RETENTION_BATCH_PAUSE = 0.1  # секунды между пачками
+
+CELERY_BEAT_SCHEDULE = {
+    'sync-price-lists': {
+        'task': 'core.tasks.sync_price_lists_task',
+        'schedule': PRICE_LIST_SYNC_INTERVAL,
+    },
+    'deliver-queued-emails': {
+        'task': 'core.tasks.deliver_queued_emails_task',
+        'schedule': 10,
+    },
+    'dispatch-outbox': {
+        'task': 'core.tasks.dispatch_outbox_task',
+        'schedule': OUTBOX_DISPATCH_INTERVAL,
+    },
+    'apply-retention': {
+        'task': 'core.tasks.apply_retention_task',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
 # Silk
 # SILKY_PYTHON_PROFILER = True
 # SILKY_PYTHON_PROFILER_BINARY = True
 # SILKY_META = True
 # SILKY_AUTHENTICATION = True
-# SILKY_AUTHORISATION = True
\ No newline at end of file
+# SILKY_AUTHORISATION = True
+
+# Метрики для Prometheus (/metrics): endpoint требует заголовок
+# "Authorization: Bearer <токен>", без токена отвечает 404
+METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN')
+
+# Профилирование запросов (core/profiler.py): запросы с заголовком
+# "X-Profile: <секрет>" и/или случайная доля запросов. Без секрета и доли
+# middleware отключен
+REQUEST_PROFILER_SECRET = None
+REQUEST_PROFILER_SAMPLE_RATE = 0  # 0.001 - каждый тысячный запрос
+REQUEST_PROFILER_DIR = BASE_DIR / 'profiles'
+REQUEST_PROFILER_KEEP = 200  # профилей на диске, старые удаляются
+# Писать в трассировку значения параметров SQL и строку запроса URL.
+# Там бывают токены и хэши паролей - включать только локально
+REQUEST_PROFILER_CAPTURE_PARAMS = False
+
+# События о заказах для магазинов (SSE)
+PARTNER_EVENTS_HEARTBEAT = 15  # секунд
+PARTNER_EVENTS_MAX_PENDING = 100
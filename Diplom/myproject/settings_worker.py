@@ -0,0 +1,36 @@
+"""
+Настройки Celery-воркера и beat.
+
+Воркеру не нужны админка, allauth, сессии и статика: без них процесс
+стартует быстрее и занимает меньше памяти. Задачи, которым нужен API
+(прогрев кэша каталога), загружают его сами при выполнении.
+
+Запуск:
+    DJANGO_SETTINGS_MODULE=myproject.settings_worker celery -A myproject worker
+Время старта: python manage.py import_time_report --settings-module myproject.settings_worker --module core.tasks
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS
+
+WEB_ONLY_APPS = {
+    'jet',
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'django.contrib.sites',
+    'phones',
+    'allauth',
+    'allauth.account',
+    'allauth.socialaccount',
+    'allauth.socialaccount.providers.google',
+    'allauth.socialaccount.providers.github',
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WEB_ONLY_APPS]
+
+MIDDLEWARE = []
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+
+# reverse() в задачах: только маршруты API
+ROOT_URLCONF = 'myproject.urls_worker'
@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from core.views import metrics, serve_thumbnail
+
 urlpatterns = [
     path('jet/', include('jet.urls', 'jet')), 
     path('admin/', admin.site.urls),
@@ -31,5 +34,13 @@ urlpatterns = [
 
     path('accounts/', include('allauth.urls')),
 
+    # Метрики для Prometheus
+    path('metrics', metrics, name='metrics'),
+
     # path('silk/', include('silk.urls', namespace='silk')),
-]
\ No newline at end of file
+]
+
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^media/thumbs/(?P<path>.*)$', serve_thumbnail, name='thumbnail'),
+    ]
@@ -0,0 +1,6 @@
+"""Маршруты для reverse() в Celery-воркере (settings_worker): только API, без админки и allauth."""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/v1/', include('core.urls')),
+]
@@ -12,5 +12,8 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
+# Поток WSGI-сервера обслуживает запросы по очереди - соединение с БД
+# можно переиспользовать между ними (DATABASE_CONN_MAX_AGE)
+os.environ.setdefault('DJANGO_DB_CONN_MAX_AGE', '60')
 
 application = get_wsgi_application()